@@ -0,0 +1,106 @@
+"""Benchmark du moteur KPI colonnaire face à l'ancienne version pandas.
+
+Usage : python benchmark_kpis.py [n_lignes ...]
+Par défaut : 100k, 1M et 10M lignes. Mesure le temps et le pic mémoire
+(tracemalloc, allocations NumPy/pandas comprises).
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from reassurance_engine import compute_kpis
+
+
+def compute_kpis_legacy(d: pd.DataFrame) -> pd.DataFrame:
+    """Ancienne version de reassurance.compute_kpis (référence)."""
+    df = d.copy()
+    ep = df["earned_premium"].replace(0, np.nan)
+    gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
+    ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
+
+    df["loss_ratio"] = df["incurred_claims"] / ep
+    df["acq_ratio"] = df.get("acq_expense", 0) / ep
+    df["adm_ratio"] = df.get("adm_expense", 0) / ep
+    df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
+    df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
+    df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
+    df["cession_ratio"] = ced / gwp.replace(0, np.nan)
+    df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
+
+    if {"claims_count", "exposure"}.issubset(df.columns):
+        df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
+    if {"incurred_claims", "claims_count"}.issubset(df.columns):
+        df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
+
+    if {"ibnr", "rbns"}.issubset(df.columns):
+        df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
+        df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
+
+    if {"scr", "own_funds"}.issubset(df.columns):
+        df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
+
+    return df
+
+
+def make_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    """Bordereau synthétique de n lignes (colonnes numériques du schéma)."""
+    rng = np.random.default_rng(seed)
+    gwp = rng.normal(5e6, 8e5, n)
+    ep = gwp * rng.uniform(0.75, 0.95, n)
+    ep[::997] = 0.0
+    cnt = rng.poisson(100, n).astype(np.float64)
+    inc = cnt * rng.lognormal(9.2, 0.35, n)
+    scr = ep * rng.uniform(0.28, 0.42, n)
+    return pd.DataFrame({
+        "gross_premium": gwp, "ceded_premium": gwp * rng.uniform(0.15, 0.45, n),
+        "earned_premium": ep, "incurred_claims": inc,
+        "paid_claims": inc * rng.uniform(0.6, 0.9, n),
+        "ibnr": inc * 0.1, "rbns": inc * 0.08,
+        "acq_expense": ep * 0.11, "adm_expense": ep * 0.07,
+        "investment_income": gwp * 0.02, "claims_count": cnt,
+        "exposure": rng.integers(900, 1600, n).astype(np.float64),
+        "scr": scr, "own_funds": scr * rng.uniform(1.25, 1.9, n),
+    })
+
+
+def measure(fn, *args, **kwargs):
+    """Retourne (résultat, secondes, pic mémoire en Mo)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, elapsed, peak / 1e6
+
+
+def run(sizes):
+    print(f"{'lignes':>12} {'variante':<24} {'temps (s)':>10} {'pic (Mo)':>10}")
+    for n in sizes:
+        d = make_frame(n)
+        variants = [
+            ("legacy pandas", compute_kpis_legacy, {}),
+            ("moteur float64", compute_kpis, {}),
+            ("moteur float32", compute_kpis, {"dtype": np.float32}),
+            ("moteur 2 KPI", compute_kpis, {"kpis": ["loss_ratio", "combined_ratio"]}),
+        ]
+        ref = None
+        for label, fn, kwargs in variants:
+            res, elapsed, peak = measure(fn, d, **kwargs)
+            print(f"{n:>12,} {label:<24} {elapsed:>10.3f} {peak:>10.1f}")
+            if ref is None:
+                ref = res
+            elif "dtype" not in kwargs:
+                cols = list(res.columns.intersection(ref.columns).difference(d.columns))
+                np.testing.assert_allclose(res[cols].to_numpy(), ref[cols].to_numpy(),
+                                           rtol=1e-12, equal_nan=True)
+            del res
+        del d, ref
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+    run(sizes)
@@ -6,8 +6,7 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import math
 import io
-import base64
-from statsmodels.tsa.statespace.sarimax import SARIMAX
+import reassurance_engine as engine
 
 
 
@@ -1099,162 +1098,383 @@ st.markdown("""
 # FONCTIONS DATA SCIENCE
 # =============================================================================
 
-# Schéma de mapping des colonnes
-SCHEMA = {
-    "date": ["date", "period", "periode", "month", "quarter", "year"],
-    "lob": ["lob", "branche", "line_of_business"],
-    "region": ["region", "zone", "pays", "geography"],
-    "cedant": ["cedant", "cedente", "ceding_company"],
-    "gross_premium": ["gross_premium", "primes_brutes", "gwp"],
-    "ceded_premium": ["ceded_premium", "primes_cedees", "ceded"],
-    "earned_premium": ["earned_premium", "primes_acquises", "ep"],
-    "incurred_claims": ["incurred_claims", "sinistres_encourus", "icl"],
-    "paid_claims": ["paid_claims", "sinistres_payes", "pcl"],
-    "ibnr": ["ibnr", "reserves_ibnr"],
-    "rbns": ["rbns", "reserves_rbns"],
-    "acq_expense": ["acq_expense", "frais_acquisition"],
-    "adm_expense": ["adm_expense", "frais_admin", "g&a"],
-    "investment_income": ["investment_income", "produits_financiers"],
-    "claims_count": ["claims_count", "nombre_sinistres"],
-    "exposure": ["exposure", "exposition", "policies", "risks"],
-    "scr": ["scr", "exigence_capital"],
-    "own_funds": ["own_funds", "fonds_propres"],
-}
+# Schéma de mapping des colonnes (partagé avec le moteur)
+SCHEMA = engine.COLUMN_SCHEMA
 REQUIRED_BASE = ["date", "earned_premium", "incurred_claims"]
 
-def _infer_date_col(s: pd.Series) -> pd.Series:
-    """Tente de parser une colonne date."""
-    try:
-        parsed = pd.to_datetime(s, errors="coerce", dayfirst=True)
-        if parsed.notna().mean() > 0.6:
-            return parsed
-    except Exception:
-        pass
-    if s.dtype.kind in "if":
-        return pd.to_datetime(s.astype(int).astype(str) + "-01-01", errors="coerce")
-    return pd.to_datetime(s, errors="coerce")
-
-def make_demo_data(periods=16, seed=42, freq="Q"):
-    """Jeu de données de démonstration."""
-    rng = np.random.default_rng(seed)
-    idx = pd.period_range("2022Q1", periods=periods, freq=freq).to_timestamp()
-    lobs = ["Property Cat", "Casualty", "Vie", "Santé"]
-    regions = ["EU", "NA", "Asia"]
-    rows = []
-    for dt in idx:
-        for lob in lobs:
-            for region in regions[:2]:  # Réduire la combinatoire
-                gwp = rng.normal(50, 8) * 100000  # Échelle plus réaliste
-                ced = gwp * rng.uniform(0.15, 0.45)
-                ep = gwp * rng.uniform(0.75, 0.95)
-                cnt = rng.poisson(110 if lob == "Property Cat" else 85)
-                expo = rng.integers(900, 1600)
-                sev = rng.lognormal(mean=9.35 if lob == "Property Cat" else 9.1, sigma=0.35)
-                inc = float(cnt) * float(sev)
-                paid = inc * rng.uniform(0.6, 0.9)
-                ibnr = inc * rng.uniform(0.06, 0.18)
-                rbns = inc * rng.uniform(0.05, 0.15)
-                acq = ep * rng.uniform(0.08, 0.14)
-                adm = ep * rng.uniform(0.05, 0.09)
-                inv = gwp * rng.uniform(0.01, 0.03)
-                scr = ep * rng.uniform(0.28, 0.42)
-                own = scr * rng.uniform(1.25, 1.9)
-                rows.append([
-                    dt, "CedantA", lob, region, gwp, ced, ep, inc, paid, ibnr, rbns,
-                    acq, adm, cnt, expo, scr, own, inv
-                ])
-    return pd.DataFrame(rows, columns=[
-        "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
-        "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
-        "claims_count", "exposure", "scr", "own_funds", "investment_income"
-    ])
+def _infer_date_col(s: pd.Series, column=None, month_start=False) -> pd.Series:
+    """Parse une colonne date avec le format détecté sur un échantillon (mémorisé par colonne)."""
+    return engine.parse_dates(s, column=column, month_start=month_start)
+
+def make_demo_data(periods=16, seed=42, freq="Q", n_cedants=1, n_lobs=4, n_regions=2):
+    """Jeu de données de démonstration (générateur vectorisé, reproductible par seed)."""
+    return engine.make_demo_data(periods=periods, seed=seed, freq=freq,
+                                 n_cedants=n_cedants, n_lobs=n_lobs, n_regions=n_regions)
+
+@st.cache_resource(max_entries=2, show_spinner="Génération du portefeuille de démonstration...")
+def cached_demo_data(periods, freq, n_cedants, n_lobs, n_regions):
+    """Portefeuille démo partagé entre reruns et sessions (non modifié en place)."""
+    return make_demo_data(periods=periods, freq=freq, n_cedants=n_cedants,
+                          n_lobs=n_lobs, n_regions=n_regions)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_column_match(columns: tuple):
+    """Correspondance approchée en-tête -> schéma, calculée une fois par en-tête."""
+    return engine.match_columns(list(columns), SCHEMA)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_reserving_match(columns: tuple):
+    """Colonnes survenance / date / montant d'un fichier de sinistres (schéma du provisionnement)."""
+    return engine.match_columns(list(columns), engine.RESERVING_SCHEMA)
 
 def auto_map_columns(df: pd.DataFrame):
-    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma."""
-    mapping = {}
-    cols_lower = {c.lower(): c for c in df.columns}
-    for key, aliases in SCHEMA.items():
-        found = None
-        for a in aliases:
-            if a in cols_lower:
-                found = cols_lower[a]
-                break
-        mapping[key] = found
-    return mapping
-
-def compute_kpis(d: pd.DataFrame) -> pd.DataFrame:
-    """Calcule les ratios KPI techniques/financiers/risque."""
-    df = d.copy()
-    ep = df["earned_premium"].replace(0, np.nan)
-    gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
-    ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
-
-    df["loss_ratio"] = df["incurred_claims"] / ep
-    df["acq_ratio"] = df.get("acq_expense", 0) / ep
-    df["adm_ratio"] = df.get("adm_expense", 0) / ep
-    df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
-    df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
-    df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
-    df["cession_ratio"] = ced / gwp.replace(0, np.nan)
-    df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
-
-    if {"claims_count", "exposure"}.issubset(df.columns):
-        df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
-    if {"incurred_claims", "claims_count"}.issubset(df.columns):
-        df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
-
-    if {"ibnr", "rbns"}.issubset(df.columns):
-        df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
-        df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
-
-    if {"scr", "own_funds"}.issubset(df.columns):
-        df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
+    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma.
+
+    Un mapping déjà validé pour le même en-tête est repris tel quel ; sinon
+    correspondance approchée (noms normalisés, trigrammes, affectation unique).
+    """
+    columns = tuple(map(str, df.columns))
+    remembered = engine.remembered_mapping(columns)
+    if remembered is not None:
+        return {key: remembered.get(key) for key in SCHEMA}
+    mapping, _ = cached_column_match(columns)
+    return dict(mapping)
+
+def compute_kpis(d: pd.DataFrame, kpis=None, dtype=np.float64) -> pd.DataFrame:
+    """Calcule les ratios KPI techniques/financiers/risque (moteur NumPy sans copie)."""
+    return engine.compute_kpis(d, kpis=kpis, dtype=dtype)
+
+def read_upload(uploaded_file, nrows=None, usecols=None) -> pd.DataFrame:
+    """Lit un fichier CSV/Excel importé (éventuellement limité à quelques colonnes)."""
+    uploaded_file.seek(0)
+    if uploaded_file.name.endswith('.csv'):
+        return pd.read_csv(uploaded_file, nrows=nrows, usecols=usecols)
+    return pd.read_excel(uploaded_file, nrows=nrows, usecols=usecols)
+
+def uploaded_file_digest(uploaded_file) -> str:
+    """Empreinte du contenu importé, calculée une fois par fichier et par session."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = engine.file_digest(uploaded_file)
+    return digests[uploaded_file.file_id]
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def read_upload_header(file_hash, _uploaded_file) -> pd.DataFrame:
+    """En-tête du fichier importé (sans lire les données)."""
+    return read_upload(_uploaded_file, nrows=0)
 
+def prepare_frame(df_raw: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    """Applique le mapping et type les dates."""
+    rename_dict = {v: k for k, v in mapping.items() if v is not None}
+    df = df_raw.rename(columns=rename_dict)
+    # Parsing et alignement sur le début de mois en une seule passe
+    df["date"] = _infer_date_col(df["date"], column=mapping.get("date"), month_start=True)
     return df
 
-def aggregate_kpis(d: pd.DataFrame, by=["date"]) -> pd.DataFrame:
-    """Agrège par dimensions et recalcule les KPI au niveau agrégé."""
-    grp = d.groupby(by, dropna=False).agg({
-        "gross_premium": "sum", "ceded_premium": "sum", "earned_premium": "sum",
-        "incurred_claims": "sum", "paid_claims": "sum", "ibnr": "sum", "rbns": "sum",
-        "acq_expense": "sum", "adm_expense": "sum", "investment_income": "sum",
-        "claims_count": "sum", "exposure": "sum", "scr": "sum", "own_funds": "sum"
-    }).reset_index()
-    grp = compute_kpis(grp)
-    return grp
-
-def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
-    """Prévision SARIMAX avec fallback naïf si historique insuffisant."""
-    ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
-    if ts.shape[0] < max(24, steps):
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
-    try:
-        model = SARIMAX(ts, order=order, seasonal_order=seasonal,
-                        enforce_stationarity=False, enforce_invertibility=False)
-        res = model.fit(disp=False)
-        fc = res.get_forecast(steps=steps).predicted_mean
-        return fc
-    except Exception:
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(ts.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
-
-def add_month_start(df: pd.DataFrame) -> pd.DataFrame:
-    """Aligne les dates sur le début de mois."""
-    out = df.copy()
-    out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.to_period("M").dt.to_timestamp()
-    return out
-
-def download_button(df: pd.DataFrame, filename: str):
-    """Lien de téléchargement CSV."""
-    csv = df.to_csv(index=False).encode("utf-8")
-    b64 = base64.b64encode(csv).decode()
-    st.markdown(
-        f'<a download="{filename}" href="data:file/csv;base64,{b64}">📥 Télécharger {filename}</a>',
-        unsafe_allow_html=True
-    )
+def appended_upload_base(uploaded_file, mapping: dict):
+    """Import antérieur (même mapping) dont ce CSV ne fait qu'ajouter des lignes, ou None."""
+    if not uploaded_file.name.endswith('.csv'):
+        return None
+    return engine.find_appended_base(uploaded_file.getbuffer(), mapping)
+
+def store_credibility_stats(cache_key: str, kpi_cube: pd.DataFrame, base_key=None, dates=None):
+    """Statistiques de crédibilité de l'import, mises à jour depuis l'import de base s'il existe."""
+    group = list(engine.CREDIBILITY_GROUP)
+    if not set(group).issubset(kpi_cube.columns):
+        return
+    prev = engine.load_cached_frame(base_key + "-credibility") if base_key is not None else None
+    if prev is not None and dates is not None:
+        stats = engine.refresh_credibility_stats(prev.set_index(group), kpi_cube, dates)
+    else:
+        stats = engine.credibility_stats(kpi_cube)
+    engine.store_cached_frame(cache_key + "-credibility", stats.reset_index())
+
+def ingest_upload(uploaded_file, mapping: dict, cache_key: str, file_hash: str):
+    """Lignes typées avec KPI et cube de l'import, mis en cache Parquet.
+
+    Si un import antérieur est un préfixe du fichier (clôture mensuelle
+    ajoutant une période), seules les lignes ajoutées sont lues, typées et
+    repliées dans les agrégats existants.
+    """
+    base = appended_upload_base(uploaded_file, mapping)
+    prev_kpi = prev_cube = None
+    if base is not None:
+        prev_kpi = engine.load_cached_frame(base[0])
+        prev_cube = engine.load_cached_frame(base[0] + "-cube")
+    dates = None
+    if prev_kpi is not None and prev_cube is not None:
+        with st.spinner("Intégration des lignes ajoutées..."):
+            delta = compute_kpis(prepare_frame(engine.read_csv_tail(uploaded_file.getbuffer(), base[1]), mapping))
+            df_kpi = pd.concat([prev_kpi, delta], ignore_index=True)
+            kpi_cube, dates = engine.append_to_cube(prev_cube, delta)
+        st.sidebar.success(f"➕ {len(delta):,} lignes ajoutées - {len(dates)} période(s) recalculée(s)")
+    else:
+        with st.spinner("Lecture et typage du fichier..."):
+            df_kpi = compute_kpis(prepare_frame(read_upload(uploaded_file), mapping))
+            kpi_cube = engine.build_kpi_cube(df_kpi)
+    engine.store_cached_frame(cache_key, df_kpi)
+    engine.store_cached_frame(cache_key + "-cube", kpi_cube)
+    store_credibility_stats(cache_key, kpi_cube, base[0] if base is not None else None, dates)
+    engine.record_upload(cache_key, file_hash, uploaded_file.size, mapping)
+    return df_kpi, kpi_cube
+
+def stream_upload_cube(uploaded_file, mapping: dict, chunk_rows: int, cache_key: str, file_hash: str) -> pd.DataFrame:
+    """Ingestion CSV par tranches repliées dans le cube KPI (débit affiché dans la sidebar)."""
+    stats_store = st.session_state.setdefault("ingest_stats", {})
+    cube = engine.load_cached_frame(cache_key + "-cube")
+    if cube is None:
+        progress = st.sidebar.empty()
+        usecols = [c for c in mapping.values() if c is not None]
+        base = appended_upload_base(uploaded_file, mapping)
+        prev_cube = engine.load_cached_frame(base[0] + "-cube") if base is not None else None
+        if prev_cube is not None:
+            # Seules les lignes ajoutées sont lues, puis repliées dans le cube existant
+            chunks = engine.read_csv_tail(uploaded_file.getbuffer(), base[1], usecols=usecols, chunksize=chunk_rows)
+        else:
+            uploaded_file.seek(0)
+            chunks = pd.read_csv(uploaded_file, usecols=usecols, chunksize=chunk_rows)
+        cube, stats = engine.stream_kpi_cube(
+            chunks, lambda chunk: prepare_frame(chunk, mapping),
+            on_chunk=lambda rows, sec: progress.caption(f"⏳ {rows:,} lignes · {rows / max(sec, 1e-9):,.0f} lignes/s")
+        )
+        progress.empty()
+        dates = None
+        if prev_cube is not None and cube is not None:
+            cube, dates = engine.append_to_cube(prev_cube, cube)
+            st.sidebar.success(f"➕ {stats['rows']:,} lignes ajoutées - {len(dates)} période(s) recalculée(s)")
+        elif prev_cube is not None:
+            cube, dates = prev_cube, []
+        engine.store_cached_frame(cache_key + "-cube", cube)
+        store_credibility_stats(cache_key, cube, base[0] if prev_cube is not None else None, dates)
+        engine.record_upload(cache_key, file_hash, uploaded_file.size, mapping)
+        stats_store[cache_key] = stats
+    stats = stats_store.get(cache_key)
+    if stats:
+        st.sidebar.metric("Débit d'ingestion", f"{stats['rows_per_s']:,.0f} lignes/s",
+                          help=f"{stats['rows']:,} lignes en {stats['seconds']:.1f} s")
+    else:
+        st.sidebar.caption("⚡ Cube chargé depuis le cache")
+    return cube
+
+@st.cache_resource(max_entries=4, show_spinner="Chargement de l'import depuis le cache...")
+def cached_upload_frames(cache_key: str, file_hash: str, _uploaded_file, mapping: dict):
+    """Lignes KPI et cube de l'import, gardés en mémoire entre reruns (non modifiés en place).
+
+    Le cache Parquet n'est relu (ou l'import ingéré) qu'une fois par clé :
+    un rerun ne coûte plus qu'une recherche dans le cache.
+    """
+    df_kpi = engine.load_cached_frame(cache_key)
+    if df_kpi is None:
+        return ingest_upload(_uploaded_file, mapping, cache_key, file_hash)
+    kpi_cube = engine.load_cached_frame(cache_key + "-cube")
+    if kpi_cube is None:
+        kpi_cube = engine.build_kpi_cube(df_kpi)
+        engine.store_cached_frame(cache_key + "-cube", kpi_cube)
+    return df_kpi, kpi_cube
+
+@st.cache_data(max_entries=2, show_spinner="Calcul des KPI du portefeuille démo...")
+def cached_demo_kpis(dataset_key, _df_raw: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    """KPI ligne à ligne du portefeuille démo, calculés une fois par jeu de paramètres."""
+    return compute_kpis(prepare_frame(_df_raw, mapping))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cached_kpi_cube(dataset_key, _df: pd.DataFrame) -> pd.DataFrame:
+    """Cube des mesures additives, construit une seule fois par jeu de données."""
+    return engine.build_kpi_cube(_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_correlation(dataset_key, by, top_k, cluster, _grouped: pd.DataFrame) -> pd.DataFrame:
+    """Matrice de corrélation réduite, calculée une fois par (jeu de données, regroupement)."""
+    return engine.correlation_matrix(_grouped, top_k=top_k, cluster=cluster)
+
+@st.cache_data(max_entries=32, show_spinner="Simulation Monte Carlo...")
+def cached_aggregate_loss_distribution(lam, mu, sigma, n_years, levels, parallel):
+    """Distribution des pertes agrégées (seuls les résumés et l'histogramme sont mis en cache)."""
+    return engine.aggregate_loss_distribution(lam, mu, sigma, n_years, levels=levels, parallel=parallel)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_credibility_stats(dataset_key, _cube: pd.DataFrame) -> pd.DataFrame:
+    """Statistiques suffisantes de crédibilité par (cédant, ligne), une fois par jeu de données.
+
+    Pour un import, reprend celles écrites à l'ingestion (mises à jour de
+    façon incrémentale quand une période est ajoutée).
+    """
+    if dataset_key[0] == "upload":
+        stats = engine.load_cached_frame(dataset_key[1] + "-credibility")
+        if stats is not None:
+            return stats.set_index(list(engine.CREDIBILITY_GROUP))
+    return engine.credibility_stats(_cube)
+
+@st.cache_resource(max_entries=8, show_spinner="Simulation de la table d'événements...")
+def cached_cat_simulation(tiv, damage_factor, annual_prob, intensity, density, n_years):
+    """Table d'événements, occurrences simulées et courbes OEP/AEP, par jeu de paramètres."""
+    elt = engine.make_event_loss_table(tiv, damage_factor, annual_prob, intensity, density)
+    sim = engine.simulate_elt(elt, n_years)
+    sim["elt"] = elt
+    sim["curves"] = engine.exceedance_curves(sim["annual"], sim["annual_max"])
+    return sim
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def cached_risk_profile() -> pd.DataFrame:
+    """Profil de risques de démonstration (10 000 tranches), partagé entre sessions."""
+    return engine.make_demo_risk_profile()
+
+@st.cache_data(max_entries=16, show_spinner="Projection ORSA en cours...")
+def cached_orsa_projection(**assumptions) -> dict:
+    """Projection ORSA (résumés par année et histogramme final), par jeu d'hypothèses."""
+    return engine.orsa_projection(**assumptions)
+
+@st.cache_resource(max_entries=4, show_spinner="Simulation des sinistres...")
+def cached_individual_losses(lam, mu, sigma, n_years):
+    """Échantillon de sinistres individuels partagé (lecture seule)."""
+    return engine.simulate_individual_losses(lam, mu, sigma, n_years)
+
+@st.cache_resource(max_entries=2, show_spinner="Simulation du portefeuille de sinistres...")
+def cached_loss_portfolio(n_years):
+    """Sinistres par risque et occurrences CAT de démonstration (lecture seule)."""
+    return engine.make_demo_loss_portfolio(n_years)
+
+@st.cache_data(max_entries=32, show_spinner="Calcul de la cascade brut -> net...")
+def cached_waterfall(n_years, **programme) -> pd.DataFrame:
+    """Résumé de la cascade brut -> net, par structure de programme."""
+    pf = cached_loss_portfolio(n_years)
+    return engine.reinsurance_waterfall(pf["losses"], periods=pf["periods"], n_periods=n_years,
+                                        sum_insured=pf["sum_insured"], occurrence=pf["occurrence"],
+                                        is_cat=pf["is_cat"],
+                                        **programme)["summary"]
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_line_table(n_cedants) -> pd.DataFrame:
+    """Lignes LoB x région x cédante du portefeuille démo : moyennes par période et CV des sinistres."""
+    d = cached_demo_data(16, "Q", n_cedants, len(engine.DEMO_LOBS), len(engine.DEMO_REGIONS))
+    lines = (d.assign(expenses=d["acq_expense"] + d["adm_expense"])
+              .groupby(["lob", "region", "cedant"], observed=True)
+              .agg(premium=("earned_premium", "mean"), claims=("incurred_claims", "mean"),
+                   claims_std=("incurred_claims", "std"), expenses=("expenses", "mean"), scr=("scr", "mean"))
+              .reset_index())
+    lines["cv"] = (lines.pop("claims_std") / lines["claims"]).fillna(0.0)
+    for col in ("lob", "region", "cedant"):
+        lines[col] = lines[col].astype(str)
+    return lines
+
+@st.cache_resource(max_entries=4, show_spinner="Simulation des charges par ligne...")
+def cached_line_simulation(claims: tuple, cv: tuple, segments: tuple, n_sims):
+    """Charges simulées (simulations x lignes), partagées entre méthodes d'allocation (lecture seule)."""
+    return engine.line_loss_simulation(claims, cv, segments, n_sims=n_sims)
+
+@st.cache_resource(max_entries=4, show_spinner="Simulation de l'échantillon de sinistres...")
+def cached_programme_sample(expected_losses, volatility, n_years, large_threshold):
+    """Échantillon Monte Carlo de l'optimiseur (indépendant des contraintes)."""
+    return engine.programme_loss_sample(expected_losses, volatility, n_years, large_threshold=large_threshold)
+
+@st.cache_data(max_entries=16, show_spinner="Évaluation des structures de réassurance...")
+def cached_programme_candidates(premium, expected_losses, volatility, capital, cost_of_capital, n_years,
+                                qs_rates, retentions, sl_priorities, sl_limit, qs_commission, xl_loading, sl_loading):
+    """Évaluation de la grille de programmes ; les contraintes ne font que filtrer le résultat."""
+    sample = cached_programme_sample(expected_losses, volatility, n_years, min(retentions))
+    return engine.evaluate_programmes(sample, premium, capital, qs_rates, retentions, sl_priorities,
+                                      sl_limit=sl_limit, qs_commission=qs_commission, xl_loading=xl_loading,
+                                      sl_loading=sl_loading, cost_of_capital=cost_of_capital)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_triangle(dataset_key, _source, origin_col, date_col, value_col, cumulative_input) -> pd.DataFrame:
+    """Triangle cumulé, construit une fois par jeu de données (empreinte du fichier).
+
+    Les colonnes utiles d'un import sont reprises du cache Parquet (import
+    déjà ingéré, ou lecture antérieure de ces colonnes) ; sinon seules ces
+    colonnes sont lues, puis mises en cache.
+    """
+    if _source is None:
+        data = engine.make_demo_claims_development()
+    else:
+        columns = list(dict.fromkeys([origin_col, date_col, value_col]))
+        data = engine.cached_upload_columns(dataset_key[1], columns)
+        if data is None:
+            key = engine.upload_cache_key(dataset_key[1], {"columns": columns})
+            data = engine.load_cached_frame(key)
+            if data is None:
+                data = read_upload(_source, usecols=columns)
+                engine.store_cached_frame(key, data)
+    return engine.build_triangle(data, origin_col=origin_col, date_col=date_col, value_col=value_col,
+                                 cumulative_input=cumulative_input)
+
+@st.cache_data(max_entries=8, show_spinner="Bootstrap ODP en cours...")
+def cached_reserving(dataset_key, _triangle: pd.DataFrame, n_boot: int) -> dict:
+    """Chain ladder, Mack et bootstrap ODP, mis en cache par jeu de données."""
+    reserves = engine.odp_bootstrap(_triangle, n_boot=n_boot)
+    counts, edges = np.histogram(reserves.sum(axis=1), bins=80)
+    return {
+        "chain_ladder": engine.chain_ladder(_triangle),
+        "summary": engine.reserve_summary(reserves),
+        "hist_counts": counts,
+        "hist_edges": edges,
+    }
+
+def download_button(df: pd.DataFrame, filename: str, dataset_key=None):
+    """Export CSV.gz / Parquet / XLSX préparé à la demande et servi par st.download_button.
+
+    Rien n'est sérialisé tant que l'utilisateur ne le demande pas ; le fichier
+    est écrit par tranches sur disque et réutilisé pour le même jeu de données.
+    """
+    base = filename.rsplit(".", 1)[0]
+    col_fmt, col_prep, col_dl = st.columns([1, 1, 2])
+    with col_fmt:
+        fmt = st.selectbox("Format", list(engine.EXPORT_FORMATS), key=f"export_fmt_{base}",
+                           label_visibility="collapsed")
+    export_name = f"{base}.{fmt}"
+    export_key = engine.upload_cache_key(repr(dataset_key), {"file": export_name, "rows": len(df)})
+    path = engine.export_dir() / f"{export_key}.{fmt}"
+    with col_prep:
+        if not path.exists() and st.button("⚙️ Préparer l'export", key=f"export_prep_{base}"):
+            try:
+                with st.spinner(f"Écriture de {export_name}..."):
+                    engine.export_frame(df, fmt, path)
+            except ValueError as exc:
+                st.error(str(exc))
+    with col_dl:
+        if path.exists():
+            with open(path, "rb") as fh:
+                st.download_button(f"📥 Télécharger {export_name} ({path.stat().st_size / 1e6:.1f} Mo)", fh,
+                                   file_name=export_name, mime=engine.EXPORT_FORMATS[fmt],
+                                   key=f"export_dl_{base}")
+
+def build_report_summary(agg: pd.DataFrame) -> str:
+    """Synthèse textuelle des KPI de la dernière période."""
+    if agg.empty:
+        return "Aucune donnée agrégée."
+    last = agg.iloc[-1]
+    lines = [f"Période analysée : {agg['date'].min():%m/%Y} à {agg['date'].max():%m/%Y} ({len(agg)} périodes)",
+             f"Primes acquises (dernière période) : {last['earned_premium']:,.0f} €",
+             f"Sinistres encourus (dernière période) : {last['incurred_claims']:,.0f} €",
+             f"Loss ratio : {last['loss_ratio']:.1%} - Combined ratio : {last['combined_ratio']:.1%}"]
+    if "solvency_ratio" in last:
+        lines.append(f"Ratio de solvabilité : {last['solvency_ratio']:.1%}")
+    return "\n".join(lines)
+
+def report_status(report_id: str, fmt: str):
+    """Avancement du rapport ; le fragment se rafraîchit seul tant que le thread travaille."""
+    job = engine.report_job(report_id, fmt)
+    
+    def render():
+        job = engine.report_job(report_id, fmt)
+        if running and (job is None or job.done):
+            st.rerun()  # tâche terminée, échouée ou oubliée : rerun complet, sans rafraîchissement
+        if job is None:
+            st.info("Le rapport n'est plus en cache : relancez la génération.")
+        elif job.error:
+            st.error(f"Échec de la génération du rapport : {job.error}")
+        elif not job.done:
+            st.progress(job.progress, text=job.message)
+        else:
+            try:
+                with open(job.path, "rb") as fh:
+                    st.download_button(f"📥 Télécharger le rapport ({job.path.stat().st_size / 1e3:.0f} Ko)", fh,
+                                       file_name=f"rapport_reassurance.{fmt}", mime=engine.REPORT_FORMATS[fmt])
+            except FileNotFoundError:
+                st.info("Le rapport n'est plus en cache : relancez la génération.")
+    
+    running = not job.done
+    st.fragment(render, run_every=1.0 if running else None)()
 
 # =============================================================================
 # INTERFACE PRINCIPALE
@@ -2149,11 +2369,10 @@ elif section == "⚡ Traités Non-Proportionnels":
         nb_couches = st.slider("Nombre de couches XL", 1, 5, 3)
         
         couches_data = []
-        priorite_cumulee = 0
         
         for i in range(nb_couches):
             st.markdown(f"### Couche {i+1}")
-            col_c1, col_c2, col_c3 = st.columns([2,2,1])
+            col_c1, col_c2, col_c3, col_c4, col_c5 = st.columns([2,2,1,1,2])
             
             with col_c1:
                 priorite = st.number_input(f"Priorité couche {i+1} (€)", 
@@ -2168,44 +2387,41 @@ elif section == "⚡ Traités Non-Proportionnels":
                                      value=2.5 + i*0.5, 
                                      key=f"prix_{i}",
                                      min_value=0.1, max_value=20.0, step=0.1)
+            with col_c4:
+                reconstitutions = st.selectbox("Reconst.", ["∞", 0, 1, 2, 3], index=2, key=f"reconst_{i}")
+            with col_c5:
+                franchise_aad = st.number_input("Franchise annuelle (AAD, €)", value=0, step=50000,
+                                                min_value=0, key=f"aad_{i}")
             
             couches_data.append({
                 'Couche': f"XL {i+1}",
                 'Priorité': priorite,
                 'Limite': limite,
                 'Prix (%)': prix,
+                'Reconstitutions': None if reconstitutions == "∞" else reconstitutions,
+                'AAD': franchise_aad,
                 'Plage': f"{priorite:,.0f} € - {priorite + limite:,.0f} €"
             })
-            priorite_cumulee += limite
+        
+        df_couches = pd.DataFrame(couches_data)
+        priorites = df_couches['Priorité'].to_numpy(dtype=float)
+        limites = df_couches['Limite'].to_numpy(dtype=float)
         
         # Simulation de sinistre
         st.subheader("📊 Répartition par Couche")
         
         sinistre_xl = st.number_input("Montant du sinistre principal (€)", value=1200000, step=100000)
         
-        resultats_couches = []
-        sinistre_restant = sinistre_xl
-        cout_total = 0
-        
-        for couche in couches_data:
-            if sinistre_restant <= couche['Priorité']:
-                prise_couche = 0
-            else:
-                prise_couche = min(couche['Limite'], sinistre_restant - couche['Priorité'])
-            
-            cout_couche = couche['Limite'] * couche['Prix (%)'] / 100
-            cout_total += cout_couche
-            
-            resultats_couches.append({
-                'Couche': couche['Couche'],
-                'Plage de Couverture': couche['Plage'],
-                'Prise Réassureur': prise_couche,
-                'Coût Annuel': cout_couche,
-                'Sinistre Restant': sinistre_restant - prise_couche
-            })
-            sinistre_restant -= prise_couche
-        
-        df_resultats = pd.DataFrame(resultats_couches)
+        prises = engine.xl_ceded([sinistre_xl], priorites, limites)[:, 0]
+        couts = limites * df_couches['Prix (%)'].to_numpy(dtype=float) / 100
+        cout_total = couts.sum()
+        df_resultats = pd.DataFrame({
+            'Couche': df_couches['Couche'],
+            'Plage de Couverture': df_couches['Plage'],
+            'Prise Réassureur': prises,
+            'Coût Annuel': couts,
+            'Sinistre Restant': sinistre_xl - np.cumsum(prises)
+        })
         st.dataframe(df_resultats, width=True)
         
         col_cout1, col_cout2 = st.columns(2)
@@ -2213,6 +2429,116 @@ elif section == "⚡ Traités Non-Proportionnels":
             st.metric("💸 Coût total du programme", f"{cout_total:,.0f} €")
         with col_cout2:
             st.metric("📈 Coût en % des primes", f"{(cout_total/5000000)*100:.2f}%")
+        
+        # Tarification par simulation : toutes les couches sur un grand vecteur de sinistres
+        st.subheader("📈 Tarification des Couches par Simulation")
+        
+        col_s1, col_s2 = st.columns(2)
+        with col_s1:
+            source_sinistres = st.radio("Sinistres individuels", ["Simulés (Poisson x Lognormale)", "Importés (CSV)"],
+                                        horizontal=True)
+            primes_sujettes = st.number_input("Primes sujettes (€)", value=5000000, step=500000)
+            taux_reconstitution = st.slider("Taux de prime de reconstitution (%)", 0, 150, 100) / 100
+        with col_s2:
+            if source_sinistres.startswith("Simulés"):
+                xl_lambda = st.number_input("Fréquence annuelle λ (sinistres > seuil)", 0.1, 50.0, 2.0, step=0.1)
+                xl_mu = st.number_input("μ lognormal", 8.0, 16.0, 13.0, step=0.1)
+                xl_sigma = st.number_input("σ lognormal", 0.1, 3.0, 1.0, step=0.1)
+                xl_annees = st.select_slider("Années simulées", [10_000, 100_000, 500_000, 1_000_000], value=500_000)
+                pertes_xl, annees_xl = cached_individual_losses(xl_lambda, xl_mu, xl_sigma, xl_annees)
+                n_annees_xl = xl_annees
+            else:
+                fichier_sinistres = st.file_uploader("Sinistres (une ligne par sinistre)", type=["csv"], key="xl_losses")
+                if fichier_sinistres is None:
+                    st.info("Importez un CSV avec une colonne de montants (et optionnellement une colonne année)")
+                    pertes_xl = None
+                else:
+                    df_sinistres = pd.read_csv(fichier_sinistres)
+                    col_montant = st.selectbox("Colonne montant", list(df_sinistres.columns))
+                    col_annee = st.selectbox("Colonne année (sinon 1 sinistre = 1 année)", [None] + list(df_sinistres.columns))
+                    valides = df_sinistres[col_montant].notna()
+                    if col_annee is not None:
+                        valides &= df_sinistres[col_annee].notna()
+                    if not valides.all():
+                        st.warning(f"{(~valides).sum():,} lignes sans montant ou sans année ignorées")
+                    pertes_xl = df_sinistres.loc[valides, col_montant].to_numpy(dtype=float)
+                    if col_annee is None:
+                        annees_xl = np.arange(pertes_xl.size)
+                    else:
+                        annees_xl = pd.factorize(df_sinistres.loc[valides, col_annee])[0]
+                    n_annees_xl = int(annees_xl.max()) + 1 if annees_xl.size else 0
+        
+        if pertes_xl is not None and pertes_xl.size:
+            tarif = engine.price_xl_layers(
+                pertes_xl, annees_xl, n_annees_xl, priorites, limites,
+                aad=df_couches['AAD'].to_numpy(dtype=float),
+                reinstatements=df_couches['Reconstitutions'].tolist(),
+                reinstatement_rate=taux_reconstitution,
+                rate_on_line=df_couches['Prix (%)'].to_numpy(dtype=float) / 100,
+                subject_premium=primes_sujettes
+            )
+            tarif.insert(0, "Couche", df_couches['Couche'])
+            st.caption(f"{pertes_xl.size:,} sinistres sur {n_annees_xl:,} années")
+            st.dataframe(tarif.rename(columns={
+                "priority": "Priorité", "limit": "Limite", "expected_loss": "Perte attendue",
+                "std_dev": "Écart-type", "prob_attachment": "P(attachement)", "loss_on_line": "Loss on Line",
+                "burning_cost": "Burning cost", "premium": "Prime (Prix%)",
+                "reinstatement_premium": "Prime reconst. attendue", "expected_margin": "Marge attendue"
+            }), width='stretch')
+            fig_tarif = px.bar(tarif, x="Couche", y=["expected_loss", "premium"], barmode="group",
+                               title="Perte attendue vs Prime par couche")
+            st.plotly_chart(fig_tarif, width='stretch')
+        
+        # Exposure rating : profil de risques x courbes MBBEFD, toutes tranches et couches en une passe
+        st.subheader("🏢 Exposure Rating (courbes MBBEFD)")
+        
+        col_e1, col_e2 = st.columns(2)
+        with col_e1:
+            source_profil = st.radio("Profil de risques", ["Démonstration (10 000 tranches)", "Importé (CSV)"],
+                                     horizontal=True)
+            courbe = st.selectbox("Courbe d'exposition", list(engine.EXPOSURE_CURVES) + ["Paramètre c libre"],
+                                  index=2)
+            if courbe == "Paramètre c libre":
+                param_c = st.slider("Paramètre c", 0.0, 8.0, 3.0, 0.1)
+            else:
+                param_c = engine.EXPOSURE_CURVES[courbe]
+            lr_exposition = st.slider("Loss ratio attendu du portefeuille (%)", 20, 120, 60) / 100
+        with col_e2:
+            if source_profil.startswith("Démonstration"):
+                profil = cached_risk_profile()
+            else:
+                fichier_profil = st.file_uploader("Profil (une ligne par tranche)", type=["csv"], key="xl_profile")
+                profil = None
+                if fichier_profil is None:
+                    st.info("Importez un CSV avec les sommes assurées (SMP) et les primes par tranche")
+                else:
+                    df_profil = pd.read_csv(fichier_profil)
+                    col_si = st.selectbox("Colonne somme assurée / SMP", list(df_profil.columns))
+                    col_prime = st.selectbox("Colonne prime", list(df_profil.columns),
+                                             index=min(1, len(df_profil.columns) - 1))
+                    profil = pd.DataFrame({"sum_insured": df_profil[col_si].to_numpy(dtype=float),
+                                           "premium": df_profil[col_prime].to_numpy(dtype=float)})
+            b_mbbefd, g_mbbefd = engine.mbbefd_parameters(param_c)
+            x_courbe = np.linspace(0, 1, 201)
+            fig_courbe = px.line(x=x_courbe, y=engine.exposure_curve(x_courbe, b_mbbefd, g_mbbefd),
+                                 labels={"x": "Franchise / SMP", "y": "G(x)"},
+                                 title=f"Courbe d'exposition (c = {param_c:g}, b = {float(b_mbbefd):.3g}, g = {float(g_mbbefd):.3g})")
+            st.plotly_chart(fig_courbe, width='stretch')
+        
+        if profil is not None and len(profil):
+            expo = engine.exposure_rating(profil, priorites, limites, b=b_mbbefd, g=g_mbbefd,
+                                          loss_ratio=lr_exposition)
+            expo.insert(0, "Couche", df_couches['Couche'])
+            expo["Prime (Prix%)"] = limites * df_couches['Prix (%)'].to_numpy(dtype=float) / 100
+            st.caption(f"{len(profil):,} tranches x {len(expo)} couches - primes du profil : "
+                       f"{profil['premium'].sum():,.0f} €")
+            st.dataframe(expo.rename(columns={
+                "priority": "Priorité", "limit": "Limite", "expected_loss": "Perte attendue (exposition)",
+                "share_of_risk_premium": "Part de la prime de risque", "loss_on_line": "Loss on Line",
+                "exposed_bands": "Tranches exposées"}), width='stretch')
+            fig_expo = px.bar(expo, x="Couche", y=["expected_loss", "Prime (Prix%)"], barmode="group",
+                              title="Perte attendue par exposition vs Prime par couche")
+            st.plotly_chart(fig_expo, width='stretch')
     
     with tab3:
         st.subheader("📊 Applications Avancées et Optimisation")
@@ -2325,7 +2651,7 @@ elif section == "💰 Tarification Technique":
             <ul>
             <li><b>Méthode fréquentiste</b> : Basée sur l'expérience historique</li>
             <li><b>Méthode bayésienne</b> : Combinaison expérience propre/collective</li>
-            <li><b>Crédibility Theory</b> : Poids accordé à différentes sources</li>
+            <li><b>Crédibility Theory</b> : Poids accordé à différentes sources (Bühlmann-Straub par cédant et ligne : 📊 Analyse Data Science › Structure Portefeuille)</li>
             <li><b>Modèles de risque</b> : Distributions probabilistes avancées</li>
             </ul>
             </div>
@@ -2338,27 +2664,37 @@ elif section == "💰 Tarification Technique":
             mu_lognormal = st.slider("μ lognormal", 9.0, 12.0, 10.5)
             sigma_lognormal = st.slider("σ lognormal", 0.1, 2.0, 1.0)
             
-            # Simulation de la distribution
-            n_simulations = 10000
-            n_sinistres = np.random.poisson(lambda_poisson, n_simulations)
-            couts_sinistres = np.random.lognormal(mu_lognormal, sigma_lognormal, n_simulations)
+            n_annees = st.select_slider("Années simulées", [10_000, 100_000, 1_000_000, 2_000_000, 5_000_000], value=1_000_000)
+            niveaux_risque = st.multiselect("Niveaux VaR/TVaR", [0.9, 0.95, 0.99, 0.995, 0.999], default=[0.95, 0.99, 0.995])
+            multi_coeurs = st.checkbox("Calcul multi-cœurs", value=n_annees >= 1_000_000)
+            
+            # Simulation Poisson composée (fréquence x sévérité), mise en cache par paramètres
+            distribution = cached_aggregate_loss_distribution(
+                lambda_poisson, mu_lognormal, sigma_lognormal, n_annees,
+                tuple(sorted(niveaux_risque)) or (0.95, 0.99), multi_coeurs
+            )
             
-            fig_dist = px.histogram(couts_sinistres, nbins=50, 
-                                  title="Distribution des Coûts de Sinistres",
-                                  labels={'value': 'Coût du sinistre (€)', 'count': 'Fréquence'})
-            st.plotly_chart(fig_dist, width=True)
+            edges = distribution["hist_edges"]
+            fig_dist = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=distribution["hist_counts"],
+                              title=f"Distribution des Pertes Annuelles Agrégées ({n_annees:,} années)",
+                              labels={'x': 'Perte annuelle agrégée (€)', 'y': 'Fréquence'})
+            fig_dist.update_traces(width=float(edges[1] - edges[0]))
+            fig_dist.update_layout(bargap=0)
+            st.plotly_chart(fig_dist, width='stretch')
             
             # Statistiques descriptives
             stats_data = {
-                'Métrique': ['Moyenne', 'Médiane', 'Écart-type', 'VaR 95%', 'VaR 99%'],
+                'Métrique': ['Moyenne', 'Médiane', 'Écart-type', 'P(aucun sinistre)'],
                 'Valeur': [
-                    f"{np.mean(couts_sinistres):.2f}",
-                    f"{np.median(couts_sinistres):.2f}",
-                    f"{np.std(couts_sinistres):.2f}",
-                    f"{np.percentile(couts_sinistres, 95):.2f}",
-                    f"{np.percentile(couts_sinistres, 99):.2f}"
+                    f"{distribution['mean']:,.2f}",
+                    f"{distribution['median']:,.2f}",
+                    f"{distribution['std']:,.2f}",
+                    f"{distribution['prob_zero']:.2%}"
                 ]
             }
+            for _, row in distribution["risk"].iterrows():
+                stats_data['Métrique'] += [f"VaR {row['level']:.1%}", f"TVaR {row['level']:.1%}"]
+                stats_data['Valeur'] += [f"{row['VaR']:,.2f}", f"{row['TVaR']:,.2f}"]
             st.dataframe(pd.DataFrame(stats_data))
     
     with tab2:
@@ -2500,20 +2836,44 @@ elif section == "📊 Comptabilité Technique":
             </div>
             """, unsafe_allow_html=True)
             
-            # Tableau de développement
+            # Tableau de développement : triangle construit à partir des données
             st.subheader("📈 Tableau de Développement")
             
-            # Données simulées pour le développement
-            annees = [2019, 2020, 2021, 2022, 2023]
-            developpement_data = {
-                'Année': annees,
-                'Développement 1 an': [1.8, 1.7, 1.9, 1.8, 1.7],
-                'Développement 2 ans': [1.4, 1.3, 1.5, 1.4, None],
-                'Développement 3 ans': [1.2, 1.1, 1.2, None, None],
-                'Développement final': [1.1, 1.1, None, None, None]
-            }
+            source_triangle = st.radio("Source des sinistres", ["Démonstration", "Fichier importé"],
+                                       horizontal=True, key="source_triangle")
+            fichier_triangle = None
+            if source_triangle == "Fichier importé":
+                fichier_triangle = st.file_uploader("Sinistres ligne à ligne (CSV/Excel)", type=["csv", "xlsx", "xls"],
+                                                    key="fichier_triangle")
+            
+            if fichier_triangle is not None:
+                hash_triangle = uploaded_file_digest(fichier_triangle)
+                entete = read_upload_header(hash_triangle, fichier_triangle)
+                mapping_triangle, _ = cached_reserving_match(tuple(map(str, entete.columns)))
+                colonnes = list(entete.columns)
+                
+                def _choix(label, key):
+                    defaut = colonnes.index(mapping_triangle[key]) if mapping_triangle.get(key) in colonnes else 0
+                    return st.selectbox(label, colonnes, index=defaut, key=f"triangle_{key}")
+                
+                col_origine = _choix("Colonne survenance", "accident_period")
+                col_date = _choix("Colonne date de paiement / d'inventaire", "date")
+                col_montant = _choix("Colonne montant", "paid_claims")
+                montants_cumules = st.checkbox("Montants cumulés (charge incurred)", value=False)
+                cle_triangle = ("upload", hash_triangle, col_origine, col_date, col_montant, montants_cumules)
+            else:
+                col_origine, col_date, col_montant, montants_cumules = "accident_period", "date", "paid_claims", False
+                cle_triangle = ("demo",)
             
-            st.dataframe(pd.DataFrame(developpement_data), width='stretch')
+            triangle = cached_triangle(cle_triangle, fichier_triangle, col_origine, col_date, col_montant, montants_cumules)
+            if triangle.empty:
+                st.warning("Aucune donnée exploitable pour construire le triangle.")
+            else:
+                facteurs = engine.chain_ladder(triangle)["factors"]
+                triangle_aff = triangle.copy()
+                triangle_aff.loc["Facteur CL"] = np.append(facteurs, np.nan)
+                st.dataframe(triangle_aff.style.format("{:,.0f}", na_rep="").format(
+                    "{:.3f}", subset=pd.IndexSlice[["Facteur CL"], :], na_rep=""), width='stretch')
             
             st.markdown("""
             <div class="warning-box">
@@ -2527,6 +2887,39 @@ elif section == "📊 Comptabilité Technique":
             </div>
             """, unsafe_allow_html=True)
     
+        # Provisionnement stochastique (pleine largeur)
+        if not triangle.empty:
+            st.subheader("🎲 Chain Ladder, Mack et Bootstrap ODP")
+            n_bootstrap = st.select_slider("Rééchantillonnages bootstrap", [1_000, 5_000, 10_000, 20_000, 50_000], value=10_000)
+            provisionnement = cached_reserving(cle_triangle, triangle, n_bootstrap)
+            cl = provisionnement["chain_ladder"]
+            resume = provisionnement["summary"]
+            
+            col_r1, col_r2, col_r3 = st.columns(3)
+            col_r1.metric("IBNR Chain Ladder", f"{cl['ibnr'].sum():,.0f} €")
+            col_r2.metric("Erreur standard de Mack", f"{cl['mack_total_se']:,.0f} €")
+            col_r3.metric("Réserve bootstrap P99.5", f"{resume['P99.5'].iloc[-1]:,.0f} €")
+            
+            tableau_reserves = pd.DataFrame({
+                'Survenance': [str(o) for o in triangle.index] + ["Total"],
+                'Dernier cumul': np.append(cl["latest"], cl["latest"].sum()),
+                'Ultime': np.append(cl["ultimate"], cl["ultimate"].sum()),
+                'IBNR': np.append(cl["ibnr"], cl["ibnr"].sum()),
+                'Mack SE': np.append(cl["mack_se"], cl["mack_total_se"]),
+                'Bootstrap moyenne': resume["mean"].to_numpy(),
+                'Bootstrap P75': resume["P75"].to_numpy(),
+                'Bootstrap P95': resume["P95"].to_numpy(),
+                'Bootstrap P99.5': resume["P99.5"].to_numpy(),
+            })
+            st.dataframe(tableau_reserves.style.format("{:,.0f}", subset=tableau_reserves.columns[1:]), width='stretch')
+            
+            edges = provisionnement["hist_edges"]
+            fig_reserves = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=provisionnement["hist_counts"],
+                                  labels={'x': 'Réserve totale (€)', 'y': 'Fréquence'},
+                                  title=f"Distribution bootstrap de la réserve totale ({n_bootstrap:,} tirages)")
+            fig_reserves.update_layout(bargap=0)
+            st.plotly_chart(fig_reserves, width='stretch')
+    
     with tab2:
         st.subheader("📊 Ratios Techniques Clés")
         
@@ -2622,6 +3015,19 @@ elif section == "🌪️ Gestion des Catastrophes":
             
             st.metric("📅 Probabilité annuelle", f"{proba_annee[type_catastrophe]}%")
             
+            # Table d'événements synthétique : la probabilité annuelle porte sur les
+            # événements d'intensité au moins égale au curseur (fréquence totale bornée)
+            annees_cat = st.select_slider("Années simulées (ELT)", [10_000, 50_000, 100_000, 500_000], value=100_000)
+            occurrences_cat = proba_annee[type_catastrophe] / 100 * annees_cat
+            if occurrences_cat > engine.CAT_MAX_OCCURRENCES:
+                st.warning(f"⚠️ {occurrences_cat:,.0f} occurrences attendues : le maximum est "
+                           f"{engine.CAT_MAX_OCCURRENCES:,}. Réduisez le nombre d'années simulées.")
+                st.stop()
+            simulation_cat = cached_cat_simulation(
+                float(zone_affectee) * valeur_par_km2 * 1e6, dommage_base[type_catastrophe],
+                proba_annee[type_catastrophe] / 100, float(intensite), float(densite_construction), annees_cat)
+            st.metric("📉 Perte annuelle moyenne (AAL)", f"{simulation_cat['annual'].mean():,.0f} €")
+            
         with col2:
             st.markdown("""
             <div class="concept-box">
@@ -2635,16 +3041,18 @@ elif section == "🌪️ Gestion des Catastrophes":
             </div>
             """, unsafe_allow_html=True)
             
-            # Courbe PML (Probable Maximum Loss)
+            # Courbes PML issues de la simulation de la table d'événements
             st.subheader("📈 Courbe PML")
             
-            periods = [1, 10, 50, 100, 250, 500]
-            pml_values = [dommage_estime * p/100 for p in [80, 50, 20, 10, 4, 2]]
-            
-            fig_pml = px.line(x=periods, y=pml_values, 
-                            labels={'x': 'Période de retour (ans)', 'y': 'PML (€)'},
-                            title="Courbe Probable Maximum Loss")
+            courbes = simulation_cat["curves"].melt(id_vars="return_period", value_vars=["oep", "aep"],
+                                                    var_name="courbe", value_name="perte")
+            fig_pml = px.line(courbes, x="return_period", y="perte", color="courbe", markers=True, log_x=True,
+                              labels={'return_period': 'Période de retour (ans)', 'perte': 'PML (€)'},
+                              title=f"Courbes OEP / AEP ({simulation_cat['n_years']:,} années simulées)")
             st.plotly_chart(fig_pml, width='stretch')
+            st.dataframe(simulation_cat["curves"].style.format(
+                {"return_period": "{:,.0f}", "exceedance_prob": "{:.2%}", "oep": "{:,.0f}", "aep": "{:,.0f}"}),
+                width='stretch')
     
     with tab2:
         st.subheader("📊 Couverture Catastrophe")
@@ -2687,6 +3095,41 @@ elif section == "🌪️ Gestion des Catastrophes":
             st.metric("📈 Espérance de sinistre", f"{esperance_sinistre:,.0f} €")
             st.metric("🎯 Bénéfice de protection", f"{benefice_protection:,.0f} €")
             st.metric("⚖️ Ratio coût/bénéfice", f"{ratio_cout_benefice:.2f}")
+        
+        # XL CAT par événement puis stop-loss annuel, sur les occurrences simulées
+        st.markdown("### 🎲 Programme sur la table d'événements")
+        col_sl1, col_sl2 = st.columns(2)
+        with col_sl1:
+            priorite_sl = st.number_input("Priorité stop-loss annuelle (€)", value=float(limite_cat), step=1e7)
+        with col_sl2:
+            portee_sl = st.number_input("Portée stop-loss (€)", value=float(limite_cat), step=1e7)
+        
+        n_annees_cat = simulation_cat["n_years"]
+        tarif_cat = engine.price_xl_layers(simulation_cat["losses"], simulation_cat["years"], n_annees_cat,
+                                           [priorite_cat], [limite_cat], rate_on_line=prime_cat / limite_cat)
+        cede_xl = engine.xl_annual_ceded(simulation_cat["losses"], simulation_cat["years"], n_annees_cat,
+                                         [priorite_cat], [limite_cat])[0]
+        net_xl = simulation_cat["annual"] - cede_xl
+        recup_sl = engine.stop_loss_recoveries(net_xl, priorite_sl, portee_sl)[0]
+        net_final = net_xl - recup_sl
+        
+        col_r1, col_r2, col_r3, col_r4 = st.columns(4)
+        col_r1.metric("Perte attendue XL CAT", f"{tarif_cat['expected_loss'].iloc[0]:,.0f} €")
+        col_r2.metric("Probabilité d'attachement XL", f"{tarif_cat['prob_attachment'].iloc[0]:.2%}")
+        col_r3.metric("Marge attendue XL", f"{tarif_cat['expected_margin'].iloc[0]:,.0f} €")
+        col_r4.metric("Récupération stop-loss attendue", f"{recup_sl.mean():,.0f} €",
+                      help=f"Probabilité d'attachement : {(recup_sl > 0).mean():.2%}")
+        
+        aep_net = pd.DataFrame({
+            "return_period": simulation_cat["curves"]["return_period"],
+            "Brut": simulation_cat["curves"]["aep"],
+            "Net XL": engine.exceedance_curves(net_xl, net_xl)["aep"],
+            "Net XL + stop-loss": engine.exceedance_curves(net_final, net_final)["aep"],
+        }).melt(id_vars="return_period", var_name="vision", value_name="perte")
+        fig_aep_net = px.line(aep_net, x="return_period", y="perte", color="vision", markers=True, log_x=True,
+                              labels={"return_period": "Période de retour (ans)", "perte": "Perte annuelle (€)"},
+                              title="AEP brute et nette de réassurance")
+        st.plotly_chart(fig_aep_net, width='stretch')
 
 # =============================================================================
 # SECTION 8: SOLVABILITÉ & RÉGLEMENTATION (COMPLÉTÉE)
@@ -2771,33 +3214,22 @@ elif section == "🛡️ Solvabilité & Réglementation":
             with col_a2:
                 scr_operationnel = st.number_input("SCR Opérationnel (€)", value=5000000)
             
-            # Calcul SCR avec matrice de corrélation complète
-            # Matrice de corrélation standard Solvabilité II
-            corr_matrix = {
-                'souscription_vie': [1.0, 0.5, 0.25, 0.25, 0.25, 0.25],
-                'souscription_non_vie': [0.5, 1.0, 0.25, 0.25, 0.25, 0.25],
-                'marche_actions': [0.25, 0.25, 1.0, 0.5, 0.5, 0.25],
-                'marche_taux': [0.25, 0.25, 0.5, 1.0, 0.5, 0.25],
-                'marche_immobilier': [0.25, 0.25, 0.5, 0.5, 1.0, 0.25],
-                'contrepartie': [0.25, 0.25, 0.25, 0.25, 0.25, 1.0]
-            }
+            # Agrégation sqrt(sᵀ C s) à deux niveaux (sous-modules puis modules)
+            corr_souscription = np.array([[1.0, 0.5], [0.5, 1.0]])
+            corr_marche = np.array([[1.0, 0.5, 0.5], [0.5, 1.0, 0.5], [0.5, 0.5, 1.0]])
+            corr_global = np.full((4, 4), 0.25) + 0.75 * np.eye(4)
             
-            # Calcul détaillé
-            scr_souscription = math.sqrt(scr_vie**2 + scr_non_vie**2 + 2*0.5*scr_vie*scr_non_vie)
-            scr_marche = math.sqrt(scr_actions**2 + scr_taux**2 + scr_immobilier**2 + 
-                                 2*0.5*scr_actions*scr_taux + 2*0.5*scr_actions*scr_immobilier + 
-                                 2*0.5*scr_taux*scr_immobilier)
-            
-            # SCR global
-            scr_global = math.sqrt(
-                scr_souscription**2 + scr_marche**2 + scr_contrepartie**2 + scr_operationnel**2 +
-                2*0.25*scr_souscription*scr_marche +
-                2*0.25*scr_souscription*scr_contrepartie +
-                2*0.25*scr_souscription*scr_operationnel +
-                2*0.25*scr_marche*scr_contrepartie +
-                2*0.25*scr_marche*scr_operationnel +
-                2*0.25*scr_contrepartie*scr_operationnel
-            )
+            def scr_detaille(vie, non_vie, actions, taux, immobilier, contrepartie, operationnel):
+                """SCR global pour des charges scalaires ou des tableaux de scénarios."""
+                souscription = engine.aggregate_scr(np.stack(np.broadcast_arrays(vie, non_vie), axis=-1),
+                                                    corr_souscription)
+                marche = engine.aggregate_scr(np.stack(np.broadcast_arrays(actions, taux, immobilier), axis=-1),
+                                              corr_marche)
+                modules = np.stack(np.broadcast_arrays(souscription, marche, contrepartie, operationnel), axis=-1)
+                return souscription, marche, engine.aggregate_scr(modules, corr_global)
+            
+            scr_souscription, scr_marche, scr_global = (float(x) for x in scr_detaille(
+                scr_vie, scr_non_vie, scr_actions, scr_taux, scr_immobilier, scr_contrepartie, scr_operationnel))
             
             st.metric("🛡️ SCR Souscription", f"{scr_souscription:,.0f} €")
             st.metric("📈 SCR Marché", f"{scr_marche:,.0f} €")
@@ -2862,8 +3294,16 @@ elif section == "🛡️ Solvabilité & Réglementation":
             # Impact de la réassurance sur le SCR
             st.subheader("🔄 Impact Réassurance sur SCR")
             
-            reduction_scr = st.slider("Réduction SCR grâce à la réassurance (%)", 0, 50, 20)
-            nouveau_scr = scr_global * (1 - reduction_scr/100)
+            # La réassurance réduit les charges de souscription ; le SCR global est ré-agrégé
+            # (effet de diversification), le risque de contrepartie augmente avec la cession
+            reduction_scr = st.slider("Réduction SCR grâce à la réassurance (%)", 0, 50, 20,
+                                      help="Réduction des charges de souscription vie et non-vie")
+            hausse_contrepartie = st.slider("Hausse du SCR contrepartie par point de réduction (%)", 0.0, 5.0, 1.0, 0.5)
+            reductions = np.arange(0, 51) / 100
+            _, _, scr_courbe = scr_detaille(
+                scr_vie * (1 - reductions), scr_non_vie * (1 - reductions), scr_actions, scr_taux, scr_immobilier,
+                scr_contrepartie * (1 + hausse_contrepartie * reductions), scr_operationnel)
+            nouveau_scr = float(scr_courbe[reduction_scr])
             nouveau_ratio = (capital_disponible / nouveau_scr) * 100
             
             st.metric("🛡️ Nouveau SCR", f"{nouveau_scr:,.0f} €")
@@ -2873,6 +3313,12 @@ elif section == "🛡️ Solvabilité & Réglementation":
             # Calcul du gain en capital
             gain_capital = scr_global - nouveau_scr
             st.metric("💰 Gain en capital libéré", f"{gain_capital:,.0f} €")
+            
+            fig_courbe_scr = px.line(x=reductions * 100, y=capital_disponible / scr_courbe * 100,
+                                     labels={"x": "Réduction des charges de souscription (%)",
+                                             "y": "Ratio de solvabilité (%)"},
+                                     title="Ratio de solvabilité selon la réduction des charges")
+            st.plotly_chart(fig_courbe_scr, width='stretch')
     
     with tab2:
         st.subheader("🎯 Pilier II - Exigences Qualitatives")
@@ -2960,6 +3406,76 @@ elif section == "🛡️ Solvabilité & Réglementation":
                 st.warning("⚠️ Maturité ORSA intermédiaire")
             else:
                 st.error("🔴 Maturité ORSA à développer")
+        
+        # Volet quantitatif : trajectoires de bilan simulées (capital économique et planification)
+        st.subheader("📈 Projection ORSA du Bilan (Monte Carlo)")
+        st.caption("Fonds propres initiaux et SCR repris du calculateur du Pilier I")
+        
+        col_p1, col_p2, col_p3 = st.columns(3)
+        with col_p1:
+            orsa_primes = st.number_input("Primes brutes année 1 (M€)", 10.0, 10000.0, 150.0, 10.0)
+            orsa_croissance = st.slider("Croissance annuelle des primes (%)", -10, 20, 3)
+            orsa_horizon = st.slider("Horizon de projection (années)", 3, 5, 5)
+            orsa_scenarios = st.select_slider("Nombre de scénarios", [10_000, 50_000, 100_000, 200_000], value=100_000)
+        with col_p2:
+            orsa_lr = st.slider("Loss ratio attritionnel moyen (%)", 40, 100, 65)
+            orsa_lr_cv = st.slider("Volatilité du loss ratio (CV %)", 1, 30, 8)
+            orsa_frais = st.slider("Taux de frais (%)", 10, 45, 28)
+            orsa_cat_freq = st.slider("Fréquence CAT annuelle", 0.0, 2.0, 0.3, 0.05)
+            orsa_cat_cout = st.number_input("Coût moyen d'un événement CAT (M€)", 0.0, 5000.0, 20.0, 5.0)
+        with col_p3:
+            orsa_qs = st.slider("Quote-part cédée (%)", 0, 80, 20)
+            orsa_xl_priorite = st.number_input("Priorité XL CAT (M€)", 0.0, 5000.0, 15.0, 5.0)
+            orsa_xl_portee = st.number_input("Portée XL CAT (M€)", 0.0, 5000.0, 50.0, 5.0)
+            orsa_xl_prime = st.number_input("Prime XL CAT annuelle (M€)", 0.0, orsa_primes * 0.1,
+                                            min(4.0, orsa_primes * 0.1), 0.5)
+            orsa_rendement = st.slider("Rendement financier moyen (%)", -2.0, 8.0, 3.0, 0.25)
+        
+        orsa = cached_orsa_projection(
+            premium=orsa_primes * 1e6, own_funds=float(capital_disponible),
+            scr_ratio=scr_global / ((1 - orsa_qs / 100) * orsa_primes * 1e6 - orsa_xl_prime * 1e6),
+            years=orsa_horizon, n_scenarios=orsa_scenarios, growth=orsa_croissance / 100,
+            loss_ratio=orsa_lr / 100, loss_ratio_cv=orsa_lr_cv / 100, expense_ratio=orsa_frais / 100,
+            cat_frequency=orsa_cat_freq, cat_mean_loss=orsa_cat_cout * 1e6, quota_share=orsa_qs / 100,
+            xl_retention=orsa_xl_priorite * 1e6, xl_limit=orsa_xl_portee * 1e6, xl_premium=orsa_xl_prime * 1e6,
+            invest_return=orsa_rendement / 100)
+        orsa_summary = orsa["summary"]
+        
+        col_r1, col_r2, col_r3 = st.columns(3)
+        derniere = orsa_summary.iloc[-1]
+        col_r1.metric(f"Solvabilité médiane année {orsa_horizon}", f"{derniere['solvency_p50']:.0%}")
+        col_r2.metric("Probabilité ratio < 100 %", f"{derniere['prob_below_100']:.2%}")
+        col_r3.metric(f"Probabilité de ruine cumulée ({orsa_horizon} ans)", f"{derniere['ruin_prob']:.2%}")
+        
+        col_g1, col_g2 = st.columns(2)
+        with col_g1:
+            fig_fan = go.Figure()
+            fig_fan.add_trace(go.Scatter(x=orsa_summary["year"], y=orsa_summary["solvency_p95"] * 100,
+                                         line=dict(width=0), showlegend=False))
+            fig_fan.add_trace(go.Scatter(x=orsa_summary["year"], y=orsa_summary["solvency_p5"] * 100,
+                                         fill="tonexty", line=dict(width=0), name="P5 - P95"))
+            fig_fan.add_trace(go.Scatter(x=orsa_summary["year"], y=orsa_summary["solvency_p75"] * 100,
+                                         line=dict(width=0), showlegend=False))
+            fig_fan.add_trace(go.Scatter(x=orsa_summary["year"], y=orsa_summary["solvency_p25"] * 100,
+                                         fill="tonexty", line=dict(width=0), name="P25 - P75"))
+            fig_fan.add_trace(go.Scatter(x=orsa_summary["year"], y=orsa_summary["solvency_p50"] * 100,
+                                         mode="lines+markers", name="Médiane"))
+            fig_fan.add_hline(y=100, line_dash="dash", line_color="red")
+            fig_fan.update_layout(title="Distribution du ratio de solvabilité par année",
+                                  xaxis_title="Année", yaxis_title="Ratio de solvabilité (%)")
+            st.plotly_chart(fig_fan, width='stretch')
+        with col_g2:
+            edges = orsa["hist_edges"]
+            fig_hist_orsa = px.bar(x=(edges[:-1] + edges[1:]) / 2 * 100, y=orsa["hist_counts"],
+                                   labels={"x": "Ratio de solvabilité (%)", "y": "Scénarios"},
+                                   title=f"Ratio de solvabilité en année {orsa_horizon} ({orsa['n_scenarios']:,} scénarios)")
+            fig_hist_orsa.add_vline(x=100, line_dash="dash", line_color="red")
+            st.plotly_chart(fig_hist_orsa, width='stretch')
+        
+        st.dataframe(orsa_summary.style.format({
+            "scr": "{:,.0f}", "own_funds_mean": "{:,.0f}",
+            **{c: "{:.1%}" for c in orsa_summary.columns if c.startswith(("solvency", "prob", "ruin"))}
+        }), width='stretch')
     
     with tab3:
         st.subheader("📋 Pilier III - Transparence et Reporting")
@@ -3371,6 +3887,57 @@ elif section == "📋 Études de Cas Concrets":
             </ul>
             </div>
             """, unsafe_allow_html=True)
+        
+        # Cascade complète du programme sur le portefeuille simulé
+        st.subheader("🌊 Cascade Brut → Net du Programme")
+        st.caption("Sinistres par risque et occurrences CAT simulés ; chaque traité s'applique au net du "
+                   "précédent, la rétrocession reprend le taux choisi ci-dessus.")
+        pf_annees = st.select_slider("Années simulées", [2_000, 5_000, 10_000, 20_000], value=5_000,
+                                     key="cascade_annees")
+        pf = cached_loss_portfolio(pf_annees)
+        charge_brute = np.bincount(pf["periods"], weights=pf["losses"], minlength=pf_annees).mean()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            qp = st.slider("Quote-part (%)", 0, 50, 15, key="cascade_qp") / 100
+            commission_qp = st.slider("Commission QP (%)", 0, 40, 30, key="cascade_comm") / 100
+            plein = st.number_input("Plein de rétention (M€)", 0.5, 20.0, 2.0, key="cascade_plein") * 1e6
+            lignes = st.slider("Nombre de pleins cédés", 0, 10, 4, key="cascade_lignes")
+        with col2:
+            xl_prio = st.number_input("XL par risque : priorité (M€)", 0.1, 20.0, 1.0, key="cascade_xlp") * 1e6
+            xl_portee = st.number_input("XL par risque : portée (M€)", 0.0, 50.0, 9.0, key="cascade_xll") * 1e6
+            cat_prio = st.number_input("XL CAT : priorité (M€)", 1.0, 500.0, 20.0, key="cascade_catp") * 1e6
+            cat_portee = st.number_input("XL CAT : portée (M€)", 0.0, 2000.0, 100.0, key="cascade_catl") * 1e6
+        with col3:
+            sl_prio = st.slider("Stop loss : priorité (% charge moyenne)", 80, 200, 120, key="cascade_slp") / 100
+            sl_portee = st.slider("Stop loss : portée (% charge moyenne)", 0, 200, 50, key="cascade_sll") / 100
+            cout_xl = st.number_input("Coût XL par risque + XL CAT + stop loss (M€/an)", 0.0, 100.0, 9.0,
+                                      key="cascade_cout") * 1e6
+        
+        synthese = cached_waterfall(
+            pf_annees, quota_share=qp, surplus_retention=plein, surplus_lines=lignes,
+            risk_xl=(xl_prio, xl_portee), cat_xl=(cat_prio, cat_portee),
+            stop_loss=(sl_prio * charge_brute, sl_portee * charge_brute),
+            retrocession=taux_retrocession / 100, premium=charge_brute / 0.65, qs_commission=commission_qp,
+            xl_premiums={"XL par risque": cout_xl * 0.35, "XL CAT": cout_xl * 0.45, "Stop loss": cout_xl * 0.2})
+        
+        fig_cascade = go.Figure(go.Waterfall(
+            name="Cascade", orientation="v",
+            measure=["absolute"] + ["relative"] * (len(synthese) - 1) + ["total"],
+            x=list(synthese.index) + ["Net"],
+            y=list(synthese["net_loss"].iloc[:1] / 1e6) + list(-synthese["ceded_loss"].iloc[1:] / 1e6) + [0],
+            textposition="outside", texttemplate="%{y:.1f}"
+        ))
+        fig_cascade.update_layout(title="Charge annuelle moyenne brute → nette (M€)")
+        st.plotly_chart(fig_cascade, width='stretch')
+        
+        tableau = synthese[["ceded_loss", "net_loss", "net_q995", "ceded_premium", "net_result",
+                            "net_result_q005"]] / 1e6
+        tableau.columns = ["Sinistres cédés", "Charge nette", "Charge nette 1/200", "Coût cédé",
+                           "Résultat net", "Résultat net 1/200"]
+        st.dataframe(tableau.style.format("{:,.1f}"), width='stretch')
+        st.caption(f"{pf['losses'].size:,} sinistres simulés ; montants annuels moyens en M€, "
+                   "1/200 = quantile 99,5 % de la charge annuelle.")
 
 # =============================================================================
 # SECTION 10: ANALYSE DATA SCIENCE
@@ -3387,44 +3954,74 @@ elif section == "📊 Analyse Data Science":
         use_demo_data = st.checkbox("Utiliser les données de démonstration", value=True)
         freq = st.selectbox("Fréquence des données", ["Trimestrielle", "Mensuelle", "Annuelle"], index=0)
         forecast_years = st.slider("Années de prévision", 1, 5, 3)
+        with st.expander("🧪 Taille du portefeuille démo"):
+            demo_periods = st.number_input("Périodes", 4, 240, 16)
+            demo_cedants = st.number_input("Cédantes", 1, 100_000, 1)
+            demo_lobs = st.number_input("Lignes de business", 1, 50, 4)
+            demo_regions = st.number_input("Régions", 1, 50, 2)
+        streaming_mode = st.checkbox("Mode streaming (CSV volumineux)", value=False,
+                                     help="Lit le fichier par tranches et ne conserve que les agrégats")
+        if streaming_mode:
+            chunk_rows = st.number_input("Taille des tranches (lignes)", 10_000, 5_000_000, 250_000, step=50_000)
     
     # Préparation des données
     if use_demo_data:
-        df_raw = make_demo_data(periods=16, freq="Q" if freq == "Trimestrielle" else "M")
+        demo_params = (int(demo_periods), "Q" if freq == "Trimestrielle" else "M",
+                       int(demo_cedants), int(demo_lobs), int(demo_regions))
+        demo_rows = demo_params[0] * demo_params[2] * demo_params[3] * demo_params[4]
+        if demo_rows > engine.DEMO_MAX_ROWS:
+            st.warning(f"⚠️ Portefeuille démo de {demo_rows:,} lignes : le maximum est "
+                       f"{engine.DEMO_MAX_ROWS:,} (périodes x cédantes x LoB x régions). "
+                       "Réduisez la taille dans « Taille du portefeuille démo ».")
+            st.stop()
+        df_raw = cached_demo_data(*demo_params)
         mapping = auto_map_columns(df_raw)
+        dataset_key = ("demo",) + demo_params
     elif uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df_raw = pd.read_csv(uploaded_file)
-        else:
-            df_raw = pd.read_excel(uploaded_file)
+        file_hash = uploaded_file_digest(uploaded_file)
+        df_raw = read_upload_header(file_hash, uploaded_file)
         mapping = auto_map_columns(df_raw)
         
-        # Interface de mapping manuel
+        # Interface de mapping manuel (formulaire : un seul rerun à la validation)
+        available_cols = [None] + list(df_raw.columns)
         st.sidebar.subheader("🎯 Mapping des Colonnes")
-        for key in REQUIRED_BASE:
-            available_cols = [None] + list(df_raw.columns)
-            default_idx = 0
-            if mapping.get(key) in df_raw.columns:
-                default_idx = list(df_raw.columns).index(mapping[key]) + 1
-            mapping[key] = st.sidebar.selectbox(
-                f"Colonne pour {key}", 
-                available_cols,
-                index=default_idx
-            )
+        st.sidebar.caption(f"{sum(v is not None for v in mapping.values())}/{len(SCHEMA)} champs reconnus "
+                           f"parmi {len(df_raw.columns)} colonnes")
+        
+        def _mapping_select(key):
+            default_idx = available_cols.index(mapping[key]) if mapping.get(key) in df_raw.columns else 0
+            return st.selectbox(f"Colonne pour {key}", available_cols, index=default_idx,
+                                key=f"map_{key}_{file_hash[:12]}")
+        
+        with st.sidebar.form("mapping_form"):
+            for key in REQUIRED_BASE:
+                mapping[key] = _mapping_select(key)
+            with st.expander("Champs optionnels"):
+                for key in SCHEMA:
+                    if key not in REQUIRED_BASE:
+                        mapping[key] = _mapping_select(key)
+            if st.form_submit_button("Valider le mapping"):
+                engine.remember_mapping(tuple(map(str, df_raw.columns)), mapping)
+        dataset_key = ("upload", engine.upload_cache_key(file_hash, mapping))
     else:
         st.info("📊 Veuillez importer un fichier ou utiliser les données de démonstration")
         st.stop()
     
-    # Application du mapping
-    if mapping:
-        rename_dict = {v: k for k, v in mapping.items() if v is not None}
-        df = df_raw.rename(columns=rename_dict)
-        df["date"] = _infer_date_col(df["date"])
-        df = add_month_start(df)
-        df_kpi = compute_kpis(df)
+    # Application du mapping (les imports typés sont relus depuis le cache Parquet)
+    if use_demo_data:
+        df_kpi = cached_demo_kpis(dataset_key, df_raw, mapping)
+        kpi_cube = cached_kpi_cube(dataset_key, df_kpi)
+    elif streaming_mode and uploaded_file.name.endswith('.csv'):
+        # Les lignes brutes ne sont jamais toutes en mémoire : le cube sert de données de base
+        kpi_cube = stream_upload_cube(uploaded_file, mapping, int(chunk_rows), dataset_key[1], file_hash)
+        df_kpi = compute_kpis(kpi_cube)
+    else:
+        if streaming_mode:
+            st.sidebar.warning("Le mode streaming n'est disponible que pour les fichiers CSV")
+        df_kpi, kpi_cube = cached_upload_frames(dataset_key[1], file_hash, uploaded_file, mapping)
     
     # Métriques principales
-    agg_global = aggregate_kpis(df_kpi, by=["date"]).sort_values("date")
+    agg_global = engine.rollup_kpis(kpi_cube, by=["date"]).sort_values("date")
     if not agg_global.empty:
         last_row = agg_global.iloc[-1]
         
@@ -3436,6 +4033,11 @@ elif section == "📊 Analyse Data Science":
         if 'solvency_ratio' in last_row:
             col5.metric("Solvabilité", f"{last_row['solvency_ratio']*100:.1f}%")
     
+    # Figures déjà calculées par les onglets, reprises telles quelles par le rapport
+    report_figures = {}
+    # Entrées des figures et tableaux du rapport, reprises dans sa clé de cache
+    report_inputs = {}
+    
     # Onglets d'analyse
     tab1, tab2, tab3, tab4, tab5 = st.tabs(["📈 KPI Dynamiques", "🔮 Prévisions", "🧪 Stress Tests", "🗂️ Structure Portefeuille", "📤 Export"])
     
@@ -3453,7 +4055,7 @@ elif section == "📊 Analyse Data Science":
         selected_dims = st.multiselect("Regrouper par", dimensions, default=dimensions[:1] if dimensions else [])
         
         if selected_dims:
-            grouped_data = aggregate_kpis(df_kpi, by=["date"] + selected_dims)
+            grouped_data = engine.rollup_kpis(kpi_cube, by=["date"] + selected_dims)
             
             # Sélecteur de KPI
             kpi_options = {
@@ -3464,20 +4066,31 @@ elif section == "📊 Analyse Data Science":
                 "Cession Ratio": "cession_ratio"
             }
             selected_kpi = st.selectbox("KPI à analyser", list(kpi_options.keys()))
+            report_inputs["kpi"] = selected_kpi
             kpi_column = kpi_options[selected_kpi]
             
             fig = px.line(grouped_data, x="date", y=kpi_column, color=selected_dims[0], 
                          title=f"Évolution du {selected_kpi} par {selected_dims[0]}",
                          markers=True)
             st.plotly_chart(fig, width='stretch')
+            report_figures[f"{selected_kpi} par {selected_dims[0]}"] = fig
             
             # Heatmap des corrélations
             st.subheader("📊 Matrice de Corrélation")
-            numeric_cols = grouped_data.select_dtypes(include=[np.number]).columns
-            corr_matrix = grouped_data[numeric_cols].corr()
-            fig_corr = px.imshow(corr_matrix, text_auto=True, aspect="auto",
-                               title="Corrélations entre Variables Numériques")
+            col_c1, col_c2 = st.columns(2)
+            with col_c1:
+                corr_top_k = st.slider("Variables affichées (les plus variables)", 4, 30,
+                                       engine.CORR_MAX_FEATURES)
+            with col_c2:
+                corr_cluster = st.checkbox("Ordonner par classification hiérarchique", value=True)
+            report_inputs["correlation"] = (corr_top_k, corr_cluster)
+            corr_matrix = cached_correlation(dataset_key, tuple(selected_dims), corr_top_k,
+                                             corr_cluster, grouped_data)
+            fig_corr = px.imshow(corr_matrix.round(2), text_auto=".2f", aspect="auto",
+                                 zmin=-1, zmax=1, color_continuous_scale="RdBu_r",
+                                 title="Corrélations entre Variables Numériques")
             st.plotly_chart(fig_corr, width='stretch')
+            report_figures["Matrice de corrélation"] = fig_corr
     
     with tab2:
         st.subheader("🔮 Prévisions SARIMAX")
@@ -3488,54 +4101,72 @@ elif section == "📊 Analyse Data Science":
         forecast_dim = st.selectbox("Dimension de prévision", 
                                    ["Global"] + [d for d in ["lob", "region"] if d in df_kpi.columns])
         
-        def generate_forecast(data_subset, target, steps):
-            """Génère les prévisions pour un sous-ensemble de données"""
-            aggregated = aggregate_kpis(data_subset, by=["date"]).sort_values("date")
-            if aggregated.empty:
-                return pd.DataFrame()
-                
-            ts_data = aggregated.set_index("date")[target]
-            
-            # Déterminer le nombre de pas selon la fréquence
-            if freq == "Trimestrielle":
-                steps_calc = 4 * steps
-            elif freq == "Mensuelle":
-                steps_calc = 12 * steps
-            else:  # Annuelle
-                steps_calc = steps
-                
-            forecast = sarimax_forecast(ts_data, steps_calc)
-            
-            # Préparation des résultats
+        col_o1, col_o2 = st.columns(2)
+        with col_o1:
+            auto_order = st.checkbox("Ordre SARIMAX automatique", value=False,
+                                     help="Recherche (p,d,q)(P,D,Q,s) sur une grille bornée, en parallèle")
+        with col_o2:
+            order_criterion = st.selectbox("Critère de sélection", ["aic", "bic"], disabled=not auto_order)
+        
+        # Déterminer le nombre de pas selon la fréquence
+        if freq == "Trimestrielle":
+            steps_calc = 4 * forecast_years
+        elif freq == "Mensuelle":
+            steps_calc = 12 * forecast_years
+        else:  # Annuelle
+            steps_calc = forecast_years
+        
+        # Séries par segment, extraites du cube en une seule agrégation
+        if forecast_dim == "Global":
+            rolled = engine.rollup_kpis(kpi_cube, by=["date"]).sort_values("date")
+            series = {"Global": rolled.set_index("date")[target_var]} if not rolled.empty else {}
+        else:
+            rolled = engine.rollup_kpis(kpi_cube, by=[forecast_dim, "date"]).sort_values("date")
+            series = {val: grp.set_index("date")[target_var]
+                      for val, grp in rolled.groupby(forecast_dim, observed=True, sort=False)}
+        
+        season_length = {"Trimestrielle": 4, "Mensuelle": 12}.get(freq, 0)
+        if auto_order:
+            forecast_kwargs = {"order": "auto", "season_length": season_length, "criterion": order_criterion}
+        else:
+            forecast_kwargs = {}
+        
+        # Après l'ajout d'une période, seules les séries modifiées sont réajustées
+        a_reajuster = engine.stale_forecasts(series, steps_calc, **forecast_kwargs)
+        if series:
+            st.caption(f"♻️ {len(series) - len(a_reajuster)}/{len(series)} prévisions reprises du cache "
+                       f"(séries inchangées)")
+        
+        # Les graphiques se remplissent au fur et à mesure des ajustements (pool de processus)
+        placeholders = {val: st.empty() for val in series}
+        for val, forecast in engine.forecast_segments(series, steps_calc, **forecast_kwargs):
+            ts_data = series[val]
             historical = pd.DataFrame({
                 'date': ts_data.index,
                 'value': ts_data.values,
                 'type': 'Historique'
             })
-            
             future = pd.DataFrame({
                 'date': forecast.index,
                 'value': forecast.values,
                 'type': 'Prévision'
             })
-            
-            return pd.concat([historical, future], ignore_index=True)
-        
-        if forecast_dim == "Global":
-            forecast_data = generate_forecast(df_kpi, target_var, forecast_years)
-            if not forecast_data.empty:
-                fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                     title=f"Prévision {target_var} - Global")
-                st.plotly_chart(fig_forecast, width='stretch')
-        else:
-            unique_vals = df_kpi[forecast_dim].dropna().unique()
-            for val in unique_vals:
-                subset = df_kpi[df_kpi[forecast_dim] == val]
-                forecast_data = generate_forecast(subset, target_var, forecast_years)
-                if not forecast_data.empty:
-                    fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                         title=f"Prévision {target_var} - {forecast_dim}: {val}")
-                    st.plotly_chart(fig_forecast, width='stretch')
+            forecast_data = pd.concat([historical, future], ignore_index=True)
+            title = f"Prévision {target_var} - Global" if forecast_dim == "Global" else f"Prévision {target_var} - {forecast_dim}: {val}"
+            if len(ts_data.dropna()) < engine.SARIMAX_MIN_POINTS:
+                title += f" · prévision naïve (< {engine.SARIMAX_MIN_POINTS} périodes)"
+            elif auto_order:
+                best = engine.auto_sarimax_order(ts_data, season_length=season_length, criterion=order_criterion)
+                title += f" · SARIMAX{best['order']}{best['seasonal']}"
+            fig_forecast = px.line(forecast_data, x='date', y='value', color='type', title=title)
+            placeholders[val].plotly_chart(fig_forecast, width='stretch')
+            report_figures[title] = fig_forecast
+        
+        if auto_order and forecast_dim == "Global" and series:
+            best = engine.auto_sarimax_order(series["Global"], season_length=season_length, criterion=order_criterion)
+            if best["fitted"]:
+                with st.expander("🔎 Candidats évalués"):
+                    st.dataframe(best["candidates"].astype({"order": str, "seasonal": str}), width='stretch')
     
     with tab3:
         st.subheader("🧪 Tests de Résistance (Stress Tests)")
@@ -3548,22 +4179,10 @@ elif section == "📊 Analyse Data Science":
         with col3:
             cat_event = st.slider("Événement CAT (multiplicateur)", 1.0, 10.0, 3.0)
         
-        # Application des chocs
-        df_stress = df_kpi.copy()
-        
-        if "claims_count" in df_stress.columns:
-            df_stress["claims_count"] = df_stress["claims_count"] * (1 + freq_shock/100)
-            
-        df_stress["incurred_claims"] = df_stress["incurred_claims"] * (1 + sev_shock/100)
-        
-        # Application d'un événement CAT sur la dernière période
-        last_date = df_stress["date"].max()
-        cat_mask = df_stress["date"] == last_date
-        df_stress.loc[cat_mask, "incurred_claims"] = df_stress.loc[cat_mask, "incurred_claims"] * cat_event
-        
-        # Comparaison baseline vs stress
-        base_kpi = aggregate_kpis(df_kpi, by=["date"])
-        stress_kpi = aggregate_kpis(df_stress, by=["date"])
+        # Application des chocs sur les mesures agrégées (sans copie du portefeuille)
+        base_kpi = engine.rollup_kpis(kpi_cube, by=["date"]).sort_values("date")
+        scenarios = engine.stress_scenarios(base_kpi, [0.0, freq_shock / 100], [0.0, sev_shock / 100], [1.0, cat_event])
+        stress_kpi = pd.DataFrame({"date": scenarios["dates"], "combined_ratio": scenarios["combined_ratio_path"][1]})
         
         col1, col2 = st.columns(2)
         with col1:
@@ -3574,40 +4193,152 @@ elif section == "📊 Analyse Data Science":
             fig_stress = px.line(stress_kpi, x="date", y="combined_ratio",
                                title="Combined Ratio - Stress Test")
             st.plotly_chart(fig_stress, width='stretch')
+        report_figures[f"Stress test (fréquence {freq_shock:+d} %, sévérité {sev_shock:+d} %, CAT x{cat_event})"] = fig_stress
         
-        # Impact sur la solvabilité
+        # Impact sur la solvabilité (sinistres additionnels imputés sur les fonds propres)
         if {"scr", "own_funds"}.issubset(df_kpi.columns):
-            base_solv = base_kpi["own_funds"].sum() / base_kpi["scr"].sum()
-            stress_solv = stress_kpi["own_funds"].sum() / stress_kpi["scr"].sum()
+            base_solv, stress_solv = scenarios["solvency_ratio"]
             
             st.metric("Ratio de Solvabilité Baseline", f"{base_solv:.2%}")
             st.metric("Ratio de Solvabilité Stress", f"{stress_solv:.2%}", 
                      delta=f"{(stress_solv - base_solv):.2%}")
+        
+        # Matrice de scénarios : toutes les combinaisons en une passe vectorisée
+        st.markdown("### 🧮 Matrice de Scénarios")
+        col_g1, col_g2, col_g3 = st.columns(3)
+        with col_g1:
+            freq_range = st.slider("Plage choc fréquence (%)", -50, 200, (-20, 100))
+            freq_step = st.number_input("Pas fréquence (%)", 1, 50, 5)
+        with col_g2:
+            sev_range = st.slider("Plage choc sévérité (%)", -50, 300, (-20, 150))
+            sev_step = st.number_input("Pas sévérité (%)", 1, 50, 5)
+        with col_g3:
+            cat_grid = st.multiselect("Multiplicateurs CAT", [1.0, 1.5, 2.0, 3.0, 5.0, 10.0], default=[1.0, 3.0, 5.0])
+            cat_view = st.selectbox("CAT affiché", sorted(cat_grid) if cat_grid else [1.0])
+        
+        report_inputs["scenarios"] = (freq_range, freq_step, sev_range, sev_step, sorted(cat_grid), cat_view)
+        freq_axis = np.arange(freq_range[0], freq_range[1] + freq_step, freq_step) / 100
+        sev_axis = np.arange(sev_range[0], sev_range[1] + sev_step, sev_step) / 100
+        cat_axis = np.array(sorted(cat_grid) if cat_grid else [1.0])
+        grid = engine.stress_grid(base_kpi, freq_axis, sev_axis, cat_axis)
+        k = int(np.searchsorted(cat_axis, cat_view))
+        st.caption(f"{grid['combined_ratio'].size:,} scénarios évalués")
+        
+        labels = {"x": "Choc sévérité", "y": "Choc fréquence"}
+        col_h1, col_h2 = st.columns(2)
+        with col_h1:
+            fig_cr = px.imshow(grid["combined_ratio_last"][:, :, k], x=sev_axis, y=freq_axis, labels=labels,
+                               origin="lower", aspect="auto", color_continuous_scale="RdYlGn_r",
+                               title=f"Combined Ratio dernière période (CAT x{cat_view})")
+            st.plotly_chart(fig_cr, width='stretch')
+            report_figures["Matrice de scénarios - Combined Ratio"] = fig_cr
+        with col_h2:
+            if {"scr", "own_funds"}.issubset(df_kpi.columns):
+                fig_solv = px.imshow(grid["solvency_ratio"][:, :, k], x=sev_axis, y=freq_axis, labels=labels,
+                                     origin="lower", aspect="auto", color_continuous_scale="RdYlGn",
+                                     title=f"Ratio de Solvabilité (CAT x{cat_view})")
+                st.plotly_chart(fig_solv, width='stretch')
+                report_figures["Matrice de scénarios - Solvabilité"] = fig_solv
+        
+        # SCR formule standard recalculé depuis les volumes nets par ligne et région
+        st.markdown("### 🛡️ SCR Formule Standard")
+        col_s1, col_s2 = st.columns(2)
+        with col_s1:
+            cession_range = st.slider("Plage taux de cession (%)", 0, 90, (0, 60))
+        with col_s2:
+            reserve_range = st.slider("Plage choc provisions (%)", -30, 100, (-20, 50))
+        report_inputs["scr"] = (cession_range, reserve_range)
+        cession_axis = np.arange(cession_range[0], cession_range[1] + 1, 2) / 100
+        reserve_axis = np.arange(reserve_range[0], reserve_range[1] + 1, 2) / 100
+        cession_grid, reserve_grid = np.meshgrid(cession_axis, reserve_axis, indexing="ij")
+        scr_base = engine.portfolio_scr(kpi_cube)
+        scr_grid = engine.portfolio_scr(kpi_cube, cession_grid.ravel(), reserve_grid.ravel())
+        st.caption(f"{scr_grid['scr'].size:,} combinaisons scénario x période agrégées "
+                   f"sur {len(engine.SCR_MODULES)} modules")
+        
+        col_m1, col_m2 = st.columns(2)
+        with col_m1:
+            modules_df = pd.DataFrame(scr_base["modules"][0], columns=engine.SCR_MODULES)
+            modules_df["date"] = scr_base["dates"]
+            fig_modules = px.area(modules_df.melt(id_vars="date", var_name="module", value_name="charge"),
+                                  x="date", y="charge", color="module",
+                                  title="Charges par module (avant diversification)")
+            st.plotly_chart(fig_modules, width='stretch')
+        with col_m2:
+            has_own_funds = "own_funds" in kpi_cube.columns
+            surface = scr_grid["solvency_ratio" if has_own_funds else "scr"][:, -1].reshape(cession_grid.shape)
+            fig_scr = px.imshow(surface, x=reserve_axis, y=cession_axis, origin="lower", aspect="auto",
+                                labels={"x": "Choc provisions", "y": "Taux de cession"},
+                                color_continuous_scale="RdYlGn" if has_own_funds else "RdYlGn_r",
+                                title="Ratio de solvabilité (formule standard)" if has_own_funds
+                                else "SCR formule standard (€)")
+            st.plotly_chart(fig_scr, width='stretch')
+            report_figures["SCR formule standard"] = fig_scr
+        if len(scr_base["dates"]):
+            col_k1, col_k2, col_k3 = st.columns(3)
+            col_k1.metric("SCR formule standard", f"{scr_base['scr'][0, -1]:,.0f} €")
+            col_k2.metric("Bénéfice de diversification",
+                          f"{scr_base['modules'][0, -1].sum() - scr_base['bscr'][0, -1]:,.0f} €")
+            if "scr" in kpi_cube.columns:
+                col_k3.metric("SCR déclaré (données)", f"{scr_base['input_scr'][-1]:,.0f} €")
     
     with tab4:
         st.subheader("🗂️ Structure du Portefeuille")
         
         # Répartition par LOB
         if "lob" in df_kpi.columns:
-            lob_analysis = aggregate_kpis(df_kpi, by=["lob"])
+            lob_analysis = engine.rollup_kpis(kpi_cube, by=["lob"])
             fig_lob = px.pie(lob_analysis, values="earned_premium", names="lob",
                            title="Répartition des Primes par Ligne de Business")
             st.plotly_chart(fig_lob, width='stretch')
+            report_figures["Répartition par ligne de business"] = fig_lob
         
         # Répartition géographique
         if "region" in df_kpi.columns:
-            region_analysis = aggregate_kpis(df_kpi, by=["region"])
+            region_analysis = engine.rollup_kpis(kpi_cube, by=["region"])
             fig_region = px.bar(region_analysis, x="region", y="earned_premium",
                               title="Primes par Région")
             st.plotly_chart(fig_region, width='stretch')
         
         # Analyse fréquence vs sévérité
         if {"frequency", "severity"}.issubset(df_kpi.columns):
-            freq_sev_analysis = aggregate_kpis(df_kpi, by=["lob"] if "lob" in df_kpi.columns else ["region"])
+            freq_sev_analysis = engine.rollup_kpis(kpi_cube, by=["lob"] if "lob" in df_kpi.columns else ["region"])
             fig_scatter = px.scatter(freq_sev_analysis, x="frequency", y="severity",
                                    size="earned_premium", hover_name=freq_sev_analysis.index,
                                    title="Fréquence vs Sévérité par Segment")
             st.plotly_chart(fig_scatter, width='stretch')
+        
+        # Crédibilité Bühlmann-Straub : un loss ratio crédibilisé par (cédant, ligne)
+        if {"cedant", "lob"}.issubset(kpi_cube.columns):
+            st.markdown("### ⚖️ Crédibilité Bühlmann-Straub")
+            collectif = st.radio("Collectif de référence", ["lob", "Portefeuille"], horizontal=True,
+                                 format_func=lambda c: "Par ligne de business" if c == "lob" else "Portefeuille entier")
+            report_inputs["credibility"] = collectif
+            credibility = engine.buhlmann_straub(cached_credibility_stats(dataset_key, kpi_cube),
+                                                 collective="lob" if collectif == "lob" else None)
+            structure = credibility.attrs["structure"]
+            st.caption(f"{len(credibility):,} groupes (cédant, ligne) crédibilisés en une passe")
+            st.dataframe(structure.rename(columns={
+                "sigma2": "σ² (intra-groupe)", "a": "a (inter-groupes)", "k": "k = σ²/a",
+                "collective_mean": "Loss ratio collectif"}), width='stretch')
+            
+            col_cr1, col_cr2 = st.columns(2)
+            with col_cr1:
+                fig_z = px.scatter(credibility.reset_index(), x="exposure", y="credibility", color="lob",
+                                   hover_data=["cedant", "n_periods"], log_x=True,
+                                   labels={"exposure": "Primes acquises cumulées (€)", "credibility": "Z"},
+                                   title="Facteur de crédibilité selon le volume")
+                st.plotly_chart(fig_z, width='stretch')
+            with col_cr2:
+                fig_lr = px.scatter(credibility.reset_index(), x="loss_ratio", y="credibility_loss_ratio",
+                                    color="lob", hover_data=["cedant"],
+                                    labels={"loss_ratio": "Loss ratio observé",
+                                            "credibility_loss_ratio": "Loss ratio crédibilisé"},
+                                    title="Loss ratio observé vs crédibilisé")
+                st.plotly_chart(fig_lr, width='stretch')
+            st.dataframe(credibility.sort_values("exposure", ascending=False).head(200)
+                         .style.format({"exposure": "{:,.0f}", "loss_ratio": "{:.1%}", "credibility": "{:.2f}",
+                                        "credibility_loss_ratio": "{:.1%}"}), width='stretch')
     
     with tab5:
         st.subheader("📤 Export des Données et Rapports")
@@ -3615,27 +4346,43 @@ elif section == "📊 Analyse Data Science":
         # Export CSV
         st.markdown("### 📊 Données Brutes avec KPI")
         st.dataframe(df_kpi.head(100))
-        download_button(df_kpi, "donnees_reassurance_avec_kpi.csv")
+        download_button(df_kpi, "donnees_reassurance_avec_kpi.csv", dataset_key)
         
         # Export agrégé
         st.markdown("### 📈 Données Agrégées")
-        aggregated_data = aggregate_kpis(df_kpi, by=["date"])
+        aggregated_data = engine.rollup_kpis(kpi_cube, by=["date"])
         st.dataframe(aggregated_data)
-        download_button(aggregated_data, "kpi_agreges.csv")
+        download_button(aggregated_data, "kpi_agreges.csv", dataset_key)
+        
+        # Rapport HTML / PDF produit en arrière-plan à partir des tableaux et figures déjà calculés
+        st.markdown("### 📄 Rapport d'Analyse")
+        report_fmt = st.radio("Format du rapport", list(engine.REPORT_FORMATS), horizontal=True,
+                              format_func=str.upper)
+        report_params = {
+            "format": report_fmt,
+            "figures": sorted(report_figures),
+            "selection": [selected_dims, target_var, forecast_dim, auto_order, order_criterion,
+                          forecast_years, freq_shock, sev_shock, cat_event],
+            "inputs": report_inputs,
+        }
+        report_id = engine.report_key(dataset_key, report_params)
+        
+        def report_sections():
+            sections = [("text", "Synthèse", build_report_summary(agg_global)),
+                        ("table", "KPI agrégés par période", aggregated_data)]
+            if {"scr", "own_funds"}.issubset(df_kpi.columns):
+                sections.append(("table", "Tests de résistance", pd.DataFrame({
+                    "scénario": ["Baseline", "Stress"],
+                    "combined_ratio": scenarios["combined_ratio"],
+                    "solvency_ratio": scenarios["solvency_ratio"],
+                })))
+            sections += [("figure", name, fig.to_json()) for name, fig in report_figures.items()]
+            return sections
         
-        # Rapport PDF (simplifié)
-        st.markdown("### 📄 Rapport PDF")
         if st.button("Générer le Rapport d'Analyse"):
-            # Simulation de génération de rapport
-            st.success("📋 Rapport généré avec succès!")
-            st.info("""
-            **Contenu du rapport:**
-            - Synthèse des KPI principaux
-            - Analyse des tendances
-            - Prévisions sur 3 ans
-            - Tests de résistance
-            - Recommandations stratégiques
-            """)
+            engine.submit_report(report_id, report_sections, report_fmt, title="Rapport d'Analyse Réassurance")
+        if engine.report_job(report_id, report_fmt) is not None:
+            report_status(report_id, report_fmt)
 
 # =============================================================================
 # SECTION 11: CALCULATEURS AVANCÉS
@@ -3681,81 +4428,173 @@ elif section == "🧮 Calculateurs Avancés":
             </div>
             """, unsafe_allow_html=True)
             
+            # Contraintes (modifiables sans relancer la simulation)
+            min_solvabilite = st.slider("Solvabilité minimale (%)", 50, 250, 100) / 100
+            max_ruine = st.slider("Probabilité de ruine maximale (%)", 0.1, 5.0, 0.5, step=0.1) / 100
+            max_cout = st.slider("Coût réassurance maximal (% primes)", 1, 40, 15) / 100
+            min_retention = st.number_input("Rétention minimale (€)", value=500000, step=100000)
+            
+            with st.expander("⚙️ Paramètres de tarification et de simulation"):
+                commission_qs = st.slider("Commission de quote-part (%)", 0, 40, 25) / 100
+                chargement_xl = st.slider("Chargement XL (% de la perte attendue)", 0, 200, 30) / 100
+                chargement_sl = st.slider("Chargement Stop Loss (% de la perte attendue)", 0, 200, 50) / 100
+                portee_sl = st.slider("Portée Stop Loss (% des primes nettes)", 10, 100, 50) / 100
+                n_annees_opti = st.select_slider("Années simulées", [20_000, 50_000, 100_000, 200_000], value=100_000)
+            
             # Lancement de l'optimisation
             if st.button("🚀 Lancer l'optimisation"):
-                # Simulation d'optimisation
-                st.subheader("📊 Résultats de l'Optimisation")
+                st.session_state["optimisation_lancee"] = True
+        
+        if st.session_state.get("optimisation_lancee"):
+            # Grille de recherche : quote-part x rétention XL x priorité stop loss (inf = pas de couverture)
+            taux_qs = tuple(np.round(np.arange(0, 0.55, 0.05), 2))
+            retentions = (250_000.0, 500_000.0, 750_000.0, 1_000_000.0, 1_500_000.0, 2_000_000.0, 3_000_000.0, np.inf)
+            priorites_sl = (1.0, 1.1, 1.2, 1.3, 1.5, np.inf)
+            
+            candidats = cached_programme_candidates(
+                float(primes_portefeuille), float(sinistres_attendus), volatilite_sinistres / 100,
+                float(capital_disponible), cout_capital / 100, n_annees_opti, taux_qs, retentions, priorites_sl,
+                portee_sl, commission_qs, chargement_xl, chargement_sl
+            )
+            meilleur, admissibles = engine.select_programme(candidats, min_solvabilite, max_ruine, max_cout, min_retention)
+            brut = candidats[(candidats["qs_rate"] == 0) & ~np.isfinite(candidats["retention"])
+                             & ~np.isfinite(candidats["sl_priority"])].iloc[0]
+            
+            st.subheader("📊 Résultats de l'Optimisation")
+            st.caption(f"{len(candidats):,} structures évaluées sur {n_annees_opti:,} années simulées · "
+                       f"{len(admissibles):,} respectent les contraintes")
+            
+            if meilleur is None:
+                st.warning("Aucune structure ne respecte toutes les contraintes : assouplissez-les ou élargissez la grille.")
+            else:
+                gain_capital = brut["scr"] - meilleur["scr"]
+                roe_brut = brut["expected_result"] / capital_disponible
+                roe_net = meilleur["expected_result"] / capital_disponible
+                retention_txt = f"{meilleur['retention']:,.0f} €" if np.isfinite(meilleur["retention"]) else "Pas de XL"
+                sl_txt = f"{meilleur['sl_priority']:.0%} des primes nettes" if np.isfinite(meilleur["sl_priority"]) else "Pas de Stop Loss"
                 
                 resultats_opti = {
-                    'Paramètre': ['Quote-Share optimal', 'Rétention optimale', 'Stop Loss priorité', 'Coût réassurance', 'SCR après réassurance', 'Gain en capital'],
-                    'Valeur': ['25%', '750k€', '115% des primes', '12.5% des primes', '2.1M€', '450k€'],
-                    'Impact': ['↘️ Coût -15%', '↗️ Protection +10%', '🛡️ Sécurité +20%', '💰 Économie 250k€', '📈 Solvabilité +25%', '📊 ROE +2.5%']
+                    'Paramètre': ['Quote-Share optimal', 'Rétention optimale', 'Stop Loss priorité', 'Coût réassurance',
+                                  'SCR après réassurance', 'Gain en capital', 'Ratio de solvabilité', 'Probabilité de ruine'],
+                    'Valeur': [f"{meilleur['qs_rate']:.0%}", retention_txt, sl_txt,
+                               f"{meilleur['reinsurance_cost_pct']:.1%} des primes", f"{meilleur['scr']:,.0f} €",
+                               f"{gain_capital:,.0f} €", f"{meilleur['solvency_ratio']:.0%}", f"{meilleur['ruin_prob']:.2%}"],
+                    'Brut (sans réassurance)': ['0%', 'Pas de XL', 'Pas de Stop Loss', '0.0% des primes',
+                                                f"{brut['scr']:,.0f} €", "-", f"{brut['solvency_ratio']:.0%}",
+                                                f"{brut['ruin_prob']:.2%}"]
                 }
-                
                 st.dataframe(pd.DataFrame(resultats_opti), width='stretch')
                 
                 # Graphique des gains
                 gains_data = {
-                    'Élément': ['Économie coût réassurance', 'Gain en capital libéré', 'Amélioration rentabilité', 'Réduction volatilité'],
-                    'Montant (k€)': [250, 450, 180, 320]
+                    'Élément': ['Coût net réassurance', 'Gain en capital libéré', 'Amélioration EVA', 'Réduction volatilité'],
+                    'Montant (k€)': [-meilleur["reinsurance_cost"] / 1000, gain_capital / 1000,
+                                     (meilleur["eva"] - brut["eva"]) / 1000,
+                                     (brut["result_std"] - meilleur["result_std"]) / 1000]
                 }
-                
                 fig_gains = px.bar(gains_data, x='Élément', y='Montant (k€)',
-                                 title="Gains de l'Optimisation")
+                                 title=f"Gains de l'Optimisation (ROE {roe_brut:.1%} → {roe_net:.1%})")
                 st.plotly_chart(fig_gains, width='stretch')
+            
+            candidats_aff = candidats.assign(Admissible=candidats.index.isin(admissibles.index))
+            fig_front = px.scatter(candidats_aff, x="reinsurance_cost_pct", y="scr", color="Admissible",
+                                   hover_data=["qs_rate", "retention", "sl_priority", "ruin_prob"],
+                                   labels={"reinsurance_cost_pct": "Coût réassurance (% primes)", "scr": "SCR (€)"},
+                                   title="Coût de réassurance vs capital requis")
+            st.plotly_chart(fig_front, width='stretch')
     
     with tab2:
         st.subheader("💰 Analyse de Rentabilité par Ligne de Business")
+        st.caption("Capital alloué sur une simulation commune de toutes les lignes (copule à facteurs "
+                   "par segment), puis ROE calculé pour l'ensemble du portefeuille en une passe.")
         
-        # Calculateur ROE par ligne
-        lignes_business = st.multiselect("Lignes de business à analyser", 
-                                       ['Auto', 'Habitation', 'Santé', 'RC Pro', 'Vie'],
-                                       default=['Auto', 'Habitation'])
-        
-        if lignes_business:
-            data_roe = []
-            for ligne in lignes_business:
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    primes = st.number_input(f"Primes {ligne} (€)", value=2000000, key=f"primes_{ligne}")
-                with col2:
-                    sinistres = st.number_input(f"Sinistres {ligne} (€)", value=1400000, key=f"sinistres_{ligne}")
-                with col3:
-                    capital_alloue = st.number_input(f"Capital alloué {ligne} (€)", value=800000, key=f"capital_{ligne}")
-                
-                resultat_technique = primes - sinistres
-                roe = (resultat_technique / capital_alloue) * 100 if capital_alloue > 0 else 0
-                
-                data_roe.append({
-                    'Ligne': ligne,
-                    'Primes': primes,
-                    'Sinistres': sinistres,
-                    'Résultat Technique': resultat_technique,
-                    'Capital Alloué': capital_alloue,
-                    'ROE Technique': roe
-                })
-            
-            df_roe = pd.DataFrame(data_roe)
-            st.dataframe(df_roe, width='stretch')
-            
-            # Graphique ROE
-            fig_roe = px.bar(df_roe, x='Ligne', y='ROE Technique', 
-                           title="Rentabilité par Ligne de Business")
-            st.plotly_chart(fig_roe, width='stretch')
-            
-            # Analyse de la performance
-            roe_moyen = df_roe['ROE Technique'].mean()
-            meilleure_ligne = df_roe.loc[df_roe['ROE Technique'].idxmax()]
-            moins_rentable = df_roe.loc[df_roe['ROE Technique'].idxmin()]
-            
-            col_perf1, col_perf2, col_perf3 = st.columns(3)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            source_lignes = st.radio("Lignes analysées", ["Portefeuille démo (LoB × région × cédante)",
+                                                          "Saisie manuelle"], key="roe_source")
+        with col2:
+            methode_allocation = st.radio("Allocation du capital", ["Euler (TVaR)", "Variance-covariance"],
+                                          key="roe_methode")
+            niveau = st.select_slider("Niveau de confiance", [0.95, 0.99, 0.995, 0.999], value=0.995,
+                                      key="roe_alpha")
+        with col3:
+            cout_capital_roe = st.slider("Coût du capital (%)", 4, 15, 10, key="roe_coc") / 100
+            rendement_capital = st.slider("Rendement des fonds propres (%)", 0.0, 5.0, 2.0, 0.5,
+                                          key="roe_rendement") / 100
+            n_sims_roe = st.select_slider("Simulations", [5_000, 10_000, 20_000, 50_000], value=10_000,
+                                          key="roe_sims")
+        
+        if source_lignes.startswith("Portefeuille"):
+            n_cedantes_roe = st.slider("Nombre de cédantes", 1, 100, 30, key="roe_cedantes")
+            lignes_roe = cached_line_table(n_cedantes_roe)
+            capital_total = None
+            if st.checkbox("Caler le capital total sur le SCR déclaré", value=True, key="roe_scr"):
+                capital_total = float(lignes_roe["scr"].sum())
+        else:
+            lignes_defaut = pd.DataFrame({
+                "lob": ['Auto', 'Habitation', 'Santé', 'RC Pro', 'Vie'],
+                "premium": [2_000_000.0] * 5, "claims": [1_400_000.0] * 5,
+                "expenses": [400_000.0] * 5, "cv": [0.15, 0.20, 0.10, 0.35, 0.08],
+            })
+            lignes_roe = st.data_editor(lignes_defaut, num_rows="dynamic", width='stretch', key="roe_lignes",
+                                        column_config={"lob": "Ligne", "premium": "Primes (€)",
+                                                       "claims": "Sinistres attendus (€)",
+                                                       "expenses": "Frais (€)", "cv": "CV sinistres"})
+            lignes_roe = lignes_roe.dropna(subset=["lob", "premium", "claims"]).reset_index(drop=True)
+            lignes_roe["cv"] = lignes_roe["cv"].fillna(0.0)
+            capital_saisi = st.number_input("Capital total à allouer (€, 0 = VaR simulée)", value=0.0,
+                                            step=100_000.0, key="roe_capital")
+            capital_total = capital_saisi or None
+        
+        if not lignes_roe.empty:
+            simulation_lignes = cached_line_simulation(
+                tuple(lignes_roe["claims"]), tuple(lignes_roe["cv"]), tuple(lignes_roe["lob"]), n_sims_roe)
+            df_roe = engine.line_profitability(
+                lignes_roe, simulation_lignes, "euler" if methode_allocation.startswith("Euler") else "varcovar",
+                niveau, capital_total, cout_capital_roe, rendement_capital)
+            portefeuille = df_roe.attrs["portfolio"]
+            
+            # Vue par ligne de business (agrégation des segments)
+            par_lob = df_roe.groupby("lob")[["premium", "claims", "technical_result", "capital",
+                                             "standalone_capital", "eva"]].sum()
+            par_lob["roe"] = (par_lob["technical_result"] + rendement_capital * par_lob["capital"]) / par_lob["capital"]
+            
+            col_perf1, col_perf2, col_perf3, col_perf4 = st.columns(4)
             with col_perf1:
-                st.metric("📈 ROE Moyen", f"{roe_moyen:.1f}%")
+                st.metric("📈 ROE Portefeuille", f"{portefeuille['roe'] * 100:.1f}%")
             with col_perf2:
-                st.metric("🏆 Meilleure ligne", f"{meilleure_ligne['Ligne']} ({meilleure_ligne['ROE Technique']:.1f}%)")
+                st.metric("🏦 Capital alloué", f"{portefeuille['capital'] / 1e6:,.1f} M€",
+                          help=f"{portefeuille['risk_measure']} à {niveau:.1%} moins la charge attendue")
             with col_perf3:
-                st.metric("📉 Ligne à améliorer", f"{moins_rentable['Ligne']} ({moins_rentable['ROE Technique']:.1f}%)")
+                st.metric("🔀 Bénéfice de diversification",
+                          f"{(1 - portefeuille['capital'] / portefeuille['standalone_capital']) * 100:.1f}%",
+                          help=f"Capitaux autonomes et alloués mesurés en {portefeuille['risk_measure']}")
+            with col_perf4:
+                st.metric("💶 EVA totale", f"{df_roe['eva'].sum() / 1e6:,.1f} M€")
+            
+            fig_roe = px.bar(par_lob.reset_index(), x='lob', y=par_lob["roe"].values * 100,
+                             labels={'lob': 'Ligne', 'y': 'ROE (%)'},
+                             title="Rentabilité par Ligne de Business")
+            fig_roe.add_hline(y=cout_capital_roe * 100, line_dash="dash", annotation_text="Coût du capital")
+            st.plotly_chart(fig_roe, width='stretch')
+            
+            if len(df_roe) > len(par_lob):
+                fig_nuage = px.scatter(df_roe, x="capital", y=df_roe["roe"] * 100, color="lob",
+                                       size=df_roe["premium"].clip(lower=0),
+                                       hover_data=[c for c in ("region", "cedant") if c in df_roe],
+                                       labels={"capital": "Capital alloué (€)", "y": "ROE (%)"},
+                                       title=f"ROE et capital des {len(df_roe):,} segments")
+                st.plotly_chart(fig_nuage, width='stretch')
+            
+            meilleure_ligne = par_lob["roe"].idxmax()
+            moins_rentable = par_lob["roe"].idxmin()
+            st.markdown(f"🏆 **Meilleure ligne** : {meilleure_ligne} ({par_lob.loc[meilleure_ligne, 'roe'] * 100:.1f}%) — "
+                        f"📉 **Ligne à améliorer** : {moins_rentable} ({par_lob.loc[moins_rentable, 'roe'] * 100:.1f}%)")
+            
+            colonnes_roe = [c for c in ("lob", "region", "cedant") if c in df_roe] + [
+                "premium", "claims", "technical_result", "standalone_capital", "capital", "roe", "eva"]
+            st.dataframe(df_roe[colonnes_roe].assign(roe=df_roe["roe"] * 100).sort_values("roe", ascending=False),
+                         width='stretch', column_config={"roe": st.column_config.NumberColumn("ROE (%)", format="%.1f")})
 
 # =============================================================================
 # FOOTER
@@ -0,0 +1,3112 @@
+"""Moteurs de calcul de la plateforme de réassurance.
+
+Ce module ne dépend pas de Streamlit : il peut être importé par reassurance.py,
+par les scripts de benchmark ou par des workers de processus.
+"""
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# =============================================================================
+# MOTEUR KPI COLONNAIRE
+# =============================================================================
+
+# Ordre des colonnes KPI (identique à l'ancienne version pandas de compute_kpis)
+KPI_COLUMNS = (
+    "loss_ratio", "acq_ratio", "adm_ratio", "expense_ratio", "combined_ratio",
+    "operating_ratio", "cession_ratio", "retention_ratio", "frequency", "severity",
+    "total_reserves", "reserve_coverage", "solvency_ratio",
+)
+
+# Colonnes sources nécessaires pour les KPI optionnels
+KPI_REQUIRES = {
+    "frequency": ("claims_count", "exposure"),
+    "severity": ("incurred_claims", "claims_count"),
+    "total_reserves": ("ibnr", "rbns"),
+    "reserve_coverage": ("ibnr", "rbns"),
+    "solvency_ratio": ("scr", "own_funds"),
+}
+
+KPI_SOURCES = (
+    "earned_premium", "incurred_claims", "gross_premium", "ceded_premium",
+    "acq_expense", "adm_expense", "investment_income", "claims_count", "exposure",
+    "ibnr", "rbns", "scr", "own_funds",
+)
+
+KPI_CHUNK_ROWS = 1 << 17
+
+
+def available_kpis(columns) -> list:
+    """Liste des KPI calculables à partir des colonnes disponibles."""
+    cols = set(columns)
+    return [k for k in KPI_COLUMNS if set(KPI_REQUIRES.get(k, ())) <= cols]
+
+
+def _as_float_source(s: pd.Series) -> np.ndarray:
+    """Tableau NumPy d'une colonne source, sans copie pour les dtypes numériques natifs."""
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind in "biuf":
+        return s.to_numpy()
+    return s.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _nan_if_zero(a: np.ndarray) -> np.ndarray:
+    return np.where(a == 0, np.nan, a)
+
+
+def _fill0(a: np.ndarray) -> np.ndarray:
+    return np.where(np.isnan(a), 0.0, a)
+
+
+def _kpi_chunk(src: dict, sl: slice, targets: dict):
+    """Calcule les KPI demandés sur une tranche de lignes, en float64."""
+    memo = {}
+
+    def col(name, default=None):
+        if name not in memo:
+            raw = src.get(name)
+            memo[name] = default if raw is None else np.asarray(raw[sl], dtype=np.float64)
+        return memo[name]
+
+    def ep():
+        if "_ep" not in memo:
+            memo["_ep"] = _nan_if_zero(col("earned_premium"))
+        return memo["_ep"]
+
+    def gwp():
+        if "_gwp" not in memo:
+            g = col("gross_premium")
+            memo["_gwp"] = np.nan if g is None else _nan_if_zero(g)
+        return memo["_gwp"]
+
+    formulas = {
+        "loss_ratio": lambda: col("incurred_claims") / ep(),
+        "acq_ratio": lambda: col("acq_expense", 0.0) / ep(),
+        "adm_ratio": lambda: col("adm_expense", 0.0) / ep(),
+        "expense_ratio": lambda: _fill0(kpi("acq_ratio")) + _fill0(kpi("adm_ratio")),
+        "combined_ratio": lambda: _fill0(kpi("loss_ratio")) + kpi("expense_ratio"),
+        "operating_ratio": lambda: kpi("combined_ratio") - col("investment_income", 0.0) / ep(),
+        "cession_ratio": lambda: col("ceded_premium", 0.0) / gwp(),
+        "retention_ratio": lambda: (gwp() - col("ceded_premium", 0.0)) / gwp(),
+        "frequency": lambda: col("claims_count") / _nan_if_zero(col("exposure")),
+        "severity": lambda: col("incurred_claims") / _nan_if_zero(col("claims_count")),
+        "total_reserves": lambda: _fill0(col("ibnr")) + _fill0(col("rbns")),
+        "reserve_coverage": lambda: kpi("total_reserves") / _nan_if_zero(col("incurred_claims")),
+        "solvency_ratio": lambda: col("own_funds") / _nan_if_zero(col("scr")),
+    }
+
+    def kpi(name):
+        key = "kpi:" + name
+        if key not in memo:
+            memo[key] = formulas[name]()
+        return memo[key]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, out in targets.items():
+            out[...] = kpi(name)
+
+
+def compute_kpi_buffer(d: pd.DataFrame, kpis=None, dtype=np.float64, out=None,
+                       chunk_rows: int = KPI_CHUNK_ROWS):
+    """Calcule les KPI dans un buffer (n_kpi, n_lignes) préalloué.
+
+    Les colonnes sources ne sont jamais copiées en entier : le calcul se fait
+    par tranches de `chunk_rows` lignes, les temporaires restent bornés.
+    Retourne (noms_kpi, buffer).
+    """
+    available = available_kpis(d.columns)
+    if kpis is None:
+        names = available
+    else:
+        unknown = [k for k in kpis if k not in KPI_COLUMNS]
+        if unknown:
+            raise KeyError(f"KPI inconnus : {unknown}")
+        names = [k for k in kpis if k in available]
+
+    n = len(d)
+    if out is None:
+        out = np.empty((len(names), n), dtype=dtype)
+    elif out.shape != (len(names), n):
+        raise ValueError(f"Buffer de forme {out.shape}, attendu {(len(names), n)}")
+
+    src = {c: _as_float_source(d[c]) for c in KPI_SOURCES if c in d.columns}
+    for start in range(0, n, chunk_rows):
+        sl = slice(start, min(start + chunk_rows, n))
+        _kpi_chunk(src, sl, {name: out[i, sl] for i, name in enumerate(names)})
+    return names, out
+
+
+def compute_kpis(d: pd.DataFrame, kpis=None, dtype=np.float64,
+                 chunk_rows: int = KPI_CHUNK_ROWS) -> pd.DataFrame:
+    """Calcule les ratios KPI techniques/financiers/risque en une passe NumPy.
+
+    Sans `kpis`, retourne une vue légère de `d` (les colonnes sources ne sont
+    pas recopiées) enrichie de tous les KPI calculables.
+    Avec `kpis`, retourne uniquement les KPI demandés, alignés sur l'index de `d`.
+    """
+    names, buf = compute_kpi_buffer(d, kpis=kpis, dtype=dtype, chunk_rows=chunk_rows)
+    # buf.T est en ordre Fortran : pandas l'enveloppe en un seul bloc sans copie
+    kpi_frame = pd.DataFrame(buf.T, index=d.index, columns=names, copy=False)
+    if kpis is not None:
+        return kpi_frame
+    return pd.concat([d.drop(columns=[c for c in names if c in d.columns]), kpi_frame], axis=1)
+
+
+# =============================================================================
+# CUBE KPI PRÉ-AGRÉGÉ
+# =============================================================================
+
+# Mesures additives : seules celles-ci sont sommées, les ratios sont recalculés
+ADDITIVE_MEASURES = (
+    "gross_premium", "ceded_premium", "earned_premium", "incurred_claims",
+    "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
+    "investment_income", "claims_count", "exposure", "scr", "own_funds",
+)
+CUBE_DIMENSIONS = ("date", "lob", "region", "cedant")
+
+
+def build_kpi_cube(d: pd.DataFrame, dims=CUBE_DIMENSIONS) -> pd.DataFrame:
+    """Cube des mesures additives par (date, lob, region, cedant), à construire une fois."""
+    keys = [c for c in dims if c in d.columns]
+    measures = [c for c in ADDITIVE_MEASURES if c in d.columns]
+    cube = d.groupby(keys, dropna=False, observed=True)[measures].sum().reset_index()
+    for k in keys:
+        if pd.api.types.is_string_dtype(cube[k]):
+            cube[k] = cube[k].astype("category")
+    return cube
+
+
+def rollup_kpis(cube: pd.DataFrame, by=("date",), kpis=None) -> pd.DataFrame:
+    """Agrège le cube sur un sous-ensemble de dimensions et recalcule les ratios."""
+    by = list(by)
+    missing = [c for c in by if c not in cube.columns]
+    if missing:
+        raise KeyError(f"Dimensions absentes du cube : {missing}")
+    measures = [c for c in ADDITIVE_MEASURES if c in cube.columns]
+    grp = cube.groupby(by, dropna=False, observed=True)[measures].sum().reset_index()
+    if kpis is None:
+        return compute_kpis(grp)
+    return pd.concat([grp, compute_kpis(grp, kpis=kpis)], axis=1)
+
+
+
+def stream_kpi_cube(chunks, prepare=None, dims=CUBE_DIMENSIONS, on_chunk=None):
+    """Replie un flux de tranches brutes dans le cube des mesures additives.
+
+    `chunks` itère des DataFrame (ex. pd.read_csv(..., chunksize=n)) et
+    `prepare` type chaque tranche (mapping, dates). Seuls la tranche courante
+    et le cube partiel sont en mémoire. Retourne (cube, statistiques).
+    """
+    cube = None
+    rows = 0
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        rows += len(chunk)
+        part = build_kpi_cube(prepare(chunk) if prepare else chunk, dims)
+        del chunk
+        cube = part if cube is None else build_kpi_cube(pd.concat([cube, part], ignore_index=True), dims)
+        if on_chunk is not None:
+            on_chunk(rows, time.perf_counter() - t0)
+    seconds = time.perf_counter() - t0
+    stats = {"rows": rows, "seconds": seconds, "rows_per_s": rows / seconds if seconds > 0 else float("nan")}
+    return cube, stats
+
+
+
+# =============================================================================
+# INFÉRENCE ET PARSING RAPIDE DES DATES
+# =============================================================================
+
+# Formats candidats, jour avant mois (convention française) en cas d'ambiguïté
+DATE_FORMATS = (
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%m/%d/%Y",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M",
+    "%d/%m/%y", "%Y%m%d", "%Y-%m", "%m/%Y", "%m-%Y", "%b %Y", "%B %Y", "%Y",
+)
+DATE_SAMPLE_SIZE = 500
+DATE_MIN_SUCCESS = 0.9
+
+_QUARTER_RE = r"^\s*(?:(?P<y1>\d{4})\s*[-_/ ]?\s*[QqTt](?P<q1>[1-4])|[QqTt](?P<q2>[1-4])\s*[-_/ ]?\s*(?P<y2>\d{4}))\s*$"
+_DATE_FORMAT_MEMO = {}
+
+
+def _date_formats_file() -> Path:
+    return Path(os.environ.get("REASSURANCE_CACHE_DIR", ".cache/uploads")).parent / "date_formats.json"
+
+
+def remembered_date_format(column):
+    """Format de date déjà détecté pour ce nom de colonne (mémoire + disque)."""
+    if column is None:
+        return None
+    if not _DATE_FORMAT_MEMO:
+        try:
+            _DATE_FORMAT_MEMO.update(json.loads(_date_formats_file().read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            pass
+    return _DATE_FORMAT_MEMO.get(str(column))
+
+
+def remember_date_format(column, fmt):
+    """Mémorise le format détecté pour les prochains imports."""
+    if column is None or fmt is None or _DATE_FORMAT_MEMO.get(str(column)) == fmt:
+        return
+    _DATE_FORMAT_MEMO[str(column)] = fmt
+    path = _date_formats_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(_DATE_FORMAT_MEMO, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _parse_numeric_dates(v: np.ndarray, fmt: str) -> np.ndarray:
+    """Chemins rapides pour les dates numériques (années, AAAAMM, AAAAMMJJ, série Excel)."""
+    out = np.full(v.shape, np.datetime64("NaT"), dtype="datetime64[ns]")
+    ok = np.isfinite(v)
+    iv = np.where(ok, v, 0).astype(np.int64)
+    if fmt == "year_int":
+        out[ok] = (iv[ok] - 1970).astype("datetime64[Y]")
+    elif fmt == "yearmonth_int":
+        months = (iv // 100 - 1970) * 12 + iv % 100 - 1
+        ok &= (iv % 100 >= 1) & (iv % 100 <= 12)
+        out[ok] = months[ok].astype("datetime64[M]")
+    elif fmt == "yearmonthday_int":
+        parsed = pd.to_datetime(pd.Series(iv[ok]).astype(str), format="%Y%m%d", errors="coerce")
+        out[ok] = parsed.to_numpy(dtype="datetime64[ns]")
+    elif fmt == "excel_serial":
+        out[ok] = np.datetime64("1899-12-30") + iv[ok].astype("timedelta64[D]")
+    return out
+
+
+def _numeric_date_path(v: np.ndarray):
+    """Détecte un chemin rapide pour un échantillon numérique, sinon None."""
+    v = v[np.isfinite(v)]
+    if v.size == 0 or np.any(v != np.floor(v)):
+        return None
+    lo, hi = v.min(), v.max()
+    if 1900 <= lo and hi <= 2200:
+        return "year_int"
+    if 190001 <= lo and hi <= 220012:
+        return "yearmonth_int"
+    if 19000101 <= lo and hi <= 22001231:
+        return "yearmonthday_int"
+    if 20000 <= lo and hi <= 80000:
+        return "excel_serial"
+    return None
+
+
+def _parse_text_dates(values: pd.Series, fmt: str) -> pd.Series:
+    if fmt == "quarter":
+        parts = values.astype(str).str.extract(_QUARTER_RE)
+        year = parts["y1"].fillna(parts["y2"]).astype(float)
+        quarter = parts["q1"].fillna(parts["q2"]).astype(float)
+        months = (year - 1970) * 12 + (quarter - 1) * 3
+        res = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+        ok = months.notna().to_numpy()
+        res[ok] = months.to_numpy()[ok].astype(np.int64).astype("datetime64[M]")
+        return pd.Series(res, index=values.index)
+    return pd.to_datetime(values, format=fmt, errors="coerce")
+
+
+def _success_rate(sample, fmt) -> float:
+    try:
+        if fmt in ("year_int", "yearmonth_int", "yearmonthday_int", "excel_serial"):
+            parsed = _parse_numeric_dates(np.asarray(sample, dtype=np.float64), fmt)
+            return float(np.mean(~np.isnat(parsed)))
+        return float(_parse_text_dates(pd.Series(sample), fmt).notna().mean())
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def detect_date_format(s: pd.Series, sample_size: int = DATE_SAMPLE_SIZE, column=None):
+    """Détecte le format exact d'une colonne date sur un petit échantillon.
+
+    Retourne un format strptime, un code de chemin rapide ("year_int",
+    "yearmonth_int", "yearmonthday_int", "excel_serial", "quarter"),
+    "datetime" si la colonne est déjà typée, ou None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return "datetime"
+    uniques = pd.unique(s.dropna())
+    if len(uniques) == 0:
+        return None
+    sample = uniques[:sample_size]
+
+    remembered = remembered_date_format(column)
+    if remembered is not None and _success_rate(sample, remembered) >= DATE_MIN_SUCCESS:
+        return remembered
+
+    if pd.api.types.is_numeric_dtype(s):
+        return _numeric_date_path(np.asarray(sample, dtype=np.float64))
+
+    text = pd.Series(sample).astype(str).str.strip()
+    if text.str.fullmatch(r"\d+(\.0+)?").all():
+        numeric = _numeric_date_path(text.astype(float).to_numpy())
+        if numeric is not None:
+            return numeric
+    best, best_rate = None, 0.0
+    for fmt in ("quarter",) + DATE_FORMATS:
+        rate = _success_rate(text, fmt)
+        if rate > best_rate:
+            best, best_rate = fmt, rate
+        if rate == 1.0:
+            break
+    return best if best_rate >= DATE_MIN_SUCCESS else None
+
+
+def parse_dates(s: pd.Series, column=None, month_start: bool = False) -> pd.Series:
+    """Parse une colonne date en une seule passe avec le format détecté.
+
+    Seules les valeurs distinctes sont parsées (les bordereaux ont peu de
+    dates différentes), puis redistribuées par leurs codes. Le format est
+    mémorisé par nom de colonne. Avec `month_start`, les dates sont alignées
+    sur le début de mois dans la même passe.
+    """
+    fmt = detect_date_format(s, column=column)
+    if fmt == "datetime":
+        values = s.to_numpy(dtype="datetime64[ns]")
+    else:
+        codes, uniques = pd.factorize(s)
+        if fmt in ("year_int", "yearmonth_int", "yearmonthday_int", "excel_serial"):
+            parsed = _parse_numeric_dates(pd.to_numeric(pd.Series(uniques), errors="coerce").to_numpy(dtype=np.float64), fmt)
+        elif fmt is not None:
+            parsed = _parse_text_dates(pd.Series(uniques).astype(str).str.strip(), fmt).to_numpy(dtype="datetime64[ns]")
+        else:
+            # Format non reconnu : parsing générique, mais sur les valeurs distinctes uniquement
+            parsed = pd.to_datetime(pd.Series(uniques), errors="coerce", dayfirst=True).to_numpy(dtype="datetime64[ns]")
+        if len(parsed):
+            values = parsed.astype("datetime64[ns]")[codes]
+            values[codes < 0] = np.datetime64("NaT")
+        else:
+            values = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[ns]")
+        remember_date_format(column, fmt)
+    if month_start:
+        values = values.astype("datetime64[M]").astype("datetime64[ns]")
+    return pd.Series(values, index=s.index, name=s.name)
+
+
+# =============================================================================
+# GÉNÉRATEUR DE DONNÉES DE DÉMONSTRATION
+# =============================================================================
+
+DEMO_LOBS = ["Property Cat", "Casualty", "Vie", "Santé"]
+DEMO_REGIONS = ["EU", "NA", "Asia"]
+DEMO_MAX_ROWS = int(os.environ.get("REASSURANCE_DEMO_MAX_ROWS", 5_000_000))
+DEMO_COLUMNS = [
+    "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
+    "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
+    "claims_count", "exposure", "scr", "own_funds", "investment_income",
+]
+
+
+def _demo_labels(base: list, n: int, prefix: str) -> list:
+    return (list(base) + [f"{prefix} {i + 1}" for i in range(len(base), n)])[:n]
+
+
+def make_demo_data(periods=16, seed=42, freq="Q", n_cedants=1, n_lobs=4, n_regions=2,
+                   start="2022Q1") -> pd.DataFrame:
+    """Portefeuille de démonstration vectorisé (periods x cédantes x LoB x régions lignes).
+
+    Chaque colonne est tirée d'un bloc par `default_rng(seed)` : le résultat est
+    reproductible et des millions de lignes se génèrent en secondes. Au-delà de
+    `DEMO_MAX_ROWS` lignes, ValueError (protection mémoire).
+    """
+    n_rows = periods * n_cedants * n_lobs * n_regions
+    if n_rows > DEMO_MAX_ROWS:
+        raise ValueError(f"portefeuille démo de {n_rows:,} lignes (maximum {DEMO_MAX_ROWS:,})")
+    rng = np.random.default_rng(seed)
+    dates = pd.period_range(start, periods=periods, freq=freq).to_timestamp()
+    cedants = ["CedantA"] + [f"Cedant{i + 1:04d}" for i in range(1, n_cedants)]
+    lobs = _demo_labels(DEMO_LOBS, n_lobs, "LoB")
+    regions = _demo_labels(DEMO_REGIONS, n_regions, "Region")
+
+    cells = n_cedants * n_lobs * n_regions
+    n = periods * cells
+    date_code = np.repeat(np.arange(periods, dtype=np.int32), cells)
+    cell = np.tile(np.arange(cells, dtype=np.int32), periods)
+    cedant_code, cell = np.divmod(cell, n_lobs * n_regions)
+    lob_code, region_code = np.divmod(cell, n_regions)
+    is_cat = lob_code == 0  # "Property Cat" : fréquence et sévérité plus élevées
+
+    def scaled(base, low, high):
+        out = rng.uniform(low, high, n)
+        out *= base
+        return out
+
+    gwp = rng.normal(50, 8, n)
+    gwp *= 100000  # Échelle plus réaliste
+    ced = scaled(gwp, 0.15, 0.45)
+    ep = scaled(gwp, 0.75, 0.95)
+    cnt = rng.poisson(np.where(is_cat, 110, 85))
+    expo = rng.integers(900, 1600, n)
+    inc = rng.lognormal(np.where(is_cat, 9.35, 9.1), 0.35)
+    inc *= cnt
+    scr = scaled(ep, 0.28, 0.42)
+    data = {
+        "date": dates.values[date_code],
+        "cedant": pd.Categorical.from_codes(cedant_code, cedants),
+        "lob": pd.Categorical.from_codes(lob_code, lobs),
+        "region": pd.Categorical.from_codes(region_code, regions),
+        "gross_premium": gwp,
+        "ceded_premium": ced,
+        "earned_premium": ep,
+        "incurred_claims": inc,
+        "paid_claims": scaled(inc, 0.6, 0.9),
+        "ibnr": scaled(inc, 0.06, 0.18),
+        "rbns": scaled(inc, 0.05, 0.15),
+        "acq_expense": scaled(ep, 0.08, 0.14),
+        "adm_expense": scaled(ep, 0.05, 0.09),
+        "claims_count": cnt,
+        "exposure": expo,
+        "scr": scr,
+        "own_funds": scaled(scr, 1.25, 1.9),
+        "investment_income": scaled(gwp, 0.01, 0.03),
+    }
+    return pd.DataFrame(data, columns=DEMO_COLUMNS, copy=False)
+
+# =============================================================================
+# CACHE DES IMPORTS (PARQUET, LRU)
+# =============================================================================
+
+UPLOAD_CACHE_DIR = Path(os.environ.get("REASSURANCE_CACHE_DIR", ".cache/uploads"))
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("REASSURANCE_CACHE_MAX_BYTES", 2 * 1024**3))
+
+
+def file_digest(data) -> str:
+    """Empreinte du contenu d'un fichier (bytes ou objet fichier)."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        h.update(data)
+    else:
+        data.seek(0)
+        for block in iter(lambda: data.read(1 << 20), b""):
+            h.update(block)
+        data.seek(0)
+    return h.hexdigest()
+
+
+def upload_cache_key(digest: str, mapping: dict) -> str:
+    """Clé de cache : empreinte du fichier + mapping des colonnes."""
+    payload = json.dumps({"file": digest, "mapping": mapping}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_cached_frame(key: str, cache_dir=UPLOAD_CACHE_DIR):
+    """Charge (memory-mapped) un jeu de données mis en cache, ou None."""
+    path = Path(cache_dir) / f"{key}.parquet"
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path, engine="pyarrow", memory_map=True)
+    except Exception:
+        return None
+    os.utime(path)  # l'horodatage sert d'ordre LRU
+    return df
+
+
+def store_cached_frame(key: str, df: pd.DataFrame, cache_dir=UPLOAD_CACHE_DIR,
+                       max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+    """Écrit le jeu de données typé en Parquet puis applique l'éviction LRU."""
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"{key}.parquet"
+    tmp = cache_dir / f"{key}.{os.getpid()}.tmp"
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp, engine="pyarrow", index=False)
+        os.replace(tmp, path)  # écriture atomique, sûre entre sessions
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        return None
+    evict_cache(cache_dir, max_bytes, keep=path)
+    return path
+
+
+def evict_cache(cache_dir=UPLOAD_CACHE_DIR, max_bytes: int = UPLOAD_CACHE_MAX_BYTES, keep=None,
+                pattern: str = "*.parquet"):
+    """Supprime les fichiers les moins récemment utilisés au-delà de max_bytes."""
+    files = []
+    for p in Path(cache_dir).glob(pattern):
+        if p.suffix == ".tmp":
+            continue
+        try:
+            stat = p.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, p))
+    total = sum(size for _, size, _ in files)
+    for _, size, p in sorted(files, key=lambda f: f[0]):
+        if total <= max_bytes:
+            break
+        if keep is not None and p == keep:
+            continue
+        p.unlink(missing_ok=True)
+        total -= size
+
+
+# =============================================================================
+# POOL DE PROCESSUS PARTAGÉ
+# =============================================================================
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def process_pool(max_workers=None) -> ProcessPoolExecutor:
+    """Pool de processus partagé par tous les moteurs (créé à la première demande).
+
+    Le contexte forkserver évite de forker le serveur Streamlit et ses threads.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _POOL = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=ctx)
+        return _POOL
+
+
+def reset_process_pool(kill: bool = False):
+    """Abandonne le pool courant (ex. après un worker tué) ; un nouveau sera créé.
+
+    Avec kill=True, les workers encore occupés sont arrêtés : un calcul en
+    cours ne peut pas être annulé autrement. Les autres tâches du pool
+    échouent alors en BrokenProcessPool et basculent en séquentiel.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            workers = list((getattr(_POOL, "_processes", None) or {}).values()) if kill else []
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            for proc in workers:
+                proc.terminate()
+        _POOL = None
+
+
+class MemoCache:
+    """Cache LRU thread-safe en mémoire, partagé entre sessions Streamlit."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def array_fingerprint(*parts) -> str:
+    """Empreinte d'un ensemble de tableaux, Series et paramètres."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, pd.Series):
+            h.update(np.ascontiguousarray(part.index.asi8 if hasattr(part.index, "asi8") else
+                                          np.asarray(part.index, dtype=str)).tobytes())
+            part = part.to_numpy()
+        if isinstance(part, np.ndarray):
+            h.update(str(part.dtype).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+# =============================================================================
+# PRÉVISIONS SARIMAX
+# =============================================================================
+
+FORECAST_CACHE = MemoCache(maxsize=1024)
+SARIMAX_MIN_POINTS = 24
+
+
+def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
+    """Prévision SARIMAX avec fallback naïf si historique insuffisant."""
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
+    if ts.shape[0] < max(SARIMAX_MIN_POINTS, steps):
+        last = ts.iloc[-1] if ts.shape[0] else 0.0
+        idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
+        return pd.Series([last] * steps, index=idx)
+    try:
+        model = SARIMAX(ts, order=order, seasonal_order=seasonal,
+                        enforce_stationarity=False, enforce_invertibility=False)
+        res = model.fit(disp=False)
+        fc = res.get_forecast(steps=steps).predicted_mean
+        return fc
+    except Exception:
+        last = ts.iloc[-1] if ts.shape[0] else 0.0
+        idx = pd.date_range(ts.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
+        return pd.Series([last] * steps, index=idx)
+
+
+def forecast_key(ts: pd.Series, steps: int, order, seasonal) -> str:
+    """Clé de mémoïsation d'une prévision : valeurs de la série + paramètres."""
+    return array_fingerprint(ts, steps, tuple(order), tuple(seasonal))
+
+
+def cached_sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
+    """sarimax_forecast mémoïsé par empreinte de série."""
+    key = forecast_key(ts, steps, order, seasonal)
+    fc = FORECAST_CACHE.get(key)
+    if fc is None:
+        fc = sarimax_forecast(ts, steps, order, seasonal)
+        FORECAST_CACHE.set(key, fc)
+    return fc
+
+
+def segment_forecast_key(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4), season_length=None,
+                         criterion="aic") -> str:
+    """Clé de cache d'un segment, y compris en mode d'ordre automatique."""
+    if order == "auto":
+        return forecast_key(ts, steps, ("auto", criterion), (season_length,))
+    return forecast_key(ts, steps, order, seasonal)
+
+
+def stale_forecasts(series: dict, steps: int, order=(1,1,1), seasonal=(0,1,1,4), season_length=None,
+                    criterion="aic") -> list:
+    """Segments dont la série a changé depuis la dernière prévision (à réajuster)."""
+    return [name for name, ts in series.items()
+            if segment_forecast_key(ts, steps, order, seasonal, season_length, criterion) not in FORECAST_CACHE]
+
+
+def forecast_segments(series: dict, steps: int, order=(1,1,1), seasonal=(0,1,1,4), parallel=True,
+                      season_length=None, criterion="aic"):
+    """Prévisions de plusieurs segments, produites au fil de l'eau.
+
+    Générateur de (segment, prévision) : les prévisions déjà en cache sont
+    rendues immédiatement, les autres sont ajustées dans le pool de processus
+    et rendues dans l'ordre de fin de calcul. Avec order="auto", l'ordre de
+    chaque série est d'abord choisi par auto_sarimax_order (mis en cache).
+    """
+    auto = order == "auto"
+    pending = {}
+    for name, ts in series.items():
+        key = segment_forecast_key(ts, steps, order, seasonal, season_length, criterion)
+        fc = FORECAST_CACHE.get(key)
+        if fc is not None:
+            yield name, fc
+        else:
+            pending[name] = (key, ts)
+    if not pending:
+        return
+    params = {}
+    for name, (key, ts) in pending.items():
+        if auto:
+            best = auto_sarimax_order(ts, season_length=season_length, criterion=criterion, parallel=parallel)
+            params[name] = (best["order"], best["seasonal"])
+        else:
+            params[name] = (order, seasonal)
+    if not parallel or len(pending) == 1:
+        for name, (key, ts) in pending.items():
+            fc = sarimax_forecast(ts, steps, *params[name])
+            FORECAST_CACHE.set(key, fc)
+            yield name, fc
+        return
+    pool = process_pool()
+    futures = {pool.submit(sarimax_forecast, ts, steps, *params[name]): (name, key)
+               for name, (key, ts) in pending.items()}
+    for fut in as_completed(futures):
+        name, key = futures[fut]
+        try:
+            fc = fut.result()
+        except BrokenProcessPool:
+            reset_process_pool()
+            fc = sarimax_forecast(pending[name][1], steps, *params[name])
+        FORECAST_CACHE.set(key, fc)
+        yield name, fc
+
+
+# =============================================================================
+# RECHERCHE AUTOMATIQUE D'ORDRE SARIMAX
+# =============================================================================
+
+ORDER_CACHE = MemoCache(maxsize=4096)
+
+
+def sarimax_order_grid(season_length=12, p=(0, 1, 2), d=(0, 1), q=(0, 1, 2),
+                       P=(0, 1), D=(0, 1), Q=(0, 1), max_candidates=72) -> list:
+    """Grille bornée de (order, seasonal_order), des modèles simples aux plus complexes."""
+    if not season_length or season_length < 2:
+        P, D, Q, season_length = (0,), (0,), (0,), 0
+    grid = [((a, b, c), (A, B, C, season_length))
+            for a, b, c, A, B, C in itertools.product(p, d, q, P, D, Q)]
+    grid.sort(key=lambda oc: (sum(oc[0]) + sum(oc[1][:3]), oc))
+    return grid[:max_candidates]
+
+
+def sarimax_criteria(ts: pd.Series, order, seasonal, maxiter: int = 50) -> tuple:
+    """(AIC, BIC) d'un ajustement SARIMAX ; (inf, inf) en cas d'échec."""
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    import warnings
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            res = SARIMAX(ts, order=order, seasonal_order=seasonal,
+                          enforce_stationarity=False, enforce_invertibility=False
+                          ).fit(disp=False, maxiter=maxiter)
+        aic, bic = float(res.aic), float(res.bic)
+        if not (np.isfinite(aic) and np.isfinite(bic)):
+            return np.inf, np.inf
+        return aic, bic
+    except Exception:
+        return np.inf, np.inf
+
+
+def _load_sarimax() -> int:
+    """Importe statsmodels dans un worker (hors délai des ajustements)."""
+    from statsmodels.tsa.statespace.sarimax import SARIMAX  # noqa: F401
+
+    return os.getpid()
+
+
+def _warm_pool(pool, n: int):
+    """Démarre n workers et y charge statsmodels avant de chronométrer les ajustements."""
+    for fut in [pool.submit(_load_sarimax) for _ in range(n)]:
+        fut.result()
+
+
+def auto_sarimax_order(ts: pd.Series, season_length=12, criterion="aic", grid=None,
+                       timeout: float = 10.0, patience: int = 12, parallel=True) -> dict:
+    """Choisit (order, seasonal_order) par AIC/BIC sur une grille bornée.
+
+    Les candidats sont évalués par lots (un par worker) dans le pool de
+    processus ; un lot a `timeout` secondes, les ajustements encore en cours
+    à l'échéance sont abandonnés (statut "timeout") et le pool est recyclé
+    pour libérer leurs workers. En séquentiel, un ajustement ne peut pas être
+    interrompu : s'il dépasse `timeout`, son critère est écarté. La recherche
+    s'arrête après `patience` candidats consécutifs sans amélioration. Le
+    résultat est mis en cache par empreinte de la série.
+
+    Sous SARIMAX_MIN_POINTS observations, aucune recherche n'est lancée
+    (sarimax_forecast rendrait de toute façon une prévision naïve) et
+    "fitted" vaut False.
+    """
+    ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
+    default = ((1, 1, 1), (0, 1, 1, season_length) if season_length and season_length > 1 else (0, 0, 0, 0))
+    if ts.shape[0] < SARIMAX_MIN_POINTS:
+        return {"order": default[0], "seasonal": default[1], "criterion": criterion, "fitted": False,
+                "candidates": pd.DataFrame(columns=["order", "seasonal", "aic", "bic", "status"])}
+    grid = grid or sarimax_order_grid(season_length)
+    key = array_fingerprint(ts, criterion, tuple(grid))
+    cached = ORDER_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    col = 0 if criterion == "aic" else 1
+    rows = []
+    best, stale = np.inf, 0
+
+    def record(order, seasonal, crit, status):
+        nonlocal best, stale
+        rows.append({"order": order, "seasonal": seasonal, "aic": crit[0], "bic": crit[1], "status": status})
+        if crit[col] < best - 1e-6:
+            best, stale = crit[col], 0
+        else:
+            stale += 1
+
+    if parallel:
+        batch = os.cpu_count() or 1
+        for start in range(0, len(grid), batch):
+            try:
+                pool = process_pool()
+                _warm_pool(pool, batch)
+                futures = {pool.submit(sarimax_criteria, ts, o, so): (o, so) for o, so in grid[start:start + batch]}
+                done, late = wait(futures, timeout=timeout)
+                for fut in done:
+                    record(*futures[fut], fut.result(), "ok")
+            except BrokenProcessPool:
+                reset_process_pool()
+                parallel = False
+                grid = grid[start:]
+                break
+            if late:
+                for fut in late:
+                    record(*futures[fut], (np.inf, np.inf), "timeout")
+                # Les ajustements en cours occupent toujours leurs workers : pool recyclé
+                reset_process_pool(kill=True)
+            if stale >= patience:
+                break
+    if not parallel:
+        for o, so in grid:
+            t0 = time.perf_counter()
+            crit = sarimax_criteria(ts, o, so)
+            if time.perf_counter() - t0 <= timeout:
+                record(o, so, crit, "ok")
+            else:
+                record(o, so, (np.inf, np.inf), "timeout")
+            if stale >= patience:
+                break
+
+    candidates = pd.DataFrame(rows).sort_values(criterion).reset_index(drop=True)
+    if candidates.empty or not np.isfinite(candidates.loc[0, criterion]):
+        order, seasonal = default
+    else:
+        order, seasonal = candidates.loc[0, "order"], candidates.loc[0, "seasonal"]
+    result = {"order": order, "seasonal": seasonal, "criterion": criterion, "fitted": True,
+              "candidates": candidates}
+    ORDER_CACHE.set(key, result)
+    return result
+
+
+# =============================================================================
+# MATRICE DE SCÉNARIOS DE STRESS
+# =============================================================================
+
+def stress_scenarios(measures: pd.DataFrame, freq_shocks, sev_shocks, cat_events) -> dict:
+    """Évalue K scénarios (chocs fréquence, sévérité, multiplicateur CAT) en une passe.
+
+    `measures` contient les mesures additives agrégées par date (rollup du
+    cube). Les chocs sont des fractions (0.2 = +20 %) diffusés en tableaux de
+    K valeurs ; la charge sinistres est multipliée par (1+f)(1+s), et par le
+    multiplicateur CAT sur la dernière période. Les sinistres additionnels
+    sont imputés sur les fonds propres. Aucune copie de DataFrame : l'axe
+    scénario est la première dimension des tableaux retournés.
+    """
+    m = measures.sort_values("date")
+    f, s, c = (np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (freq_shocks, sev_shocks, cat_events))
+    f, s, c = np.broadcast_arrays(f, s, c)
+
+    def col(name):
+        return m[name].to_numpy(dtype=np.float64) if name in m.columns else np.zeros(len(m))
+
+    ep = col("earned_premium")
+    ic = col("incurred_claims")
+    expenses = col("acq_expense") + col("adm_expense")
+    is_last = np.zeros(len(m), dtype=bool)
+    if len(m):
+        is_last[-1] = True
+
+    # (K, T) : multiplicateur de la charge sinistres par scénario et par date
+    mult = ((1 + f) * (1 + s))[:, None] * np.where(is_last[None, :], c[:, None], 1.0)
+    ic_k = mult * ic
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cr_path = (ic_k + expenses) / np.where(ep == 0, np.nan, ep)
+        ep_total = ep.sum()
+        cr_total = (ic_k.sum(axis=1) + expenses.sum()) / (ep_total if ep_total else np.nan)
+        if {"own_funds", "scr"}.issubset(m.columns):
+            scr_total = col("scr").sum()
+            solvency = (col("own_funds").sum() - (ic_k.sum(axis=1) - ic.sum())) / (scr_total if scr_total else np.nan)
+        else:
+            solvency = np.full(f.shape, np.nan)
+    return {
+        "dates": m["date"].to_numpy(),
+        "combined_ratio_path": cr_path,
+        "combined_ratio": cr_total,
+        "combined_ratio_last": cr_path[:, -1] if len(m) else np.full(f.shape, np.nan),
+        "solvency_ratio": solvency,
+    }
+
+
+def stress_grid(measures: pd.DataFrame, freq_shocks, sev_shocks, cat_events) -> dict:
+    """Surfaces (fréquence x sévérité x CAT) des ratios combiné et de solvabilité."""
+    freq_shocks, sev_shocks, cat_events = (np.asarray(x, dtype=np.float64) for x in (freq_shocks, sev_shocks, cat_events))
+    F, S, C = np.meshgrid(freq_shocks, sev_shocks, cat_events, indexing="ij")
+    res = stress_scenarios(measures, F.ravel(), S.ravel(), C.ravel())
+    shape = F.shape
+    return {
+        "freq_shocks": freq_shocks,
+        "sev_shocks": sev_shocks,
+        "cat_events": cat_events,
+        "combined_ratio": res["combined_ratio"].reshape(shape),
+        "combined_ratio_last": res["combined_ratio_last"].reshape(shape),
+        "solvency_ratio": res["solvency_ratio"].reshape(shape),
+    }
+
+
+# =============================================================================
+# AGRÉGATION DU SCR (FORMULE STANDARD)
+# =============================================================================
+
+# Segments non-vie : écarts-types prime / provisions (Règlement délégué 2015/35, annexe II)
+NL_SEGMENTS = (
+    "rc_auto", "auto_autres", "marine_aviation", "incendie_dommages", "rc_generale", "credit_caution",
+    "protection_juridique", "assistance", "pertes_diverses", "np_casualty", "np_marine", "np_property",
+)
+NL_SIGMA_PREMIUM = np.array([0.10, 0.08, 0.15, 0.08, 0.14, 0.12, 0.07, 0.09, 0.13, 0.17, 0.17, 0.17])
+NL_SIGMA_RESERVE = np.array([0.09, 0.08, 0.11, 0.10, 0.11, 0.19, 0.12, 0.20, 0.20, 0.20, 0.20, 0.20])
+NL_SEGMENT_CORR = np.array([
+    [1.00, 0.50, 0.50, 0.25, 0.50, 0.25, 0.50, 0.25, 0.50, 0.25, 0.25, 0.25],
+    [0.50, 1.00, 0.25, 0.25, 0.25, 0.25, 0.50, 0.50, 0.50, 0.25, 0.25, 0.25],
+    [0.50, 0.25, 1.00, 0.25, 0.25, 0.25, 0.25, 0.50, 0.50, 0.25, 0.50, 0.25],
+    [0.25, 0.25, 0.25, 1.00, 0.25, 0.25, 0.25, 0.50, 0.50, 0.25, 0.50, 0.50],
+    [0.50, 0.25, 0.25, 0.25, 1.00, 0.50, 0.50, 0.25, 0.50, 0.50, 0.25, 0.25],
+    [0.25, 0.25, 0.25, 0.25, 0.50, 1.00, 0.50, 0.25, 0.50, 0.50, 0.25, 0.25],
+    [0.50, 0.50, 0.25, 0.25, 0.50, 0.50, 1.00, 0.25, 0.50, 0.50, 0.25, 0.25],
+    [0.25, 0.50, 0.50, 0.50, 0.25, 0.25, 0.25, 1.00, 0.50, 0.25, 0.25, 0.50],
+    [0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 1.00, 0.50, 0.50, 0.25],
+    [0.25, 0.25, 0.25, 0.25, 0.50, 0.50, 0.50, 0.25, 0.50, 1.00, 0.25, 0.25],
+    [0.25, 0.25, 0.50, 0.50, 0.25, 0.25, 0.25, 0.25, 0.50, 0.25, 1.00, 0.25],
+    [0.25, 0.25, 0.25, 0.50, 0.25, 0.25, 0.25, 0.50, 0.25, 0.25, 0.25, 1.00],
+])
+# Santé non similaire à la vie (frais médicaux) : un seul segment
+HEALTH_SIGMA_PREMIUM = np.array([0.05])
+HEALTH_SIGMA_RESERVE = np.array([0.05])
+
+# Modules du BSCR et matrice de corrélation de la formule standard
+SCR_MODULES = ("marche", "contrepartie", "vie", "sante", "non_vie")
+SCR_MODULE_CORR = np.array([
+    [1.00, 0.25, 0.25, 0.25, 0.25],
+    [0.25, 1.00, 0.25, 0.25, 0.50],
+    [0.25, 0.25, 1.00, 0.25, 0.00],
+    [0.25, 0.25, 0.25, 1.00, 0.00],
+    [0.25, 0.50, 0.00, 0.00, 1.00],
+])
+
+# Segment retenu pour un libellé de LoB (mots-clés, sans accents, en minuscules)
+LOB_SEGMENT_KEYWORDS = (
+    (("vie", "life", "deces", "epargne", "retraite"), "vie"),
+    (("sante", "health", "medical"), "sante"),
+    (("cat", "property xl", "np property"), "np_property"),
+    (("auto", "motor"), "rc_auto"),
+    (("marine", "aviation", "transport"), "marine_aviation"),
+    (("credit", "caution"), "credit_caution"),
+    (("juridique", "legal"), "protection_juridique"),
+    (("assistance",), "assistance"),
+    (("casualty", "liability", "rc ", "responsabilite"), "rc_generale"),
+    (("property", "incendie", "dommage", "habitation", "fire"), "incendie_dommages"),
+)
+
+
+def lob_segment(name) -> str:
+    """Segment de la formule standard associé à un libellé de ligne d'activité."""
+    import unicodedata
+
+    key = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode().lower() + " "
+    for words, segment in LOB_SEGMENT_KEYWORDS:
+        if any(w in key for w in words):
+            return segment
+    return "pertes_diverses"
+
+
+def aggregate_scr(charges, corr) -> np.ndarray:
+    """sqrt(sᵀ C s) sur le dernier axe, vectorisé sur tous les axes de tête."""
+    s = np.asarray(charges, dtype=np.float64)
+    q = np.einsum("...i,ij,...j->...", s, np.asarray(corr, dtype=np.float64), s)
+    return np.sqrt(np.maximum(q, 0.0))
+
+
+def premium_reserve_scr(v_prem, v_res, segment, region, n_segments: int, sigma_prem, sigma_res,
+                        corr) -> np.ndarray:
+    """Risque de primes et de réserves (3 σ V) avec diversification géographique.
+
+    `v_prem` et `v_res` ont la forme (..., N) sur N cellules (ligne x région) ;
+    `segment` et `region` sont les codes entiers des cellules. Les volumes
+    sont regroupés par (segment, région) par produit avec des matrices
+    indicatrices, ce qui garde tous les axes de tête (scénarios, dates).
+    """
+    v_prem = np.asarray(v_prem, dtype=np.float64)
+    v_res = np.asarray(v_res, dtype=np.float64)
+    segment = np.asarray(segment)
+    region = np.asarray(region)
+    n_regions = int(region.max()) + 1 if region.size else 1
+    cell_sr = np.zeros((segment.size, n_segments * n_regions))
+    cell_sr[np.arange(segment.size), segment * n_regions + region] = 1.0
+
+    vol_sr = (v_prem + v_res) @ cell_sr
+    vol_sr = vol_sr.reshape(vol_sr.shape[:-1] + (n_segments, n_regions))
+    vol = vol_sr.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        div = np.where(vol > 0, (vol_sr ** 2).sum(axis=-1) / vol ** 2, 1.0)
+
+    cell_s = cell_sr.reshape(segment.size, n_segments, n_regions).sum(axis=-1)
+    vp = v_prem @ cell_s
+    vr = v_res @ cell_s
+    sp, sr = np.asarray(sigma_prem), np.asarray(sigma_res)
+    # σ_s V_s = sqrt(σp² Vp² + σp σr Vp Vr + σr² Vr²) x (0.75 + 0.25 DIV)
+    sigma_v = np.sqrt(np.maximum((sp * vp) ** 2 + sp * sr * vp * vr + (sr * vr) ** 2, 0.0))
+    return 3.0 * aggregate_scr(sigma_v * (0.75 + 0.25 * div), corr)
+
+
+def portfolio_arrays(cube: pd.DataFrame, measures=("earned_premium", "ibnr", "rbns")) -> dict:
+    """Tableaux (T, N) des mesures par date et cellule (ligne x région), à partir du cube."""
+    dates, t = np.unique(cube["date"].to_numpy(), return_inverse=True)
+    lob = cube["lob"] if "lob" in cube.columns else pd.Series("Non-Vie", index=cube.index)
+    region = cube["region"] if "region" in cube.columns else pd.Series("Global", index=cube.index)
+    cells = pd.MultiIndex.from_arrays([lob.astype(str), region.astype(str)])
+    n, cell_index = pd.factorize(cells)
+    out = {"dates": dates, "lob": cell_index.get_level_values(0).to_numpy(),
+           "region": cell_index.get_level_values(1).to_numpy()}
+    flat = t * len(cell_index) + n
+    for m in measures:
+        v = cube[m].to_numpy(dtype=np.float64) if m in cube.columns else np.zeros(len(cube))
+        out[m] = np.bincount(flat, weights=np.nan_to_num(v), minlength=len(dates) * len(cell_index)) \
+            .reshape(len(dates), len(cell_index))
+    return out
+
+
+def portfolio_scr(cube: pd.DataFrame, cession_rates=0.0, reserve_shocks=0.0, premium_shocks=0.0,
+                  market_factor: float = 0.10, default_factor: float = 0.08, life_factor: float = 0.05,
+                  op_factor: float = 0.03, segments=None) -> dict:
+    """SCR formule standard par date pour K scénarios, en une passe vectorisée.
+
+    Les volumes nets de réassurance sont les primes acquises et provisions
+    (IBNR + RBNS) multipliées par (1 - cession) puis choquées. Les modules
+    sont : non-vie et santé (primes et réserves, 3 σ V), vie (facteur sur
+    les provisions vie), marché (facteur sur fonds propres + provisions) et
+    contrepartie (facteur sur la part cédée des provisions). Le risque
+    opérationnel vaut min(30 % BSCR, op_factor x primes). Chocs et taux de
+    cession sont diffusés en K scénarios ; les sorties sont de forme (K, T).
+    """
+    arr = portfolio_arrays(cube, ("earned_premium", "ibnr", "rbns", "own_funds", "scr"))
+    c, rs, ps = (np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (cession_rates, reserve_shocks, premium_shocks))
+    c, rs, ps = np.broadcast_arrays(c, rs, ps)
+    cell_segments = np.array([(segments or {}).get(l) or lob_segment(l) for l in arr["lob"]])
+    _, region = np.unique(arr["region"], return_inverse=True)
+
+    gross_prem = arr["earned_premium"]
+    gross_res = arr["ibnr"] + arr["rbns"]
+    # (K, T, N) : volumes nets choqués par scénario
+    net = (1.0 - c)[:, None, None]
+    v_prem = net * (1.0 + ps)[:, None, None] * gross_prem
+    v_res = net * (1.0 + rs)[:, None, None] * gross_res
+    ceded_res = (c * (1.0 + rs))[:, None, None] * gross_res
+
+    nl = np.flatnonzero(np.isin(cell_segments, NL_SEGMENTS))
+    nl_codes = np.array([NL_SEGMENTS.index(seg) for seg in cell_segments[nl]], dtype=np.intp)
+    hl = np.flatnonzero(cell_segments == "sante")
+    lf = np.flatnonzero(cell_segments == "vie")
+
+    modules = np.zeros(v_prem.shape[:2] + (len(SCR_MODULES),))
+    modules[..., 4] = premium_reserve_scr(v_prem[..., nl], v_res[..., nl], nl_codes, region[nl], len(NL_SEGMENTS),
+                                          NL_SIGMA_PREMIUM, NL_SIGMA_RESERVE, NL_SEGMENT_CORR)
+    modules[..., 3] = premium_reserve_scr(v_prem[..., hl], v_res[..., hl], np.zeros(hl.size, dtype=int), region[hl],
+                                          1, HEALTH_SIGMA_PREMIUM, HEALTH_SIGMA_RESERVE, np.ones((1, 1)))
+    modules[..., 2] = life_factor * v_res[..., lf].sum(axis=-1)
+    own_funds = arr["own_funds"].sum(axis=-1)
+    modules[..., 0] = market_factor * (own_funds + v_res.sum(axis=-1))
+    modules[..., 1] = default_factor * ceded_res.sum(axis=-1)
+
+    bscr = aggregate_scr(modules, SCR_MODULE_CORR)
+    op = np.minimum(0.3 * bscr, op_factor * (1.0 + ps)[:, None] * gross_prem.sum(axis=-1))
+    scr = bscr + op
+    with np.errstate(divide="ignore", invalid="ignore"):
+        solvency = own_funds / np.where(scr > 0, scr, np.nan)
+    return {
+        "dates": arr["dates"],
+        "modules": modules,
+        "bscr": bscr,
+        "operational": op,
+        "scr": scr,
+        "own_funds": own_funds,
+        "solvency_ratio": solvency,
+        "input_scr": arr["scr"].sum(axis=-1),
+    }
+
+
+# =============================================================================
+# MATRICE DE CORRÉLATION RÉDUITE
+# =============================================================================
+
+CORR_MAX_FEATURES = 15
+
+
+def feature_variability(X: np.ndarray) -> np.ndarray:
+    """Coefficient de variation absolu par colonne (indépendant de l'échelle).
+
+    Les montants (primes, sinistres) et les ratios n'ont pas la même unité :
+    la variance brute sélectionnerait toujours les montants.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.nanmean(X, axis=0, dtype=np.float64)
+        std = np.nanstd(X, axis=0, dtype=np.float64)
+        cv = np.abs(std / np.where(mean == 0, np.nan, mean))
+    # Colonne centrée sur zéro mais non constante : on la garde en tête de liste
+    cv = np.where((mean == 0) & (std > 0), np.inf, cv)
+    return np.nan_to_num(cv, nan=0.0)
+
+
+def _cluster_order(corr: np.ndarray) -> np.ndarray:
+    """Ordre des feuilles d'une classification hiérarchique sur 1 - |corr|."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    dist = 1.0 - np.abs(corr.astype(np.float64))
+    np.fill_diagonal(dist, 0.0)
+    dist = np.clip((dist + dist.T) / 2, 0.0, None)
+    return leaves_list(linkage(squareform(dist, checks=False), method="average"))
+
+
+def correlation_matrix(df: pd.DataFrame, columns=None, top_k: int = CORR_MAX_FEATURES,
+                       cluster: bool = True, dtype=np.float32) -> pd.DataFrame:
+    """Matrice de corrélation de Pearson réduite aux top_k variables les plus variables.
+
+    Les colonnes numériques sont extraites une seule fois dans un bloc
+    `dtype` ; les valeurs manquantes sont remplacées par la moyenne de leur
+    colonne (contribution nulle après centrage), ce qui évite les
+    corrélations par paires de pandas. Les colonnes constantes sont écartées.
+    Avec `cluster`, lignes et colonnes sont réordonnées par classification
+    hiérarchique pour regrouper les variables corrélées.
+    """
+    if columns is None:
+        columns = df.select_dtypes(include=[np.number]).columns
+    columns = list(columns)
+    if not columns:
+        return pd.DataFrame(dtype=dtype)
+    X = df[columns].to_numpy(dtype=dtype, na_value=np.nan)
+    X[~np.isfinite(X)] = np.nan
+
+    cv = feature_variability(X)
+    keep = np.flatnonzero(cv > 0)
+    if top_k and keep.size > top_k:
+        keep = keep[np.argsort(-cv[keep], kind="stable")[:top_k]]
+        keep.sort()
+    X = X[:, keep]
+    names = [columns[i] for i in keep]
+
+    Xc = X - np.nanmean(X, axis=0)
+    np.nan_to_num(Xc, copy=False, nan=0.0)
+    cov = Xc.T @ Xc
+    norm = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.clip(cov / np.outer(norm, norm), -1.0, 1.0).astype(dtype, copy=False)
+    np.fill_diagonal(corr, 1.0)
+
+    if cluster and len(names) > 2:
+        order = _cluster_order(corr)
+        corr = corr[np.ix_(order, order)]
+        names = [names[i] for i in order]
+    return pd.DataFrame(corr, index=names, columns=names)
+
+
+# =============================================================================
+# SIMULATION MONTE CARLO POISSON COMPOSÉE
+# =============================================================================
+
+MC_CHUNK_YEARS = 200_000
+RISK_LEVELS = (0.95, 0.99, 0.995)
+
+
+def _aggregate_chunk(lam: float, mu: float, sigma: float, n_years: int, seed) -> np.ndarray:
+    """Pertes annuelles agrégées (fréquence Poisson x sévérité lognormale) d'une tranche."""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(lam, n_years)
+    severities = rng.lognormal(mu, sigma, int(counts.sum()))
+    years = np.repeat(np.arange(n_years), counts)
+    return np.bincount(years, weights=severities, minlength=n_years)
+
+
+def simulate_aggregate_losses(lam: float, mu: float, sigma: float, n_years: int = 1_000_000,
+                              seed=42, chunk_years: int = MC_CHUNK_YEARS, parallel=False) -> np.ndarray:
+    """Simule n_years pertes annuelles agrégées, par tranches de chunk_years années.
+
+    Chaque tranche a sa propre graine dérivée de `seed` (SeedSequence.spawn) :
+    le résultat est identique en séquentiel ou réparti sur le pool de processus.
+    Seules les sévérités d'une tranche sont en mémoire à la fois.
+    """
+    sizes = [min(chunk_years, n_years - start) for start in range(0, n_years, chunk_years)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    out = np.empty(n_years, dtype=np.float64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    if parallel and len(sizes) > 1:
+        try:
+            pool = process_pool()
+            futures = [pool.submit(_aggregate_chunk, lam, mu, sigma, n, sd) for n, sd in zip(sizes, seeds)]
+            for i, fut in enumerate(futures):
+                out[offsets[i]:offsets[i + 1]] = fut.result()
+            return out
+        except BrokenProcessPool:
+            reset_process_pool()
+    for i, (n, sd) in enumerate(zip(sizes, seeds)):
+        out[offsets[i]:offsets[i + 1]] = _aggregate_chunk(lam, mu, sigma, n, sd)
+    return out
+
+
+def risk_measures(losses: np.ndarray, levels=RISK_LEVELS) -> pd.DataFrame:
+    """VaR et TVaR empiriques aux niveaux demandés (un seul tri)."""
+    x = np.sort(np.asarray(losses, dtype=np.float64))
+    n = x.size
+    tail_sums = np.cumsum(x[::-1])[::-1]  # somme des pertes à partir de chaque rang
+    rows = []
+    for level in levels:
+        k = min(int(np.ceil(level * n)) - 1, n - 1)
+        k = max(k, 0)
+        rows.append({"level": level, "VaR": x[k], "TVaR": tail_sums[k] / (n - k)})
+    return pd.DataFrame(rows)
+
+
+def aggregate_loss_distribution(lam: float, mu: float, sigma: float, n_years: int = 1_000_000,
+                                levels=RISK_LEVELS, bins: int = 100, seed=42, parallel=False) -> dict:
+    """Distribution des pertes annuelles agrégées : statistiques, VaR/TVaR et histogramme pré-binné."""
+    losses = simulate_aggregate_losses(lam, mu, sigma, n_years, seed=seed, parallel=parallel)
+    counts, edges = np.histogram(losses, bins=bins)
+    return {
+        "n_years": n_years,
+        "mean": float(losses.mean()),
+        "std": float(losses.std()),
+        "median": float(np.median(losses)),
+        "prob_zero": float(np.mean(losses == 0)),
+        "risk": risk_measures(losses, levels),
+        "hist_counts": counts,
+        "hist_edges": edges,
+    }
+
+
+# =============================================================================
+# TARIFICATION DES COUCHES XL PAR SIMULATION
+# =============================================================================
+
+XL_CHUNK_LOSSES = 1 << 18
+
+
+def simulate_individual_losses(lam: float, mu: float, sigma: float, n_years: int, seed=42):
+    """Sinistres individuels (Poisson x lognormale) et leur année de survenance."""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(lam, n_years)
+    losses = rng.lognormal(mu, sigma, int(counts.sum()))
+    years = np.repeat(np.arange(n_years, dtype=np.int64), counts)
+    return losses, years
+
+
+def xl_ceded(losses, priorities, limits) -> np.ndarray:
+    """Part cédée de chaque sinistre à chaque couche : clip(X - P, 0, L), forme (couches, sinistres)."""
+    x = np.asarray(losses, dtype=np.float64)
+    p = np.asarray(priorities, dtype=np.float64)[:, None]
+    lim = np.asarray(limits, dtype=np.float64)[:, None]
+    return np.clip(x[None, :] - p, 0.0, lim)
+
+
+def _reinstatement_counts(reinstatements, n_layers: int) -> np.ndarray:
+    """Nombre de reconstitutions par couche (None, NaN ou négatif = illimité)."""
+    values = np.broadcast_to(np.asarray(reinstatements, dtype=object), (n_layers,))
+    return np.array([np.inf if r is None or np.isnan(r) or r < 0 else r for r in values], dtype=np.float64)
+
+
+def xl_annual_ceded(losses, years, n_years: int, priorities, limits, aad=0.0, reinstatements=None,
+                    chunk: int = XL_CHUNK_LOSSES) -> np.ndarray:
+    """Charge annuelle cédée par couche, forme (couches, années).
+
+    Applique la franchise annuelle agrégée (AAD) puis la limite annuelle
+    (limite x (1 + reconstitutions) ; None = illimitée). Les sinistres sont
+    traités par tranches pour borner la mémoire.
+    """
+    priorities = np.atleast_1d(np.asarray(priorities, dtype=np.float64))
+    limits = np.atleast_1d(np.asarray(limits, dtype=np.float64))
+    n_layers = priorities.size
+    losses = np.asarray(losses, dtype=np.float64)
+    years = np.asarray(years, dtype=np.int64)
+    annual = np.zeros((n_layers, n_years), dtype=np.float64)
+    for start in range(0, losses.size, chunk):
+        sl = slice(start, start + chunk)
+        ceded = xl_ceded(losses[sl], priorities, limits)
+        for j in range(n_layers):
+            annual[j] += np.bincount(years[sl], weights=ceded[j], minlength=n_years)
+
+    aad = np.broadcast_to(np.asarray(aad, dtype=np.float64), (n_layers,))
+    annual -= aad[:, None]
+    np.maximum(annual, 0.0, out=annual)
+    if reinstatements is not None:
+        reinst = _reinstatement_counts(reinstatements, n_layers)
+        np.minimum(annual, (limits * (1 + reinst))[:, None], out=annual)
+    return annual
+
+
+def price_xl_layers(losses, years, n_years: int, priorities, limits, aad=0.0, reinstatements=None,
+                    reinstatement_rate=1.0, rate_on_line=None, subject_premium=None) -> pd.DataFrame:
+    """Statistiques par couche : perte attendue, burning cost, écart-type, probabilité d'attachement.
+
+    `rate_on_line` (fraction de la limite) permet de comparer la prime
+    affichée à la perte attendue et d'estimer les primes de reconstitution
+    (au prorata de la limite consommée, au taux `reinstatement_rate`).
+    """
+    priorities = np.atleast_1d(np.asarray(priorities, dtype=np.float64))
+    limits = np.atleast_1d(np.asarray(limits, dtype=np.float64))
+    annual = xl_annual_ceded(losses, years, n_years, priorities, limits, aad, reinstatements)
+    expected = annual.mean(axis=1)
+    out = pd.DataFrame({
+        "priority": priorities,
+        "limit": limits,
+        "expected_loss": expected,
+        "std_dev": annual.std(axis=1),
+        "prob_attachment": (annual > 0).mean(axis=1),
+        "loss_on_line": expected / limits,
+    })
+    if subject_premium:
+        out["burning_cost"] = expected / subject_premium
+    if rate_on_line is not None:
+        rol = np.broadcast_to(np.asarray(rate_on_line, dtype=np.float64), limits.shape)
+        premium = rol * limits
+        if reinstatements is not None:
+            reinst = _reinstatement_counts(reinstatements, limits.size)
+            used = np.minimum(annual, (limits * reinst)[:, None]) / limits[:, None]
+            reinst_premium = (premium[:, None] * reinstatement_rate * used).mean(axis=1)
+        else:
+            reinst_premium = np.zeros_like(premium)
+        out["premium"] = premium
+        out["reinstatement_premium"] = reinst_premium
+        out["expected_margin"] = premium + reinst_premium - expected
+    return out
+
+
+# =============================================================================
+# OPTIMISATION DU PROGRAMME DE RÉASSURANCE
+# =============================================================================
+
+def calibrate_compound_poisson(expected_losses: float, volatility: float, severity_sigma: float = 1.0):
+    """(λ, μ, σ) d'un modèle Poisson-lognormal de moyenne et coefficient de variation donnés.
+
+    Pour un Poisson composé, CV² = E[X²] / (λ E[X]²) = (1 + cv_X²) / λ.
+    """
+    cv_x2 = np.expm1(severity_sigma ** 2)
+    lam = (1 + cv_x2) / volatility ** 2
+    mean_severity = expected_losses / lam
+    mu = np.log(mean_severity) - severity_sigma ** 2 / 2
+    return float(lam), float(mu), float(severity_sigma)
+
+
+def programme_loss_sample(expected_losses: float, volatility: float, n_years: int = 100_000,
+                          severity_sigma: float = 1.0, large_threshold: float = 0.0, seed=42) -> dict:
+    """Échantillon Monte Carlo partagé par tous les candidats de l'optimiseur.
+
+    Conserve la charge annuelle brute de chaque année et les seuls sinistres
+    au-dessus de `large_threshold` (les seuls qui touchent les rétentions XL).
+    """
+    lam, mu, sigma = calibrate_compound_poisson(expected_losses, volatility, severity_sigma)
+    annual = np.zeros(n_years, dtype=np.float64)
+    large, large_years = [], []
+    sizes = [min(MC_CHUNK_YEARS, n_years - start) for start in range(0, n_years, MC_CHUNK_YEARS)]
+    offset = 0
+    for n, sd in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))):
+        rng = np.random.default_rng(sd)
+        counts = rng.poisson(lam, n)
+        losses = rng.lognormal(mu, sigma, int(counts.sum()))
+        years = np.repeat(np.arange(offset, offset + n), counts)
+        annual[offset:offset + n] = np.bincount(years - offset, weights=losses, minlength=n)
+        keep = losses > large_threshold
+        large.append(losses[keep])
+        large_years.append(years[keep])
+        offset += n
+    return {
+        "annual": annual,
+        "large": np.concatenate(large),
+        "large_years": np.concatenate(large_years),
+        "threshold": large_threshold,
+        "params": (lam, mu, sigma),
+    }
+
+
+def _evaluate_qs_batch(sample: dict, premium: float, capital: float, qs_rate: float, retentions,
+                       sl_priorities, sl_limit: float, qs_commission: float, xl_loading: float,
+                       sl_loading: float) -> list:
+    """Évalue tous les couples (rétention XL, priorité stop loss) pour un taux de quote-part."""
+    annual, large, large_years = sample["annual"], sample["large"], sample["large_years"]
+    n_years = annual.size
+    q = qs_rate
+    retained = (1 - q) * annual
+    net_premium = (1 - q) * premium
+    qs_cost = q * premium * (1 - qs_commission) - q * annual.mean()
+    rows = []
+    for retention in retentions:
+        if np.isfinite(retention):
+            # max((1-q)X - R, 0) = (1-q) max(X - R/(1-q), 0)
+            threshold = retention / (1 - q) if q < 1 else np.inf
+            excess = np.maximum(large - threshold, 0.0)
+            xl_rec = (1 - q) * np.bincount(large_years, weights=excess, minlength=n_years)
+        else:
+            xl_rec = np.zeros(n_years)
+        net = retained - xl_rec
+        xl_el = xl_rec.mean()
+        xl_premium = xl_el * (1 + xl_loading)
+        for sl_priority in sl_priorities:
+            if np.isfinite(sl_priority):
+                sl_rec = np.clip(net - sl_priority * net_premium, 0.0, sl_limit * net_premium)
+            else:
+                sl_rec = np.zeros(n_years)
+            sl_el = sl_rec.mean()
+            sl_premium = sl_el * (1 + sl_loading)
+            result = (premium - q * premium + q * qs_commission * premium
+                      - xl_premium - sl_premium - net + sl_rec)
+            expected = result.mean()
+            scr = max(expected - np.quantile(result, 0.005), 0.0)
+            rows.append({
+                "qs_rate": q,
+                "retention": retention,
+                "sl_priority": sl_priority,
+                "reinsurance_premium": q * premium * (1 - qs_commission) + xl_premium + sl_premium,
+                "reinsurance_cost": qs_cost + (xl_premium - xl_el) + (sl_premium - sl_el),
+                "expected_result": expected,
+                "result_std": result.std(),
+                "scr": scr,
+                "solvency_ratio": capital / scr if scr > 0 else np.inf,
+                "ruin_prob": float(np.mean(result < -capital)),
+            })
+    return rows
+
+
+def evaluate_programmes(sample: dict, premium: float, capital: float, qs_rates, retentions, sl_priorities,
+                        sl_limit: float = 0.5, qs_commission: float = 0.25, xl_loading: float = 0.3,
+                        sl_loading: float = 0.5, cost_of_capital: float = 0.10, parallel=True) -> pd.DataFrame:
+    """Évalue la grille (quote-part, rétention XL, priorité stop loss) sur l'échantillon partagé.
+
+    Les rétentions et priorités infinies signifient « pas de couverture ». Avec
+    `parallel`, une tâche par taux de quote-part est envoyée au pool de
+    processus (repli séquentiel si le pool est cassé). La valeur
+    économique (EVA) = résultat attendu - coût du capital x SCR.
+    """
+    retentions = [float(r) for r in retentions]
+    if min(retentions) < sample["threshold"]:
+        raise ValueError("Rétention inférieure au seuil des sinistres conservés dans l'échantillon")
+    args = (premium, capital)
+    kwargs = dict(retentions=retentions, sl_priorities=[float(p) for p in sl_priorities], sl_limit=sl_limit,
+                  qs_commission=qs_commission, xl_loading=xl_loading, sl_loading=sl_loading)
+    rows = None
+    if parallel and len(qs_rates) > 1:
+        try:
+            pool = process_pool()
+            futures = [pool.submit(_evaluate_qs_batch, sample, *args, qs_rate=float(q), **kwargs) for q in qs_rates]
+            rows = [row for fut in futures for row in fut.result()]
+        except BrokenProcessPool:
+            reset_process_pool()
+    if rows is None:
+        rows = []
+        for q in qs_rates:
+            rows.extend(_evaluate_qs_batch(sample, *args, qs_rate=float(q), **kwargs))
+    out = pd.DataFrame(rows)
+    out["reinsurance_cost_pct"] = out["reinsurance_cost"] / premium
+    out["eva"] = out["expected_result"] - cost_of_capital * out["scr"]
+    return out
+
+
+def select_programme(candidates: pd.DataFrame, min_solvency: float = 1.0, max_ruin: float = 0.005,
+                     max_cost_pct: float = 0.15, min_retention: float = 500_000):
+    """Filtre les candidats par contraintes et retourne (meilleur, candidats admissibles)."""
+    ok = ((candidates["solvency_ratio"] >= min_solvency)
+          & (candidates["ruin_prob"] <= max_ruin)
+          & (candidates["reinsurance_cost_pct"] <= max_cost_pct)
+          & (candidates["retention"] >= min_retention))
+    feasible = candidates[ok].sort_values("eva", ascending=False)
+    best = feasible.iloc[0] if not feasible.empty else None
+    return best, feasible
+
+
+# =============================================================================
+# PROVISIONNEMENT : CHAIN LADDER, MACK ET BOOTSTRAP ODP
+# =============================================================================
+
+BOOTSTRAP_CHUNK = 1000
+
+
+def _period_number(s: pd.Series, period: str = "Y") -> np.ndarray:
+    """Numéro de période entier (année, ou année*4 + trimestre) d'une colonne date/année."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_datetime64_any_dtype(s):
+        if s.dropna().between(1800, 2300).all():
+            years = s.to_numpy(dtype=np.float64)
+            return years if period == "Y" else years * 4
+    dates = s if pd.api.types.is_datetime64_any_dtype(s) else parse_dates(s, column=s.name)
+    years = dates.dt.year.to_numpy(dtype=np.float64)
+    if period == "Y":
+        return years
+    return years * 4 + (dates.dt.quarter.to_numpy(dtype=np.float64) - 1)
+
+
+def build_triangle(df: pd.DataFrame, origin_col: str = "accident_period", date_col: str = "date",
+                   value_col: str = "paid_claims", period: str = "Y", cumulative_input: bool = False) -> pd.DataFrame:
+    """Triangle cumulé (origine x développement) à partir de données ligne à ligne.
+
+    Les montants sont sommés par (période de survenance, retard de
+    développement) en une passe bincount ; les cellules futures valent NaN.
+    Avec `cumulative_input`, les montants sont déjà cumulés (ex. charge
+    incurred par inventaire) et on retient la valeur de la cellule.
+    """
+    origin = _period_number(df[origin_col], period)
+    calendar = _period_number(df[date_col], period)
+    value = df[value_col].to_numpy(dtype=np.float64)
+    ok = np.isfinite(origin) & np.isfinite(calendar) & np.isfinite(value) & (calendar >= origin)
+    origin, calendar, value = origin[ok].astype(np.int64), calendar[ok].astype(np.int64), value[ok]
+    if origin.size == 0:
+        return pd.DataFrame()
+    first, last_origin, last_calendar = origin.min(), origin.max(), calendar.max()
+    n_rows, n_cols = last_origin - first + 1, last_calendar - first + 1
+    flat = (origin - first) * n_cols + (calendar - origin)
+    cells = np.bincount(flat, weights=value, minlength=n_rows * n_cols).reshape(n_rows, n_cols)
+    if cumulative_input:
+        seen = np.bincount(flat, minlength=n_rows * n_cols).reshape(n_rows, n_cols) > 0
+        tri = pd.DataFrame(np.where(seen, cells, np.nan)).ffill(axis=1).fillna(0.0).to_numpy()
+    else:
+        tri = np.cumsum(cells, axis=1)
+    future = (np.arange(n_rows)[:, None] + np.arange(n_cols)[None, :]) > (last_calendar - first)
+    tri[future] = np.nan
+    labels = np.arange(first, last_origin + 1)
+    if period != "Y":
+        labels = [f"{q // 4}Q{q % 4 + 1}" for q in labels]
+    return pd.DataFrame(tri, index=pd.Index(labels, name="origine"), columns=pd.RangeIndex(tri.shape[1], name="dev"))
+
+
+def _cl_factors(C: np.ndarray, obs: np.ndarray) -> np.ndarray:
+    """Facteurs chain ladder pondérés, vectorisés sur les axes de tête (bootstrap)."""
+    both = obs[:, 1:] & obs[:, :-1]
+    num = np.where(both, C[..., :, 1:], 0.0).sum(axis=-2)
+    den = np.where(both, C[..., :, :-1], 0.0).sum(axis=-2)
+    return np.divide(num, den, out=np.ones_like(num), where=den > 0)
+
+
+def _latest_index(obs: np.ndarray) -> np.ndarray:
+    return obs.sum(axis=1) - 1
+
+
+def chain_ladder(triangle) -> dict:
+    """Chain ladder : facteurs de développement, ultimes, IBNR et erreur standard de Mack."""
+    C = np.asarray(triangle, dtype=np.float64)
+    obs = ~np.isnan(C)
+    Cz = np.where(obs, C, 0.0)
+    n, m = C.shape
+    f = _cl_factors(Cz, obs)
+    cdf = np.append(np.cumprod(f[::-1])[::-1], 1.0)  # cdf[j] = produit des f_k, k >= j
+    d = _latest_index(obs)
+    latest = Cz[np.arange(n), d]
+    ultimate = latest * cdf[d]
+
+    # Triangle complété (projections) pour Mack
+    full = Cz.copy()
+    for j in range(m - 1):
+        fut = ~obs[:, j + 1]
+        full[fut, j + 1] = full[fut, j] * f[j]
+
+    # Variances de Mack σ²_j
+    both = obs[:, 1:] & obs[:, :-1]
+    n_j = both.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(both, Cz[:, 1:] / np.where(Cz[:, :-1] == 0, np.nan, Cz[:, :-1]), np.nan)
+        dev2 = np.where(both, Cz[:, :-1] * (ratios - f) ** 2, 0.0)
+        sigma2 = np.where(n_j > 1, np.nansum(dev2, axis=0) / (n_j - 1), np.nan)
+    if m >= 3 and np.isnan(sigma2[-1]):
+        a, b = sigma2[-3], sigma2[-2]
+        sigma2[-1] = np.nanmin([b ** 2 / a if a else np.nan, a, b])
+    sigma2 = np.nan_to_num(sigma2)
+    den = np.where(both, Cz[:, :-1], 0.0).sum(axis=0)
+
+    # MSE de Mack par origine et total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        term = np.where(den > 0, sigma2 / f ** 2, 0.0)
+        inv_full = np.where(full[:, :-1] > 0, 1.0 / full[:, :-1], 0.0)
+        k = np.arange(m - 1)[None, :]
+        future_k = k >= d[:, None]
+        mse = ultimate ** 2 * np.where(future_k, term * (inv_full + np.where(den > 0, 1.0 / den, 0.0)), 0.0).sum(axis=1)
+        cov_term = np.where(future_k, 2 * term * np.where(den > 0, 1.0 / den, 0.0), 0.0).sum(axis=1)
+    later_ult = np.cumsum(ultimate[::-1])[::-1] - ultimate  # somme des ultimes des origines plus récentes
+    total_mse = mse.sum() + (ultimate * later_ult * cov_term).sum()
+
+    return {
+        "factors": f,
+        "cdf": cdf,
+        "latest": latest,
+        "ultimate": ultimate,
+        "ibnr": ultimate - latest,
+        "mack_se": np.sqrt(mse),
+        "mack_total_se": float(np.sqrt(total_mse)),
+        "full_triangle": full,
+    }
+
+
+def _odp_residuals(C: np.ndarray):
+    """Incréments ajustés, résidus de Pearson ajustés et paramètre d'échelle φ (ODP)."""
+    obs = ~np.isnan(C)
+    Cz = np.where(obs, C, 0.0)
+    cl = chain_ladder(C)
+    fitted_cum = cl["ultimate"][:, None] / cl["cdf"][None, :]
+    fitted_inc = np.diff(fitted_cum, axis=1, prepend=0.0)
+    actual_inc = np.diff(Cz, axis=1, prepend=0.0)
+    use = obs & (fitted_inc > 0)
+    resid = np.zeros_like(Cz)
+    resid[use] = (actual_inc[use] - fitted_inc[use]) / np.sqrt(fitted_inc[use])
+    n_obs = int(use.sum())
+    n_params = C.shape[0] + C.shape[1] - 1
+    dof = max(n_obs - n_params, 1)
+    phi = float((resid[use] ** 2).sum() / dof)
+    adjusted = resid[use] * np.sqrt(n_obs / dof)
+    if np.any(adjusted != 0):
+        adjusted = adjusted[adjusted != 0]  # les cellules de coin ont un résidu nul par construction
+    return obs, fitted_inc, adjusted, max(phi, 1e-12)
+
+
+def _odp_bootstrap_chunk(obs, fitted_inc, residuals, phi, n_boot, seed, process_variance=True):
+    """Réserves bootstrap (n_boot, n_origines) pour une tranche de rééchantillonnages."""
+    rng = np.random.default_rng(seed)
+    n, m = obs.shape
+    r = rng.choice(residuals, size=(n_boot, n, m))
+    pseudo_inc = np.where(obs, fitted_inc + r * np.sqrt(np.abs(fitted_inc)), 0.0)
+    C = np.cumsum(pseudo_inc, axis=2)
+    C = np.where(obs, C, 0.0)
+    f = _cl_factors(C, obs)  # (n_boot, m-1)
+    reserves = np.zeros((n_boot, n))
+    cum = C.copy()
+    for j in range(m - 1):
+        fut = ~obs[:, j + 1]
+        if not fut.any():
+            continue
+        # Projection chain ladder des pseudo-données ; le bruit de processus
+        # s'ajoute aux incréments projetés sans être propagé (England-Verrall)
+        mean_inc = np.where(fut[None, :], cum[:, :, j] * (f[:, j][:, None] - 1.0), 0.0)
+        cum[:, :, j + 1] = np.where(fut[None, :], cum[:, :, j] + mean_inc, cum[:, :, j + 1])
+        if process_variance:
+            inc = np.sign(mean_inc) * rng.gamma(np.abs(mean_inc) / phi, phi)
+        else:
+            inc = mean_inc
+        reserves += inc
+    return reserves
+
+
+def odp_bootstrap(triangle, n_boot: int = 10_000, seed=42, process_variance=True, parallel=True,
+                  chunk: int = BOOTSTRAP_CHUNK) -> np.ndarray:
+    """Bootstrap ODP (England-Verrall) : distribution des réserves, forme (n_boot, n_origines).
+
+    Les rééchantillonnages sont traités par tranches vectorisées réparties
+    sur le pool de processus, avec des graines dérivées de `seed`.
+    """
+    C = np.asarray(triangle, dtype=np.float64)
+    obs, fitted_inc, residuals, phi = _odp_residuals(C)
+    sizes = [min(chunk, n_boot - start) for start in range(0, n_boot, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (obs, fitted_inc, residuals, phi)
+    if parallel and len(sizes) > 1:
+        try:
+            pool = process_pool()
+            futures = [pool.submit(_odp_bootstrap_chunk, *args, n, sd, process_variance) for n, sd in zip(sizes, seeds)]
+            return np.concatenate([fut.result() for fut in futures])
+        except BrokenProcessPool:
+            reset_process_pool()
+    return np.concatenate([_odp_bootstrap_chunk(*args, n, sd, process_variance) for n, sd in zip(sizes, seeds)])
+
+
+def reserve_summary(reserves: np.ndarray, percentiles=(50, 75, 90, 95, 99.5)) -> pd.DataFrame:
+    """Moyenne, écart-type et percentiles des réserves bootstrap (total en dernière ligne)."""
+    total = reserves.sum(axis=1)
+    data = np.column_stack([reserves, total])
+    out = pd.DataFrame({"mean": data.mean(axis=0), "std": data.std(axis=0)})
+    for p, values in zip(percentiles, np.percentile(data, percentiles, axis=0)):
+        out[f"P{p:g}"] = values
+    return out
+
+
+def make_demo_claims_development(n_origins: int = 10, first_year: int = 2015, seed=42) -> pd.DataFrame:
+    """Paiements de démonstration (survenance, année de paiement, montant) déjà observés."""
+    rng = np.random.default_rng(seed)
+    pattern = np.diff(1 - np.exp(-0.6 * np.arange(n_origins + 1)))
+    pattern /= pattern.sum()
+    ultimates = rng.lognormal(np.log(5e6), 0.15, n_origins) * 1.04 ** np.arange(n_origins)
+    origin, dev = np.meshgrid(np.arange(n_origins), np.arange(n_origins), indexing="ij")
+    observed = origin + dev < n_origins
+    mean = ultimates[origin] * pattern[dev]
+    paid = rng.gamma(mean / 2e4, 2e4)
+    return pd.DataFrame({
+        "accident_period": first_year + origin[observed],
+        "date": first_year + origin[observed] + dev[observed],
+        "paid_claims": paid[observed],
+    })
+
+
+# =============================================================================
+# EXPORTS COMPRESSÉS EN STREAMING
+# =============================================================================
+
+EXPORT_FORMATS = {"csv.gz": "application/gzip", "parquet": "application/octet-stream",
+                  "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+EXPORT_CHUNK_ROWS = 100_000
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def export_dir() -> Path:
+    return Path(os.environ.get("REASSURANCE_CACHE_DIR", ".cache/uploads")).parent / "exports"
+
+
+def export_frame(df: pd.DataFrame, fmt: str, path, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Path:
+    """Écrit `df` au format demandé par tranches de lignes, sans sérialisation complète en mémoire."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    n = len(df)
+    try:
+        if fmt == "csv.gz":
+            with gzip.open(tmp, "wt", encoding="utf-8", newline="", compresslevel=6) as fh:
+                for start in range(0, max(n, 1), chunk_rows):
+                    df.iloc[start:start + chunk_rows].to_csv(fh, index=False, header=start == 0)
+        elif fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            writer = None
+            try:
+                for start in range(0, max(n, 1), chunk_rows):
+                    table = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp, table.schema, compression="zstd")
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+        elif fmt == "xlsx":
+            if n > EXCEL_MAX_ROWS:
+                raise ValueError(f"Excel est limité à {EXCEL_MAX_ROWS:,} lignes ({n:,} demandées)")
+            with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+                for start in range(0, max(n, 1), chunk_rows):
+                    df.iloc[start:start + chunk_rows].to_excel(
+                        writer, index=False, header=start == 0,
+                        startrow=0 if start == 0 else start + 1)
+        else:
+            raise ValueError(f"Format d'export inconnu : {fmt}")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    evict_cache(path.parent, UPLOAD_CACHE_MAX_BYTES, keep=path, pattern="*")
+    return path
+
+
+# =============================================================================
+# RAPPORTS D'ANALYSE EN ARRIÈRE-PLAN
+# =============================================================================
+
+REPORT_FORMATS = {"html": "text/html", "pdf": "application/pdf"}
+REPORT_MAX_ROWS = 500
+REPORT_PDF_ROWS = 35
+
+_REPORT_JOBS = {}
+_REPORT_LOCK = threading.Lock()
+
+
+def report_dir() -> Path:
+    return Path(os.environ.get("REASSURANCE_CACHE_DIR", ".cache/uploads")).parent / "reports"
+
+
+def report_key(dataset_key, params: dict) -> str:
+    """Clé d'un rapport : empreinte du jeu de données et des paramètres d'analyse."""
+    return upload_cache_key(repr(dataset_key), params)
+
+
+def _section_html(i: int, kind: str, title: str, payload) -> str:
+    import html
+
+    parts = [f"<h2>{html.escape(title)}</h2>"]
+    if kind == "text":
+        parts.append("<p>" + html.escape(str(payload)).replace("\n", "<br>") + "</p>")
+    elif kind == "table":
+        parts.append(payload.head(REPORT_MAX_ROWS).to_html(index=False, float_format=lambda v: f"{v:,.4g}",
+                                                          border=0, classes="kpi", na_rep="–"))
+    elif kind == "figure":
+        # JSON Plotly déjà sérialisé par l'application : aucun recalcul
+        fig_json = payload.replace("</", "<\\/")
+        parts.append(f'<div id="fig{i}" class="fig"></div>'
+                     f'<script>var f{i} = {fig_json}; Plotly.newPlot("fig{i}", f{i}.data, f{i}.layout, '
+                     f'{{responsive: true}});</script>')
+    return "\n".join(parts)
+
+
+def _render_html(path: Path, title: str, sections, step):
+    import html
+
+    from plotly.offline import get_plotlyjs
+
+    # plotly.js embarqué : le rapport reste consultable hors ligne
+    head = (f'<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<script>{get_plotlyjs()}</script><style>'
+            "body{font-family:sans-serif;margin:2rem auto;max-width:1100px;color:#1f2937}"
+            "h1{color:#1f4e79}h2{border-bottom:2px solid #1f4e79;padding-bottom:.2rem;margin-top:2rem}"
+            "table.kpi{border-collapse:collapse;font-size:.85rem}"
+            "table.kpi th,table.kpi td{padding:.25rem .6rem;border-bottom:1px solid #e5e7eb;text-align:right}"
+            ".fig{height:450px}</style></head><body>"
+            f"<h1>{html.escape(title)}</h1><p>Généré le {datetime.now():%d/%m/%Y %H:%M}</p>")
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(head)
+        for i, (kind, sec_title, payload) in enumerate(sections):
+            step(i, sec_title)
+            fh.write(_section_html(i, kind, sec_title, payload))
+        fh.write("</body></html>")
+
+
+def _trace_values(v) -> np.ndarray:
+    """Décode un tableau de figure Plotly (liste ou encodage binaire base64)."""
+    import base64
+
+    if isinstance(v, dict) and "bdata" in v:
+        a = np.frombuffer(base64.b64decode(v["bdata"]), dtype=v["dtype"])
+        shape = v.get("shape")
+        if isinstance(shape, str):
+            shape = tuple(int(x) for x in shape.split(","))
+        return a.reshape(shape) if shape else a
+    a = np.asarray(v)
+    if a.dtype.kind in "OU":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # libellés non datés : format non déductible
+            dates = pd.to_datetime(pd.Series(a.ravel()), errors="coerce")
+        if dates.notna().all():
+            return dates.to_numpy().reshape(a.shape)
+    return a
+
+
+def _plot_bar(ax, trace: dict, k: int, n: int):
+    """Trace en barres groupées (k-ième de n) ; catégories placées sur des positions entières."""
+    horizontal = trace.get("orientation") == "h"
+    cats, values = _trace_values(trace.get("y" if horizontal else "x", [])), _trace_values(
+        trace.get("x" if horizontal else "y", []))
+    width = 0.8 / n
+    pos = np.arange(len(values)) + (k - (n - 1) / 2) * width
+    if horizontal:
+        ax.barh(pos, values, height=width, label=trace.get("name") or None)
+        ax.set_yticks(np.arange(len(values)), [str(c) for c in cats], fontsize=8)
+    else:
+        ax.bar(pos, values, width=width, label=trace.get("name") or None)
+        ax.set_xticks(np.arange(len(values)), [str(c) for c in cats], fontsize=8,
+                      rotation=45 if len(values) > 8 else 0)
+
+
+def _render_pdf(path: Path, title: str, sections, step):
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.figure import Figure
+
+    a4 = (11.69, 8.27)
+    with PdfPages(path) as pdf:
+        fig = Figure(figsize=a4)
+        fig.text(0.5, 0.55, title, ha="center", fontsize=22, weight="bold", color="#1f4e79")
+        fig.text(0.5, 0.45, f"Généré le {datetime.now():%d/%m/%Y %H:%M}", ha="center", fontsize=12)
+        pdf.savefig(fig)
+        for i, (kind, sec_title, payload) in enumerate(sections):
+            step(i, sec_title)
+            fig = Figure(figsize=a4)
+            fig.suptitle(sec_title, fontsize=14, weight="bold", color="#1f4e79")
+            ax = fig.add_axes([0.06, 0.08, 0.88, 0.8])
+            if kind == "text":
+                ax.axis("off")
+                ax.text(0, 1, str(payload), va="top", fontsize=11, wrap=True)
+            elif kind == "table":
+                ax.axis("off")
+                t = payload.head(REPORT_PDF_ROWS)
+                cells = [[f"{v:,.4g}" if isinstance(v, (float, np.floating)) else str(v) for v in row]
+                         for row in t.itertuples(index=False)]
+                tbl = ax.table(cellText=cells, colLabels=[str(c) for c in t.columns], loc="upper center")
+                tbl.auto_set_font_size(False)
+                tbl.set_fontsize(7 if t.shape[1] > 8 else 9)
+            elif kind == "figure":
+                spec = json.loads(payload)
+                traces = spec.get("data", [])
+                n_bars, k_bar = sum(t.get("type") == "bar" for t in traces), 0
+                for trace in traces:
+                    kind_trace = trace.get("type")
+                    if kind_trace == "heatmap":
+                        im = ax.imshow(_trace_values(trace["z"]), aspect="auto", origin="lower",
+                                       cmap="RdYlGn_r")
+                        fig.colorbar(im, ax=ax)
+                    elif kind_trace == "pie":
+                        values = _trace_values(trace.get("values", []))
+                        labels = [str(v) for v in _trace_values(trace.get("labels", range(len(values))))]
+                        ax.pie(values, labels=labels, autopct="%1.1f%%", textprops={"fontsize": 8})
+                        ax.axis("equal")
+                    elif kind_trace == "bar":
+                        _plot_bar(ax, trace, k_bar, n_bars)
+                        k_bar += 1
+                    elif "x" in trace and "y" in trace:
+                        ax.plot(_trace_values(trace["x"]), _trace_values(trace["y"]),
+                                marker="o" if "markers" in trace.get("mode", "") else None,
+                                label=trace.get("name") or None)
+                if ax.get_legend_handles_labels()[0]:
+                    ax.legend(fontsize=8)
+                ax.grid(alpha=0.3)
+            pdf.savefig(fig)
+
+
+class ReportJob:
+    """Génération d'un rapport dans un thread de fond ; les reruns Streamlit lisent l'avancement."""
+
+    def __init__(self, path, title: str = "", sections=None):
+        self.path = Path(path)
+        self.title = title
+        self.progress = 1.0 if self.path.exists() else 0.0
+        self.message = "Rapport prêt" if self.path.exists() else "En attente"
+        self.error = None
+        self._sections = sections
+        self._thread = None
+
+    @property
+    def done(self) -> bool:
+        """Thread terminé (ou jamais lancé pour un rapport déjà présent sur disque)."""
+        return self._thread is None or not self._thread.is_alive()
+
+    @property
+    def ready(self) -> bool:
+        """Rapport téléchargeable : terminé sans erreur et fichier toujours en cache."""
+        return self.done and self.error is None and self.path.exists()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"report-{self.path.stem}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _step(self, i: int, label: str):
+        self.progress = i / max(len(self._sections), 1)
+        self.message = f"Section {i + 1}/{len(self._sections)} : {label}"
+
+    def _run(self):
+        render = _render_pdf if self.path.suffix == ".pdf" else _render_html
+        tmp = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            render(tmp, self.title, self._sections, self._step)
+            os.replace(tmp, self.path)
+            self.progress, self.message = 1.0, "Rapport prêt"
+            evict_cache(self.path.parent, UPLOAD_CACHE_MAX_BYTES, keep=self.path, pattern="*")
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            tmp.unlink(missing_ok=True)
+            self._sections = None
+
+
+def report_job(key: str, fmt: str = "html"):
+    """Tâche connue pour cette clé (en cours ou terminée), sinon None.
+
+    Une tâche terminée dont le fichier a été évincé du cache est oubliée.
+    """
+    path = report_dir() / f"{key}.{fmt}"
+    with _REPORT_LOCK:
+        job = _REPORT_JOBS.get(path)
+        if job is not None and job.done and job.error is None and not path.exists():
+            del _REPORT_JOBS[path]
+            job = None
+        if job is None and path.exists():
+            job = _REPORT_JOBS[path] = ReportJob(path)
+        return job
+
+
+def submit_report(key: str, sections, fmt: str = "html", title: str = "Rapport d'analyse") -> ReportJob:
+    """Lance la génération en arrière-plan, ou renvoie le rapport déjà produit pour cette clé.
+
+    `sections` est une liste de (type, titre, contenu) avec type "text",
+    "table" (DataFrame) ou "figure" (JSON Plotly) ; elle peut être un
+    callable, évalué seulement si le rapport doit réellement être produit.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Format de rapport inconnu : {fmt}")
+    path = report_dir() / f"{key}.{fmt}"
+    with _REPORT_LOCK:
+        job = _REPORT_JOBS.get(path)
+        if job is not None and job.error is None and (not job.done or path.exists()):
+            return job
+        if path.exists():
+            job = _REPORT_JOBS[path] = ReportJob(path, title)
+            return job
+        job = _REPORT_JOBS[path] = ReportJob(path, title, sections() if callable(sections) else sections)
+        return job.start()
+
+
+# =============================================================================
+# PROJECTION ORSA PLURIANNUELLE (MONTE CARLO)
+# =============================================================================
+
+ORSA_CHUNK_SCENARIOS = 25_000
+ORSA_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _orsa_chunk(n: int, seed, a: dict) -> np.ndarray:
+    """Fonds propres de fin d'année (n, Y) pour une tranche de scénarios."""
+    rng = np.random.default_rng(seed)
+    years = a["years"]
+    growth = (1.0 + a["growth"]) ** np.arange(years)
+    gross_premium = a["premium"] * growth                                     # (Y,)
+
+    # Sinistres attritionnels : loss ratio lognormal de moyenne et CV donnés
+    s2 = np.log1p(a["loss_ratio_cv"] ** 2)
+    lr = rng.lognormal(np.log(a["loss_ratio"]) - s2 / 2, np.sqrt(s2), (n, years))
+    attritional = lr * gross_premium
+
+    # Événements CAT : Poisson x lognormale, XL par événement puis repli par (scénario, année)
+    counts = rng.poisson(a["cat_frequency"], n * years) if a["cat_mean_loss"] > 0 else np.zeros(n * years, int)
+    cs2 = a["cat_sigma"] ** 2
+    sev = rng.lognormal(np.log(max(a["cat_mean_loss"], 1e-12)) - cs2 / 2, a["cat_sigma"], int(counts.sum()))
+    sev *= np.repeat(np.tile(growth, n), counts)
+    cell = np.repeat(np.arange(n * years), counts)
+    xl_rec = np.clip(sev - a["xl_retention"], 0.0, a["xl_limit"])
+    cat_gross = np.bincount(cell, weights=sev, minlength=n * years).reshape(n, years)
+    cat_xl = np.bincount(cell, weights=xl_rec, minlength=n * years).reshape(n, years)
+
+    qs = a["quota_share"]
+    gross_claims = attritional + cat_gross
+    net_claims = (1.0 - qs) * (gross_claims - cat_xl)
+    net_premium = (1.0 - qs) * gross_premium - a["xl_premium"] * growth
+    expenses = a["expense_ratio"] * gross_premium - a["qs_commission"] * qs * gross_premium
+    technical = net_premium - net_claims - expenses                            # (n, Y)
+
+    returns = rng.normal(a["invest_return"], a["invest_vol"], (n, years))
+    own_funds = np.empty((n, years))
+    of = np.full(n, float(a["own_funds"]))
+    for y in range(years):
+        # Produits financiers sur fonds propres et provisions (reserve_ratio x primes nettes)
+        result = technical[:, y] + returns[:, y] * (of + a["reserve_ratio"] * net_premium[y])
+        result = np.where(result > 0, result * (1.0 - a["tax_rate"]), result)
+        of = of + result
+        own_funds[:, y] = of
+    return own_funds
+
+
+def orsa_projection(premium: float, own_funds: float, scr_ratio: float, years: int = 5,
+                    n_scenarios: int = 100_000, growth: float = 0.03, loss_ratio: float = 0.65,
+                    loss_ratio_cv: float = 0.08, expense_ratio: float = 0.28, cat_frequency: float = 0.3,
+                    cat_mean_loss: float = 0.0, cat_sigma: float = 1.0, quota_share: float = 0.0,
+                    qs_commission: float = 0.30, xl_retention: float = np.inf, xl_limit: float = 0.0,
+                    xl_premium: float = 0.0, invest_return: float = 0.03, invest_vol: float = 0.04,
+                    reserve_ratio: float = 1.2, tax_rate: float = 0.25, seed=42,
+                    chunk: int = ORSA_CHUNK_SCENARIOS, parallel: bool = False) -> dict:
+    """Projette le bilan sur `years` années pour n_scenarios trajectoires.
+
+    Chaque année : primes brutes (croissance), sinistres attritionnels
+    (loss ratio lognormal) et CAT (Poisson x lognormale, XL par événement),
+    quote-part, frais, produits financiers stochastiques sur fonds propres
+    et provisions, impôt sur les résultats positifs. Le SCR vaut
+    scr_ratio x primes nettes de l'année. Les scénarios sont simulés par
+    tranches avec des graines SeedSequence.spawn (résultat identique en
+    séquentiel ou en parallèle).
+    """
+    a = {k: v for k, v in locals().items() if k not in ("n_scenarios", "seed", "chunk", "parallel")}
+    sizes = [min(chunk, n_scenarios - start) for start in range(0, n_scenarios, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    of = np.empty((n_scenarios, years))
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+    done = False
+    if parallel and len(sizes) > 1:
+        try:
+            pool = process_pool()
+            futures = [pool.submit(_orsa_chunk, n, sd, a) for n, sd in zip(sizes, seeds)]
+            for i, fut in enumerate(futures):
+                of[offsets[i]:offsets[i + 1]] = fut.result()
+            done = True
+        except BrokenProcessPool:
+            reset_process_pool()
+    if not done:
+        for i, (n, sd) in enumerate(zip(sizes, seeds)):
+            of[offsets[i]:offsets[i + 1]] = _orsa_chunk(n, sd, a)
+
+    growth_path = (1.0 + growth) ** np.arange(years)
+    net_premium = (1.0 - quota_share) * premium * growth_path - xl_premium * growth_path
+    scr = scr_ratio * net_premium
+    solvency = of / scr
+    ruined = np.maximum.accumulate(of <= 0, axis=1)
+    pct = np.percentile(solvency, ORSA_PERCENTILES, axis=0)
+    summary = pd.DataFrame({"year": np.arange(1, years + 1), "scr": scr,
+                            "own_funds_mean": of.mean(axis=0),
+                            "solvency_mean": solvency.mean(axis=0)})
+    for p, row in zip(ORSA_PERCENTILES, pct):
+        summary[f"solvency_p{p}"] = row
+    summary["prob_below_100"] = (solvency < 1.0).mean(axis=0)
+    summary["ruin_prob"] = ruined.mean(axis=0)
+    counts, edges = np.histogram(solvency[:, -1], bins=80)
+    return {"summary": summary, "hist_counts": counts, "hist_edges": edges, "n_scenarios": n_scenarios}
+
+
+# =============================================================================
+# CRÉDIBILITÉ BÜHLMANN-STRAUB
+# =============================================================================
+
+CREDIBILITY_GROUP = ("cedant", "lob")
+CREDIBILITY_STATS = ("n_periods", "weight", "s1", "s2")
+
+
+def credibility_stats(cube: pd.DataFrame, group=CREDIBILITY_GROUP, value="incurred_claims",
+                      weight="earned_premium") -> pd.DataFrame:
+    """Statistiques suffisantes additives par groupe (une passe groupée).
+
+    Pour chaque groupe i et période j : X_ij = sinistres / primes, w_ij =
+    primes. On conserve n_i, W_i = Σ w, S1_i = Σ w X et S2_i = Σ w X², qui
+    s'additionnent d'une période à l'autre (mise à jour incrémentale).
+    """
+    group = [g for g in group if g in cube.columns]
+    per = cube.groupby(group + ["date"], observed=True)[[value, weight]].sum()
+    w = per[weight].to_numpy(dtype=np.float64)
+    v = per[value].to_numpy(dtype=np.float64)
+    valid = w > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(valid, v / w, 0.0)
+    per = pd.DataFrame({"n_periods": valid.astype(np.int64), "weight": np.where(valid, w, 0.0),
+                        "s1": np.where(valid, v, 0.0), "s2": np.where(valid, w * x * x, 0.0),
+                        "last_date": per.index.get_level_values("date")}, index=per.index)
+    return per.groupby(level=group, observed=True).agg(
+        n_periods=("n_periods", "sum"), weight=("weight", "sum"), s1=("s1", "sum"), s2=("s2", "sum"),
+        last_date=("last_date", "max"))
+
+
+def update_credibility_stats(stats: pd.DataFrame, new_rows: pd.DataFrame, value="incurred_claims",
+                             weight="earned_premium") -> pd.DataFrame:
+    """Ajoute une ou plusieurs périodes complètes aux statistiques existantes.
+
+    Seules les nouvelles lignes sont agrégées. Une période déjà comptée
+    pour un groupe serait comptée deux fois : elle est refusée.
+    """
+    delta = credibility_stats(new_rows, stats.index.names, value, weight)
+    first_new = new_rows.groupby(list(stats.index.names), observed=True)["date"].min()
+    overlap = stats["last_date"].reindex(first_new.index)
+    if (first_new <= overlap).any():
+        raise ValueError("Les nouvelles lignes recouvrent des périodes déjà intégrées")
+    merged = pd.concat([stats, delta])
+    return merged.groupby(level=list(range(merged.index.nlevels)), observed=True).agg(
+        n_periods=("n_periods", "sum"), weight=("weight", "sum"), s1=("s1", "sum"), s2=("s2", "sum"),
+        last_date=("last_date", "max"))
+
+
+def refresh_credibility_stats(stats: pd.DataFrame, cube: pd.DataFrame, dates) -> pd.DataFrame:
+    """Statistiques après ajout des périodes `dates` au cube (cf. append_to_cube).
+
+    Les périodes nouvelles pour tous les groupes sont ajoutées de façon
+    incrémentale ; si l'ajout complète une période déjà intégrée, les
+    statistiques sont recalculées sur le cube entier.
+    """
+    new_rows = cube[cube["date"].isin(pd.Index(dates))]
+    try:
+        return update_credibility_stats(stats, new_rows)
+    except ValueError:
+        return credibility_stats(cube, stats.index.names)
+
+
+def buhlmann_straub(stats: pd.DataFrame, collective="lob") -> pd.DataFrame:
+    """Facteurs de crédibilité et loss ratios crédibilisés pour tous les groupes.
+
+    Estimateurs non biaisés de Bühlmann-Straub, calculés par collectif
+    (ex. tous les cédants d'une même ligne) avec np.bincount :
+    σ² = Σ_i (S2_i - S1_i²/W_i) / Σ_i (n_i - 1),
+    a = [Σ_i W_i (X̄_i - X̄)² - (I - 1) σ²] / (W - Σ W_i² / W), tronqué à 0,
+    Z_i = W_i / (W_i + σ²/a). Le loss ratio crédibilisé vaut
+    Z_i X̄_i + (1 - Z_i) μ, μ étant la moyenne des X̄_i pondérée par Z_i.
+    """
+    n = stats["n_periods"].to_numpy(dtype=np.float64)
+    W = stats["weight"].to_numpy(dtype=np.float64)
+    S1 = stats["s1"].to_numpy(dtype=np.float64)
+    S2 = stats["s2"].to_numpy(dtype=np.float64)
+    if collective and collective in stats.index.names:
+        codes, labels = pd.factorize(stats.index.get_level_values(collective))
+    else:
+        codes, labels = np.zeros(len(stats), dtype=np.intp), pd.Index(["Portefeuille"])
+    k = len(labels)
+
+    def by_collective(v):
+        return np.bincount(codes, weights=v, minlength=k)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xbar = np.where(W > 0, S1 / W, np.nan)
+        within = np.where(W > 0, S2 - S1 * S1 / W, 0.0)
+        sigma2 = by_collective(within) / by_collective(np.maximum(n - 1, 0))
+        W_c = by_collective(W)
+        x_c = by_collective(S1) / W_c
+        groups_c = by_collective((W > 0).astype(np.float64))
+        between = by_collective(np.where(W > 0, W * (xbar - x_c[codes]) ** 2, 0.0))
+        a = (between - (groups_c - 1) * sigma2) / (W_c - by_collective(W * W) / W_c)
+        a = np.maximum(np.nan_to_num(a, nan=0.0), 0.0)
+        kappa = np.where(a > 0, sigma2 / a, np.inf)
+        Z = np.where(W > 0, W / (W + kappa[codes]), 0.0)
+        Z_c = by_collective(Z)
+        mu = np.where(Z_c > 0, by_collective(Z * np.nan_to_num(xbar)) / Z_c, x_c)
+        cred = Z * np.nan_to_num(xbar) + (1 - Z) * mu[codes]
+
+    out = pd.DataFrame({"n_periods": n.astype(np.int64), "exposure": W, "loss_ratio": xbar,
+                        "credibility": Z, "credibility_loss_ratio": cred}, index=stats.index)
+    out.attrs["structure"] = pd.DataFrame({"sigma2": sigma2, "a": a, "k": kappa, "collective_mean": mu},
+                                          index=pd.Index(labels, name=collective or "collectif"))
+    return out
+
+
+# =============================================================================
+# TABLE D'ÉVÉNEMENTS CATASTROPHE (ELT) ET COURBES OEP / AEP
+# =============================================================================
+
+CAT_RETURN_PERIODS = (2, 5, 10, 25, 50, 100, 200, 250, 500, 1000)
+CAT_MIN_INTENSITY = 3.0
+CAT_MAX_INTENSITY = 10.0
+CAT_MAX_OCCURRENCES = int(os.environ.get("REASSURANCE_CAT_MAX_OCCURRENCES", 20_000_000))
+
+
+def make_event_loss_table(tiv: float, damage_factor: float, annual_prob: float, intensity: float,
+                          density: float, n_regions: int = 5, n_events: int = 2_000, b_value: float = 0.5,
+                          cv: float = 0.8, seed=42) -> pd.DataFrame:
+    """Table d'événements synthétique : taux annuel, perte moyenne et écart-type par événement.
+
+    `intensity` est l'intensité de référence, ramenée dans
+    [CAT_MIN_INTENSITY, CAT_MAX_INTENSITY] : les événements de la table ont une
+    intensité au moins égale à cette référence, avec des taux décroissants en
+    10^(-b I) (loi de Gutenberg-Richter tronquée) dont la somme vaut
+    `annual_prob`. La fréquence totale reste donc bornée quelle que soit la
+    référence, et la sévérité croît avec elle. Le taux de dommage suit une
+    courbe de vulnérabilité damage_factor x (I/10)³ x densité, plafonnée à
+    100 %, appliquée à la part de la valeur assurée de la région touchée.
+    """
+    rng = np.random.default_rng(seed)
+    region_tiv = tiv * rng.dirichlet(np.full(n_regions, 4.0))
+    region = rng.integers(0, n_regions, n_events)
+    reference = float(np.clip(intensity, CAT_MIN_INTENSITY, CAT_MAX_INTENSITY))
+    # Même tirage uniforme pour toute référence : la perte de chaque événement croît avec elle
+    event_intensity = reference + (CAT_MAX_INTENSITY - reference) * rng.random(n_events)
+    footprint = rng.beta(2.0, 6.0, n_events)
+    exposure = footprint * region_tiv[region]
+    damage_ratio = np.minimum(1.0, damage_factor * (event_intensity / 10.0) ** 3 * density)
+    mean_loss = damage_ratio * exposure
+
+    raw = 10.0 ** (-b_value * (event_intensity - reference))
+    rate = raw * (annual_prob / raw.sum())
+    return pd.DataFrame({
+        "event_id": np.arange(n_events),
+        "region": pd.Categorical.from_codes(region, [f"Région {i + 1}" for i in range(n_regions)]),
+        "intensity": event_intensity,
+        "rate": rate,
+        "mean_loss": mean_loss,
+        "std_loss": cv * mean_loss,
+        "exposure": exposure,
+    })
+
+
+def _elt_chunk(cum_rate: np.ndarray, mean: np.ndarray, std: np.ndarray, exposure: np.ndarray,
+               n_years: int, seed):
+    """Occurrences d'une tranche d'années : (pertes, année locale, indice d'événement)."""
+    rng = np.random.default_rng(seed)
+    lam = cum_rate[-1]
+    counts = rng.poisson(lam, n_years)
+    total = int(counts.sum())
+    event = np.searchsorted(cum_rate, rng.random(total) * lam, side="right")
+    np.minimum(event, cum_rate.size - 1, out=event)
+    m, s = mean[event], std[event]
+    # Incertitude secondaire : loi gamma de moyenne m et d'écart-type s, plafonnée à l'exposition
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shape = np.where(s > 0, (m / s) ** 2, 1.0)
+        scale = np.where(m > 0, s * s / m, 0.0)
+    loss = np.where(s > 0, rng.gamma(shape, scale), m)
+    np.minimum(loss, exposure[event], out=loss)
+    years = np.repeat(np.arange(n_years, dtype=np.int64), counts)
+    return loss, years, event
+
+
+def simulate_elt(elt: pd.DataFrame, n_years: int = 100_000, seed=42, chunk_years: int = MC_CHUNK_YEARS,
+                 parallel: bool = False) -> dict:
+    """Simule les occurrences d'événements de la table sur n_years années.
+
+    Nombre annuel d'événements ~ Poisson(Σ taux), choix de l'événement
+    proportionnel à son taux (recherche dichotomique dans les taux cumulés),
+    perte gamma autour de la perte moyenne. La sortie (pertes, années) a le
+    même format que simulate_individual_losses et alimente directement
+    price_xl_layers ; les pertes annuelles servent au stop-loss. Au-delà de
+    CAT_MAX_OCCURRENCES occurrences attendues, ValueError (protection mémoire).
+    """
+    cum_rate = np.cumsum(elt["rate"].to_numpy(dtype=np.float64))
+    expected = cum_rate[-1] * n_years if cum_rate.size else 0.0
+    if expected > CAT_MAX_OCCURRENCES:
+        raise ValueError(f"{expected:,.0f} occurrences attendues (maximum {CAT_MAX_OCCURRENCES:,})")
+    mean = elt["mean_loss"].to_numpy(dtype=np.float64)
+    std = elt["std_loss"].to_numpy(dtype=np.float64)
+    exposure = elt["exposure"].to_numpy(dtype=np.float64)
+    sizes = [min(chunk_years, n_years - start) for start in range(0, n_years, chunk_years)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    args = [(cum_rate, mean, std, exposure, n, sd) for n, sd in zip(sizes, seeds)]
+    parts = None
+    if parallel and len(sizes) > 1:
+        try:
+            pool = process_pool()
+            parts = [f.result() for f in [pool.submit(_elt_chunk, *a) for a in args]]
+        except BrokenProcessPool:
+            reset_process_pool()
+    if parts is None:
+        parts = [_elt_chunk(*a) for a in args]
+    losses = np.concatenate([p[0] for p in parts])
+    years = np.concatenate([p[1] + offsets[i] for i, p in enumerate(parts)])
+    event = np.concatenate([p[2] for p in parts])
+    annual, annual_max = annual_losses(losses, years, n_years)
+    return {"losses": losses, "years": years, "event": event, "n_years": n_years,
+            "annual": annual, "annual_max": annual_max}
+
+
+def annual_losses(losses, years, n_years: int):
+    """Pertes annuelles agrégées et plus grosse occurrence de chaque année."""
+    annual = np.bincount(years, weights=losses, minlength=n_years)
+    annual_max = np.zeros(n_years)
+    np.maximum.at(annual_max, years, losses)
+    return annual, annual_max
+
+
+def exceedance_curves(annual, annual_max, return_periods=CAT_RETURN_PERIODS) -> pd.DataFrame:
+    """Courbes OEP (plus grosse occurrence) et AEP (cumul annuel) par période de retour."""
+    rp = np.asarray(return_periods, dtype=np.float64)
+    q = 1.0 - 1.0 / rp
+    return pd.DataFrame({"return_period": rp, "exceedance_prob": 1.0 / rp,
+                         "oep": np.quantile(annual_max, q), "aep": np.quantile(annual, q)})
+
+
+def stop_loss_recoveries(annual, priorities, limits) -> np.ndarray:
+    """Récupérations stop-loss annuelles clip(S - P, 0, L), forme (couches, années)."""
+    return xl_ceded(annual, np.atleast_1d(priorities), np.atleast_1d(limits))
+
+
+# =============================================================================
+# EXPOSURE RATING : COURBES MBBEFD
+# =============================================================================
+
+# Courbes de Swiss Re (paramètre c de Bernegger) et courbe Lloyd's industrielle
+EXPOSURE_CURVES = {"Swiss Re Y1": 1.5, "Swiss Re Y2": 2.0, "Swiss Re Y3": 3.0, "Swiss Re Y4": 4.0,
+                   "Lloyd's industriel": 5.0}
+EXPOSURE_CACHE = MemoCache(maxsize=64)
+
+
+def mbbefd_parameters(c):
+    """Paramètres (b, g) de la famille à un paramètre c de Bernegger (1997)."""
+    c = np.asarray(c, dtype=np.float64)
+    return np.exp(3.1 - 0.15 * (1 + c) * c), np.exp((0.78 + 0.12 * c) * c)
+
+
+def exposure_curve(x, b, g) -> np.ndarray:
+    """Courbe d'exposition MBBEFD G(x), x = franchise / sinistre maximum possible.
+
+    Cas de Bernegger : g = 1 ou b = 0 -> x ; b = 1 -> ln(1 + (g-1)x) / ln g ;
+    bg = 1 -> (1 - b^x) / (1 - b) ; sinon
+    ln[((g-1)b + (1-gb) b^x) / (1-b)] / ln(gb). Vectorisé par diffusion
+    de x, b et g (un jeu de paramètres par tranche possible).
+    """
+    x, b, g = np.broadcast_arrays(np.clip(np.asarray(x, dtype=np.float64), 0.0, 1.0),
+                                  np.asarray(b, dtype=np.float64), np.asarray(g, dtype=np.float64))
+    linear = np.isclose(g, 1.0) | (b == 0)
+    b_one = np.isclose(b, 1.0) & ~linear
+    bg_one = np.isclose(b * g, 1.0) & ~linear & ~b_one
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        bx = b ** x
+        general = np.log(((g - 1) * b + (1 - g * b) * bx) / (1 - b)) / np.log(g * b)
+        out = np.where(linear, x,
+                       np.where(b_one, np.log1p((g - 1) * x) / np.log(g),
+                                np.where(bg_one, (1 - bx) / (1 - b), general)))
+    return out
+
+
+def layer_exposure_shares(sum_insured, priorities, limits, b, g) -> np.ndarray:
+    """Part de la prime de risque de chaque tranche revenant à chaque couche, forme (tranches, couches).
+
+    G((D + L) / SI) - G(D / SI) pour toutes les tranches et couches en une
+    évaluation. Le résultat ne dépend que des sommes assurées, des couches et
+    de la courbe : il est mémorisé par empreinte de ces paramètres, et une
+    modification des primes ou du loss ratio ne réévalue pas la courbe.
+    """
+    si = np.asarray(sum_insured, dtype=np.float64)
+    p = np.atleast_1d(np.asarray(priorities, dtype=np.float64))
+    lim = np.atleast_1d(np.asarray(limits, dtype=np.float64))
+    b = np.asarray(b, dtype=np.float64)
+    g = np.asarray(g, dtype=np.float64)
+    key = array_fingerprint(si, p, lim, b, g)
+    shares = EXPOSURE_CACHE.get(key)
+    if shares is None:
+        bb = b[:, None] if b.ndim else b
+        gg = g[:, None] if g.ndim else g
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lo = p[None, :] / si[:, None]
+            hi = (p + lim)[None, :] / si[:, None]
+        shares = exposure_curve(hi, bb, gg) - exposure_curve(lo, bb, gg)
+        shares = np.where(si[:, None] > 0, shares, 0.0)
+        shares.setflags(write=False)
+        EXPOSURE_CACHE.set(key, shares)
+    return shares
+
+
+def exposure_rating(profile: pd.DataFrame, priorities, limits, c=None, loss_ratio: float = 0.6,
+                    b=None, g=None) -> pd.DataFrame:
+    """Perte attendue par couche XL par risque à partir d'un profil de risques.
+
+    `profile` contient une ligne par tranche de sommes assurées avec les
+    colonnes `sum_insured` (sinistre maximum possible de la tranche) et
+    `premium` ; une colonne `c` optionnelle donne une courbe par tranche.
+    La perte attendue de la couche vaut Σ_k primes_k x LR x part_k.
+    """
+    if c is None and "c" in profile.columns:
+        c = profile["c"].to_numpy(dtype=np.float64)
+    if b is None or g is None:
+        b, g = mbbefd_parameters(3.0 if c is None else c)
+    shares = layer_exposure_shares(profile["sum_insured"].to_numpy(), priorities, limits, b, g)
+    risk_premium = profile["premium"].to_numpy(dtype=np.float64) * loss_ratio
+    expected = risk_premium @ shares
+    limits = np.atleast_1d(np.asarray(limits, dtype=np.float64))
+    return pd.DataFrame({
+        "priority": np.atleast_1d(np.asarray(priorities, dtype=np.float64)),
+        "limit": limits,
+        "expected_loss": expected,
+        "share_of_risk_premium": expected / risk_premium.sum() if risk_premium.sum() else np.nan,
+        "loss_on_line": expected / limits,
+        "exposed_bands": ((shares > 0) & (risk_premium[:, None] > 0)).sum(axis=0),
+    })
+
+
+def make_demo_risk_profile(n_bands: int = 10_000, n_risks: int = 20_000, seed=42) -> pd.DataFrame:
+    """Profil de risques de démonstration : tranches de 100 k€ à 200 M€ de sommes assurées."""
+    rng = np.random.default_rng(seed)
+    edges = np.geomspace(1e5, 2e8, n_bands + 1)
+    weights = edges[1:] ** -0.9
+    n_risks = rng.poisson(n_risks * weights / weights.sum())
+    rate = rng.uniform(0.8e-3, 2.5e-3, n_bands)
+    return pd.DataFrame({
+        "band_lower": edges[:-1],
+        "sum_insured": edges[1:],
+        "n_risks": n_risks,
+        "premium": n_risks * edges[1:] * rate,
+    })
+
+
+# =============================================================================
+# MISE À JOUR INCRÉMENTALE D'UN IMPORT (PÉRIODE AJOUTÉE)
+# =============================================================================
+
+UPLOAD_MANIFEST = "manifest.json"
+_MANIFEST_LOCK = threading.Lock()
+
+
+def _mapping_signature(mapping: dict) -> str:
+    return json.dumps(mapping, sort_keys=True, default=str)
+
+
+def load_manifest(cache_dir=UPLOAD_CACHE_DIR) -> dict:
+    """Imports connus : clé de cache -> empreinte, taille en octets et mapping."""
+    try:
+        return json.loads((Path(cache_dir) / UPLOAD_MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def record_upload(key: str, digest: str, size: int, mapping: dict, cache_dir=UPLOAD_CACHE_DIR):
+    """Enregistre un import mis en cache ; les entrées dont le cache a été évincé sont purgées."""
+    cache_dir = Path(cache_dir)
+    with _MANIFEST_LOCK:
+        manifest = load_manifest(cache_dir)
+        manifest[key] = {"digest": digest, "size": int(size), "mapping": _mapping_signature(mapping)}
+        manifest = {k: v for k, v in manifest.items() if (cache_dir / f"{k}-cube.parquet").exists()}
+        tmp = cache_dir / f"{UPLOAD_MANIFEST}.{os.getpid()}.tmp"
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(manifest), encoding="utf-8")
+            os.replace(tmp, cache_dir / UPLOAD_MANIFEST)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+def cached_upload_columns(digest: str, columns, cache_dir=UPLOAD_CACHE_DIR):
+    """Colonnes d'un fichier déjà importé, relues depuis son cache Parquet sous leurs noms d'origine.
+
+    Cherche dans le manifeste un import du même fichier dont le mapping
+    couvre toutes les colonnes demandées ; None sinon.
+    """
+    for key, entry in load_manifest(cache_dir).items():
+        if entry.get("digest") != digest:
+            continue
+        fields = {v: k for k, v in json.loads(entry["mapping"]).items() if v is not None}
+        if not all(c in fields for c in columns):
+            continue
+        df = load_cached_frame(key, cache_dir)
+        if df is not None and all(fields[c] in df.columns for c in columns):
+            return df[[fields[c] for c in columns]].set_axis(list(columns), axis=1)
+    return None
+
+
+def find_appended_base(data, mapping: dict, cache_dir=UPLOAD_CACHE_DIR):
+    """Import antérieur dont le contenu est un préfixe strict de `data` (lignes ajoutées en fin de CSV).
+
+    Retourne (clé, taille du préfixe) pour le plus long préfixe connu, ou
+    None. Seuls les préfixes terminés par un saut de ligne sont retenus :
+    le reste du fichier est alors une suite de lignes complètes.
+    """
+    view = memoryview(data)
+    signature = _mapping_signature(mapping)
+    candidates = sorted(((v["size"], k, v["digest"]) for k, v in load_manifest(cache_dir).items()
+                         if v.get("mapping") == signature and 0 < v["size"] < len(view)), reverse=True)
+    for size, key, digest in candidates:
+        if view[size - 1:size] == b"\n" and file_digest(view[:size]) == digest:
+            return key, size
+    return None
+
+
+class _ViewReader(io.RawIOBase):
+    """Flux binaire en lecture seule sur une suite de memoryview, sans copie du contenu."""
+
+    def __init__(self, *views):
+        self._views = [v for v in views if len(v)]
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if not self._views:
+            return 0
+        head = self._views[0]
+        n = min(len(buf), len(head))
+        buf[:n] = head[:n]
+        if n == len(head):
+            self._views.pop(0)
+        else:
+            self._views[0] = head[n:]
+        return n
+
+
+def _header_end(view: memoryview, block: int = 1 << 16) -> int:
+    """Position suivant le premier saut de ligne, cherchée bloc par bloc."""
+    for start in range(0, len(view), block):
+        pos = bytes(view[start:start + block]).find(b"\n")
+        if pos >= 0:
+            return start + pos + 1
+    raise ValueError("En-tête CSV sans saut de ligne")
+
+
+def read_csv_tail(data, offset: int, **kwargs) -> pd.DataFrame:
+    """Lit les lignes d'un CSV situées après `offset` octets, avec l'en-tête du fichier.
+
+    `data` (bytes ou memoryview, par ex. getbuffer() de l'import) n'est pas
+    copié : l'en-tête et la fin du fichier sont lus directement.
+    """
+    view = memoryview(data)
+    header_end = _header_end(view)
+    return pd.read_csv(io.BufferedReader(_ViewReader(view[:header_end], view[offset:])), **kwargs)
+
+
+def append_to_cube(cube: pd.DataFrame, delta: pd.DataFrame, dims=CUBE_DIMENSIONS):
+    """Replie des lignes (ou un cube partiel) dans le cube sans le reconstruire.
+
+    Seules les cellules des dates présentes dans `delta` sont ré-agrégées ;
+    les autres sont reprises telles quelles. Le résultat est identique à
+    build_kpi_cube sur l'historique complet. Retourne (cube, dates recalculées).
+    """
+    part = build_kpi_cube(delta, dims)
+    keys = [c for c in dims if c in part.columns]
+    dates = pd.Index(part["date"].unique())
+    touched = cube["date"].isin(dates).to_numpy()
+    merged = build_kpi_cube(pd.concat([cube[touched], part], ignore_index=True), dims)
+    out = pd.concat([cube[~touched], merged], ignore_index=True)
+    for k in keys:
+        if isinstance(cube[k].dtype, pd.CategoricalDtype) or isinstance(part[k].dtype, pd.CategoricalDtype):
+            out[k] = pd.Categorical(out[k])
+    return out.sort_values(keys, ignore_index=True), dates
+
+
+# =============================================================================
+# MAPPING AUTOMATIQUE DES COLONNES (CORRESPONDANCE APPROCHÉE)
+# =============================================================================
+
+# Champs du schéma et alias connus (libellés anglais et français)
+COLUMN_SCHEMA = {
+    "date": ["date", "period", "periode", "month", "quarter", "year"],
+    "lob": ["lob", "branche", "line_of_business"],
+    "region": ["region", "zone", "pays", "geography"],
+    "cedant": ["cedant", "cedente", "ceding_company"],
+    "gross_premium": ["gross_premium", "primes_brutes", "gwp"],
+    "ceded_premium": ["ceded_premium", "primes_cedees", "ceded"],
+    "earned_premium": ["earned_premium", "primes_acquises", "ep"],
+    "incurred_claims": ["incurred_claims", "sinistres_encourus", "icl"],
+    "paid_claims": ["paid_claims", "sinistres_payes", "pcl"],
+    "ibnr": ["ibnr", "reserves_ibnr"],
+    "rbns": ["rbns", "reserves_rbns"],
+    "acq_expense": ["acq_expense", "frais_acquisition"],
+    "adm_expense": ["adm_expense", "frais_admin", "g&a"],
+    "investment_income": ["investment_income", "produits_financiers"],
+    "claims_count": ["claims_count", "nombre_sinistres", "nb_sinistres", "nb_claims", "claim_count"],
+    "exposure": ["exposure", "exposition", "policies", "risks"],
+    "scr": ["scr", "exigence_capital"],
+    "own_funds": ["own_funds", "fonds_propres"],
+}
+
+# Champs du triangle de provisionnement, propres à l'onglet réserves (hors schéma analytique)
+RESERVING_SCHEMA = {
+    "accident_period": ["accident_period", "accident_year", "annee_survenance", "survenance", "origin"],
+    "date": ["date", "payment_date", "date_paiement", "date_inventaire", "period", "periode"],
+    "paid_claims": ["paid_claims", "sinistres_payes", "montant", "amount", "incurred_claims", "charge"],
+}
+
+# Préfixes purement techniques (sans sens métier : "nb", "mt" ou "total" sont conservés)
+COLUMN_PREFIXES = {"col", "fld", "field", "src", "stg", "dwh"}
+MAPPING_MIN_SCORE = 0.6
+_MAPPING_MEMO = {}
+_ALIAS_CACHE = MemoCache(maxsize=8)
+
+
+def _mappings_file() -> Path:
+    return Path(os.environ.get("REASSURANCE_CACHE_DIR", ".cache/uploads")).parent / "column_mappings.json"
+
+
+def normalize_column_name(name) -> str:
+    """Minuscules sans accents, séparateurs unifiés, préfixe technique retiré ("MT_Primes-Acquises" -> "primes acquises")."""
+    import unicodedata
+
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode().lower()
+    text = re.sub(r"([a-z])([0-9])|([0-9])([a-z])", r"\1\3 \2\4", text)
+    tokens = re.findall(r"[a-z0-9&]+", text)
+    while len(tokens) > 1 and tokens[0] in COLUMN_PREFIXES:
+        tokens = tokens[1:]
+    return " ".join(tokens)
+
+
+def _trigram_matrix(names: list, vocab: dict) -> np.ndarray:
+    """Comptes de trigrammes de caractères (mots bordés d'espaces), lignes normalisées L2.
+
+    La norme porte sur tous les trigrammes du nom, y compris ceux absents du
+    vocabulaire : le produit scalaire reste une vraie similarité cosinus et
+    les caractères en trop pénalisent le score.
+    """
+    from collections import Counter
+
+    m = np.zeros((len(names), len(vocab)), dtype=np.float32)
+    norm = np.zeros((len(names), 1), dtype=np.float32)
+    for i, name in enumerate(names):
+        padded = f" {name} "
+        counts = Counter(padded[j:j + 3] for j in range(len(padded) - 2))
+        norm[i] = np.sqrt(sum(c * c for c in counts.values()))
+        for gram, c in counts.items():
+            k = vocab.get(gram)
+            if k is not None:
+                m[i, k] = c
+    return np.divide(m, norm, out=np.zeros_like(m), where=norm > 0)
+
+
+def _token_matrix(names: list, vocab: dict):
+    """Présence des mots de chaque nom dans le vocabulaire, et nombre total de mots distincts."""
+    m = np.zeros((len(names), len(vocab)), dtype=np.float32)
+    sizes = np.zeros(len(names), dtype=np.float32)
+    for i, name in enumerate(names):
+        tokens = set(name.split())
+        sizes[i] = len(tokens)
+        for t in tokens:
+            k = vocab.get(t)
+            if k is not None:
+                m[i, k] = 1.0
+    return m, sizes
+
+
+def _alias_index(schema: dict):
+    """Alias normalisés, vocabulaires et matrices des alias (une fois par schéma)."""
+    key = json.dumps(schema, sort_keys=True)
+    cached = _ALIAS_CACHE.get(key)
+    if cached is None:
+        fields = list(schema)
+        aliases, owner = [], []
+        for k, field in enumerate(fields):
+            for a in dict.fromkeys([field] + list(schema[field])):
+                aliases.append(normalize_column_name(a))
+                owner.append(k)
+        vocab, words = {}, {}
+        for a in aliases:
+            padded = f" {a} "
+            for j in range(len(padded) - 2):
+                vocab.setdefault(padded[j:j + 3], len(vocab))
+            for t in a.split():
+                words.setdefault(t, len(words))
+        cached = (fields, aliases, np.asarray(owner), vocab, _trigram_matrix(aliases, vocab),
+                  words, _token_matrix(aliases, words))
+        _ALIAS_CACHE.set(key, cached)
+    return cached
+
+
+def column_match_scores(columns, schema: dict) -> pd.DataFrame:
+    """Matrice de similarité (champs du schéma x colonnes), meilleur alias par champ.
+
+    Sur les noms normalisés : maximum de la similarité cosinus des
+    trigrammes de caractères et du coefficient de Dice sur les mots (un
+    alias retrouvé comme mot entier d'un nom court, "DATE_COMPTABLE" pour
+    "date"), porté à 1 en cas d'égalité exacte. Deux multiplications
+    matricielles comparent toutes les colonnes à tous les alias.
+    """
+    fields, aliases, owner, vocab, alias_m, words, (alias_t, alias_sizes) = _alias_index(schema)
+    names = [normalize_column_name(c) for c in columns]
+    sim = alias_m @ _trigram_matrix(names, vocab).T                          # (alias, colonnes)
+    col_t, col_sizes = _token_matrix(names, words)
+    total = alias_sizes[:, None] + col_sizes[None, :]
+    dice = np.divide(2.0 * (alias_t @ col_t.T), total, out=np.zeros_like(sim), where=total > 0)
+    sim = np.maximum(sim, dice)
+    exact = np.asarray(aliases, dtype=object)[:, None] == np.asarray(names, dtype=object)[None, :]
+    sim = np.where(exact, 1.0, sim)
+    # Maximum par champ : les alias sont contigus par champ
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    scores = np.maximum.reduceat(sim, starts, axis=0) if len(columns) else np.zeros((len(fields), 0))
+    return pd.DataFrame(scores, index=fields, columns=list(columns))
+
+
+def match_columns(columns, schema: dict, min_score: float = MAPPING_MIN_SCORE):
+    """Affectation optimale champ -> colonne (chaque colonne au plus une fois).
+
+    Retourne (mapping, confiance) ; un champ sans colonne au-dessus de
+    `min_score` reste à None.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    scores = column_match_scores(columns, schema)
+    mapping = {field: None for field in schema}
+    confidence = {field: 0.0 for field in schema}
+    if scores.shape[1]:
+        rows, cols = linear_sum_assignment(scores.to_numpy(), maximize=True)
+        for r, c in zip(rows, cols):
+            score = float(scores.iat[r, c])
+            if score >= min_score:
+                mapping[scores.index[r]] = scores.columns[c]
+                confidence[scores.index[r]] = score
+    return mapping, confidence
+
+
+def header_signature(columns) -> str:
+    """Empreinte d'un en-tête (noms et ordre des colonnes)."""
+    return hashlib.blake2b("\x1f".join(map(str, columns)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def remembered_mapping(columns):
+    """Mapping déjà validé pour cet en-tête exact (mémoire + disque), ou None."""
+    if not _MAPPING_MEMO:
+        try:
+            _MAPPING_MEMO.update(json.loads(_mappings_file().read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            pass
+    return _MAPPING_MEMO.get(header_signature(columns))
+
+
+def remember_mapping(columns, mapping: dict):
+    """Mémorise le mapping retenu pour les prochains imports du même système."""
+    sig = header_signature(columns)
+    if _MAPPING_MEMO.get(sig) == mapping:
+        return
+    _MAPPING_MEMO[sig] = dict(mapping)
+    path = _mappings_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(_MAPPING_MEMO, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+# =============================================================================
+# CASCADE BRUT -> NET : PROGRAMME DE RÉASSURANCE ET RÉTROCESSION
+# =============================================================================
+
+WATERFALL_STEPS = ("Brut", "Quote-part", "Excédent de plein", "XL par risque", "XL CAT", "Stop loss",
+                   "Rétrocession")
+
+
+def _layer_pairs(layers):
+    """(priorités, portées) d'une ou plusieurs couches ; None = pas de couche."""
+    if layers is None:
+        return np.zeros(0), np.zeros(0)
+    p, lim = layers
+    return (np.atleast_1d(np.asarray(p, dtype=np.float64)),
+            np.atleast_1d(np.asarray(lim, dtype=np.float64)))
+
+
+def _layers_ceded(x: np.ndarray, priorities: np.ndarray, limits: np.ndarray) -> np.ndarray:
+    """Σ des couches clip(X - P, 0, L), sans matrice (couches, sinistres)."""
+    ceded = np.zeros_like(x)
+    for p, lim in zip(priorities, limits):
+        ceded += np.clip(x - p, 0.0, lim)
+    return ceded
+
+
+def reinsurance_waterfall(losses, periods=None, n_periods: int = None, sum_insured=None, occurrence=None,
+                          is_cat=None,
+                          quota_share: float = 0.0, surplus_retention: float = None, surplus_lines: float = 0.0,
+                          risk_xl=None, cat_xl=None, stop_loss=None, retrocession: float = 0.0,
+                          premium: float = None, qs_commission: float = 0.0, retro_commission: float = 0.0,
+                          xl_premiums: dict = None) -> dict:
+    """Cascade brut -> net d'un programme complet, en une passe vectorisée.
+
+    Ordre d'application (chaque traité s'applique au net du précédent) :
+    quote-part, excédent de plein (part cédée min(SI - R, n R) / SI, sinistres
+    sans somme assurée exclus), XL par risque (par sinistre), XL CAT (par
+    occurrence : sinistres regroupés par `occurrence`), stop loss (cumul par
+    période) puis rétrocession en quote-part du net restant.
+
+    `is_cat` (masque booléen par sinistre) sépare les sinistres par risque,
+    seuls soumis à l'XL par risque, des pertes d'événements, seules soumises
+    à l'XL CAT. Sans masque, les deux XL portent sur tous les sinistres. Une
+    occurrence ne peut pas s'étendre sur plusieurs périodes (ValueError).
+
+    `losses` peut être une liste de sinistres (avec leur `periods`) ou un
+    montant par période (periods=None). Les couches XL et stop loss sont des
+    couples (priorités, portées), scalaires ou tableaux pour plusieurs couches.
+
+    Si `premium` (prime brute par période) est fourni, le coût des traités est
+    suivi : quote-part et rétrocession au prorata (nets de commission),
+    excédent au prorata de sa part des sinistres, non proportionnels via
+    `xl_premiums` {"XL par risque": ..., "XL CAT": ..., "Stop loss": ...}.
+
+    Retourne {"summary" : moyennes par étape, "ceded" : (étapes, périodes),
+    "net" : charge nette par période}.
+    """
+    x = np.array(losses, dtype=np.float64)
+    if periods is None:
+        periods = np.arange(x.size, dtype=np.int64)
+    periods = np.asarray(periods, dtype=np.int64)
+    cat = np.ones(x.size, dtype=bool) if is_cat is None else np.asarray(is_cat, dtype=bool)
+    risk = np.ones(x.size, dtype=bool) if is_cat is None else ~cat
+    if n_periods is None:
+        n_periods = int(periods.max()) + 1 if periods.size else 0
+    ceded = np.zeros((len(WATERFALL_STEPS), n_periods))
+    gross = np.bincount(periods, weights=x, minlength=n_periods)
+
+    # Quote-part : proportionnelle, la charge annuelle suffit
+    ceded[1] = quota_share * gross
+    x *= 1.0 - quota_share
+
+    # Excédent de plein : part cédée propre à chaque risque
+    if surplus_retention and surplus_lines and sum_insured is not None:
+        si = np.asarray(sum_insured, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.clip(si - surplus_retention, 0.0, surplus_lines * surplus_retention) / si
+        share = np.where(si > 0, share, 0.0)
+        c = share * x
+        ceded[2] = np.bincount(periods, weights=c, minlength=n_periods)
+        x -= c
+
+    # XL par risque : chaque sinistre, couches empilées sur le même net
+    p, lim = _layer_pairs(risk_xl)
+    if p.size:
+        c = np.zeros_like(x)
+        c[risk] = _layers_ceded(x[risk], p, lim)
+        ceded[3] = np.bincount(periods, weights=c, minlength=n_periods)
+        x -= c
+    net = np.bincount(periods, weights=x, minlength=n_periods)
+
+    # XL CAT : cumul par occurrence (chaque sinistre est sa propre occurrence par défaut)
+    p, lim = _layer_pairs(cat_xl)
+    if p.size:
+        if occurrence is None:
+            occ, occ_period = x[cat], periods[cat]
+        else:
+            _, inv = np.unique(np.asarray(occurrence)[cat], return_inverse=True)
+            occ = np.bincount(inv, weights=x[cat])
+            first = np.full(occ.size, np.iinfo(np.int64).max)
+            last = np.full(occ.size, -1)
+            np.minimum.at(first, inv, periods[cat])
+            np.maximum.at(last, inv, periods[cat])
+            if (first != last).any():
+                raise ValueError("Une occurrence CAT s'étend sur plusieurs périodes")
+            occ_period = first
+        ceded[4] = np.bincount(occ_period, weights=_layers_ceded(occ, p, lim), minlength=n_periods)
+        net -= ceded[4]
+
+    # Stop loss : cumul de la période
+    p, lim = _layer_pairs(stop_loss)
+    if p.size:
+        ceded[5] = _layers_ceded(net, p, lim)
+        net -= ceded[5]
+
+    ceded[6] = retrocession * net
+    net -= ceded[6]
+
+    ceded[0] = 0.0
+    net_steps = gross - np.cumsum(ceded, axis=0)
+    summary = pd.DataFrame({
+        "ceded_loss": ceded.mean(axis=1),
+        "net_loss": net_steps.mean(axis=1),
+        "net_std": net_steps.std(axis=1),
+        "net_q995": np.quantile(net_steps, 0.995, axis=1) if n_periods else np.nan,
+    }, index=pd.Index(WATERFALL_STEPS, name="step"))
+    gross_total = gross.sum()
+    summary["ceded_share"] = summary["ceded_loss"] * n_periods / gross_total if gross_total else 0.0
+
+    if premium is not None:
+        costs = dict(xl_premiums or {})
+        cost = np.zeros(len(WATERFALL_STEPS))
+        cost[1] = quota_share * premium * (1.0 - qs_commission)
+        remaining = premium - cost[1]
+        before = gross.sum() * (1.0 - quota_share)
+        cost[2] = remaining * (ceded[2].sum() / before if before else 0.0)
+        for i in (3, 4, 5):
+            cost[i] = costs.get(WATERFALL_STEPS[i], 0.0)
+        retained = premium - cost[:6].sum()
+        cost[6] = retrocession * retained * (1.0 - retro_commission)
+        summary["ceded_premium"] = cost
+        summary["net_premium"] = premium - np.cumsum(cost)
+        summary["net_result"] = summary["net_premium"] - summary["net_loss"]
+        # Pire résultat à 1/200 ans : prime nette moins charge nette au quantile 99,5 %
+        summary["net_result_q005"] = summary["net_premium"] - summary["net_q995"]
+    return {"summary": summary, "ceded": ceded, "net": net}
+
+
+def make_demo_loss_portfolio(n_years: int = 10_000, lam: float = 300.0, mu: float = 11.0, sigma: float = 1.4,
+                             cat_tiv: float = 2e10, seed=42) -> dict:
+    """Sinistres de démonstration pour la cascade : risques individuels et occurrences CAT.
+
+    Les sinistres par risque ont une somme assurée (taux de destruction
+    bêta) ; les pertes CAT, issues de la table d'événements, n'en ont pas
+    (NaN : hors excédent de plein) et forment chacune une occurrence.
+    """
+    rng = np.random.default_rng(seed)
+    risk, risk_years = simulate_individual_losses(lam, mu, sigma, n_years, seed=rng.integers(2**32))
+    damage = rng.beta(0.9, 3.0, risk.size).clip(0.01, 1.0)
+    elt = make_event_loss_table(cat_tiv, 0.3, 0.02, 6.0, 1.0, seed=rng.integers(2**32))
+    cat = simulate_elt(elt, n_years, seed=rng.integers(2**32))
+    n_risk, n_cat = risk.size, cat["losses"].size
+    return {
+        "losses": np.concatenate([risk, cat["losses"]]),
+        "periods": np.concatenate([risk_years, cat["years"]]),
+        "sum_insured": np.concatenate([risk / damage, np.full(n_cat, np.nan)]),
+        "occurrence": np.arange(n_risk + n_cat),
+        "is_cat": np.concatenate([np.zeros(n_risk, bool), np.ones(n_cat, bool)]),
+        "n_years": n_years,
+    }
+
+
+# =============================================================================
+# RENTABILITÉ PAR LIGNE : ALLOCATION DU CAPITAL (EULER / VARIANCE-COVARIANCE)
+# =============================================================================
+
+ALLOCATION_METHODS = ("euler", "varcovar")
+ALLOCATION_CHUNK_SIMS = 4_096
+ALLOCATION_FACTOR_WEIGHT = 0.5
+
+
+def _allocation_segments():
+    """Segments des facteurs communs et leur corrélation (non-vie, vie, santé)."""
+    segments = NL_SEGMENTS + ("vie", "sante")
+    n = len(NL_SEGMENTS)
+    corr = np.zeros((n + 2, n + 2))
+    corr[:n, :n] = NL_SEGMENT_CORR
+    corr[n:, n:] = SCR_MODULE_CORR[2:4, 2:4]
+    return segments, corr
+
+
+def line_loss_simulation(expected_loss, cv, segment=None, n_sims: int = 20_000,
+                         factor_weight: float = ALLOCATION_FACTOR_WEIGHT, seed=42,
+                         dtype=np.float32) -> np.ndarray:
+    """Charges simulées par ligne, forme (simulations, lignes).
+
+    Marges lognormales de moyenne `expected_loss` et de coefficient de
+    variation `cv` ; dépendance par copule gaussienne à facteurs : chaque
+    ligne porte le facteur de son segment (libellé de LoB, cf. lob_segment),
+    les facteurs étant corrélés comme les segments de la formule standard.
+    Tirage par tranches de simulations pour borner la mémoire.
+    """
+    mean = np.asarray(expected_loss, dtype=np.float64)
+    sigma2 = np.log1p(np.asarray(cv, dtype=np.float64) ** 2) * np.ones_like(mean)
+    sigma = np.sqrt(sigma2)
+    segments, corr = _allocation_segments()
+    if segment is None:
+        codes = np.full(mean.size, segments.index("pertes_diverses"))
+    else:
+        codes = np.array([segments.index(lob_segment(s)) if s not in segments else segments.index(s)
+                          for s in segment])
+    chol = np.linalg.cholesky(corr)
+    w = np.sqrt(factor_weight)
+    w_idio = np.sqrt(1.0 - factor_weight)
+    out = np.empty((n_sims, mean.size), dtype=dtype)
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_sims // ALLOCATION_CHUNK_SIMS))
+    for k, start in enumerate(range(0, n_sims, ALLOCATION_CHUNK_SIMS)):
+        rng = np.random.default_rng(seeds[k])
+        n = min(ALLOCATION_CHUNK_SIMS, n_sims - start)
+        factors = rng.standard_normal((n, len(segments))) @ chol.T
+        z = w * factors[:, codes] + w_idio * rng.standard_normal((n, mean.size))
+        out[start:start + n] = mean * np.exp(sigma * z - 0.5 * sigma2)
+    return out
+
+
+def _column_moments(sims: np.ndarray, total: np.ndarray):
+    """Moyennes par ligne et covariances Cov(X_i, S), accumulées en float64 par tranches."""
+    n = sims.shape[0]
+    centred = total - total.mean()
+    mean = np.zeros(sims.shape[1])
+    cov = np.zeros(sims.shape[1])
+    for start in range(0, n, ALLOCATION_CHUNK_SIMS):
+        block = sims[start:start + ALLOCATION_CHUNK_SIMS].astype(np.float64)
+        mean += block.sum(axis=0)
+        cov += centred[start:start + ALLOCATION_CHUNK_SIMS] @ block
+    return mean / n, cov / n
+
+
+def _column_tvar(sims: np.ndarray, alpha: float) -> np.ndarray:
+    """TVaR_alpha de chaque colonne, E[X_i | X_i >= VaR_alpha(X_i)], par tranches de simulations."""
+    q = np.quantile(sims, alpha, axis=0)
+    total = np.zeros(sims.shape[1])
+    count = np.zeros(sims.shape[1])
+    for start in range(0, sims.shape[0], ALLOCATION_CHUNK_SIMS):
+        block = sims[start:start + ALLOCATION_CHUNK_SIMS].astype(np.float64)
+        tail = block >= q
+        total += np.where(tail, block, 0.0).sum(axis=0)
+        count += tail.sum(axis=0)
+    return total / np.maximum(count, 1)
+
+
+def allocate_capital(sims: np.ndarray, method: str = "euler", alpha: float = 0.995, total: float = None):
+    """Capital alloué à chaque ligne (colonnes de `sims`), somme = capital du portefeuille.
+
+    - "euler" : mesure TVaR, contributions E[X_i | S >= VaR_alpha(S)] - E[X_i] ;
+    - "varcovar" : mesure VaR, Cov(X_i, S) / Var(S) x (VaR_alpha(S) - E[S]).
+    Retourne (alloué, autonome) où autonome est la même mesure appliquée à
+    chaque ligne seule (TVaR ou VaR moins l'espérance) : l'écart entre les
+    deux sommes est le bénéfice de diversification. Les deux méthodes ne
+    mesurent pas le même risque et n'ont donc pas le même total. Si `total`
+    est fourni (SCR de l'entité par exemple), alloué et autonome sont remis à
+    l'échelle du même facteur pour lui correspondre.
+    """
+    if method not in ALLOCATION_METHODS:
+        raise ValueError(f"Méthode d'allocation inconnue : {method}")
+    s = sims.sum(axis=1, dtype=np.float64)
+    mean, cov = _column_moments(sims, s)
+    var_s = np.quantile(s, alpha)
+    if method == "euler":
+        tail = s >= var_s
+        allocated = sims[tail].mean(axis=0, dtype=np.float64) - mean
+        standalone = _column_tvar(sims, alpha) - mean
+    else:
+        variance = s.var()
+        allocated = cov / variance * (var_s - s.mean()) if variance > 0 else np.zeros_like(mean)
+        standalone = np.quantile(sims, alpha, axis=0).astype(np.float64) - mean
+    if total is not None:
+        current = allocated.sum()
+        if current:
+            allocated = allocated * (total / current)
+            standalone = standalone * (total / current)
+    return allocated, standalone
+
+
+def line_profitability(lines: pd.DataFrame, sims: np.ndarray, method: str = "euler", alpha: float = 0.995,
+                       total_capital: float = None, cost_of_capital: float = 0.10,
+                       investment_return: float = 0.0) -> pd.DataFrame:
+    """Résultat, capital alloué et ROE de toutes les lignes en une passe.
+
+    `lines` : une ligne par segment (LoB x région x cédante...) avec les
+    colonnes premium et claims (charge attendue), expenses facultative ;
+    `sims` : charges simulées alignées sur les lignes (line_loss_simulation).
+    ROE = (résultat technique + produits du capital) / capital alloué ;
+    EVA = résultat - coût du capital. Le bénéfice de diversification compare
+    le capital autonome de chaque ligne à sa part allouée, sous la même
+    mesure de risque (attrs["portfolio"]["risk_measure"]).
+    """
+    allocated, standalone = allocate_capital(sims, method, alpha, total_capital)
+    out = lines.copy()
+    expenses = out["expenses"] if "expenses" in out else 0.0
+    out["technical_result"] = out["premium"] - out["claims"] - expenses
+    out["standalone_capital"] = standalone
+    out["capital"] = allocated
+    out["diversification"] = 1.0 - allocated / np.where(standalone > 0, standalone, np.nan)
+    income = out["technical_result"] + investment_return * allocated
+    out["roe"] = income / np.where(allocated > 0, allocated, np.nan)
+    out["eva"] = income - cost_of_capital * allocated
+    out.attrs["portfolio"] = {
+        "risk_measure": "TVaR" if method == "euler" else "VaR",
+        "alpha": alpha,
+        "capital": float(allocated.sum()),
+        "standalone_capital": float(standalone.sum()),
+        "roe": float(income.sum() / allocated.sum()) if allocated.sum() > 0 else np.nan,
+    }
+    return out
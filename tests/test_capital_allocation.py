@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import reassurance_engine as engine
+
+LINES = pd.DataFrame({"lob": ["Auto", "Habitation", "Santé", "RC Pro", "Vie"],
+                      "premium": [2e6] * 5, "claims": [1.4e6] * 5, "expenses": [4e5] * 5,
+                      "cv": [0.15, 0.20, 0.10, 0.35, 0.08]})
+
+
+@pytest.fixture(scope="module")
+def sims():
+    return engine.line_loss_simulation(LINES["claims"], LINES["cv"], LINES["lob"], n_sims=20_000)
+
+
+def test_euler_uses_tvar_for_allocated_and_standalone(sims):
+    allocated, standalone = engine.allocate_capital(sims, "euler", 0.995)
+    s = sims.sum(axis=1, dtype=np.float64)
+    tail = s >= np.quantile(s, 0.995)
+    assert allocated.sum() == pytest.approx(s[tail].mean() - s.mean(), rel=1e-9)
+    x = sims[:, 0].astype(np.float64)
+    assert standalone[0] == pytest.approx(x[x >= np.quantile(x, 0.995)].mean() - x.mean(), rel=1e-6)
+    assert (allocated <= standalone + 1e-6).all()
+
+
+def test_varcovar_matches_covariance_reference(sims):
+    allocated, standalone = engine.allocate_capital(sims, "varcovar", 0.995)
+    s = sims.astype(np.float64).sum(axis=1)
+    ref = [np.cov(sims[:, i].astype(np.float64), s, bias=True)[0, 1] for i in range(sims.shape[1])]
+    np.testing.assert_allclose(allocated, np.array(ref) / s.var() * (np.quantile(s, 0.995) - s.mean()),
+                               rtol=1e-6)
+    np.testing.assert_allclose(standalone, np.quantile(sims, 0.995, axis=0) - sims.mean(axis=0, dtype=float),
+                               rtol=1e-5)
+
+
+def test_rescaling_keeps_diversification(sims):
+    base = engine.line_profitability(LINES, sims, "euler")
+    scaled = engine.line_profitability(LINES, sims, "euler", total_capital=5e6)
+    assert scaled.attrs["portfolio"]["capital"] == pytest.approx(5e6)
+    np.testing.assert_allclose(scaled["diversification"], base["diversification"], rtol=1e-9)
+    assert scaled.attrs["portfolio"]["risk_measure"] == "TVaR"
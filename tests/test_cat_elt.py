@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import reassurance_engine as engine
+
+
+@pytest.mark.parametrize("intensity", [1.0, 3.0, 7.0, 9.0, 10.0, 12.0])
+def test_total_event_frequency_is_anchored(intensity):
+    elt = engine.make_event_loss_table(250e9, 1.2, 0.15, intensity, 0.7)
+    assert elt["rate"].sum() == pytest.approx(0.15)
+    reference = np.clip(intensity, engine.CAT_MIN_INTENSITY, engine.CAT_MAX_INTENSITY)
+    assert (elt["intensity"] >= reference).all()
+
+
+def test_expected_loss_increases_with_intensity():
+    aal = [(lambda e: (e["rate"] * e["mean_loss"]).sum())(engine.make_event_loss_table(250e9, 1.2, 0.15, i, 0.7))
+           for i in range(3, 11)]
+    assert (np.diff(aal) > 0).all()
+    assert aal[-1] < 250e9 * 0.15
+
+
+def test_simulate_elt_rejects_excessive_occurrences(monkeypatch):
+    elt = engine.make_event_loss_table(1e9, 1.0, 0.1, 5.0, 1.0)
+    monkeypatch.setattr(engine, "CAT_MAX_OCCURRENCES", 1_000)
+    with pytest.raises(ValueError, match="occurrences"):
+        engine.simulate_elt(elt, 100_000)
+    assert engine.simulate_elt(elt, 5_000)["n_years"] == 5_000
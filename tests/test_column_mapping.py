@@ -0,0 +1,56 @@
+import reassurance_engine as engine
+
+# En-tête d'un extrait d'entrepôt de données réassurance (bordereau cédante)
+WAREHOUSE_HEADER = [
+    "ID_LIGNE", "CODE_TRAITE", "LIB_TRAITE", "DATE_COMPTABLE", "Date d'effet", "Date d'échéance",
+    "ANNEE_SURVENANCE", "CODE_BRANCHE", "LIB_BRANCHE_DETAIL", "REGION_GEO", "CEDANTE_NOM", "CEDANTE_SIREN",
+    "DEVISE", "TX_CHANGE", "MT_PRIMES_BRUTES", "MT_PRIMES_CEDEES", "MT_PRIMES_ACQUISES",
+    "MT_SINISTRES_ENCOURUS", "MT_SINISTRES_PAYES", "NB_SINISTRES", "RESERVES_IBNR", "RESERVES_RBNS",
+    "FRAIS_ACQUISITION", "FRAIS_ADMIN", "PRODUITS_FINANCIERS", "EXPOSITION", "SCR", "FONDS_PROPRES",
+    "SCR_Flag_Zqwxy", "Ep_Kwyz_Qqq", "IBNR_Qwkzy_Jjj", "USER_MAJ", "DT_MAJ", "FLAG_ACTIF",
+] + [f"ATTR_{k:03d}_{suffix}" for k in range(60) for suffix in ("CODE", "LIB", "DT", "TX", "REF", "QTE")]
+
+
+def test_normalization_keeps_meaningful_tokens():
+    assert engine.normalize_column_name("DWH_Primes-Acquises") == "primes acquises"
+    assert engine.normalize_column_name("NB_SINISTRES") != engine.normalize_column_name("MT_SINISTRES")
+
+
+def test_wide_warehouse_header():
+    mapping, confidence = engine.match_columns(WAREHOUSE_HEADER, engine.COLUMN_SCHEMA)
+    assert mapping == {
+        "date": "DATE_COMPTABLE", "lob": "CODE_BRANCHE",
+        "region": "REGION_GEO", "cedant": "CEDANTE_NOM", "gross_premium": "MT_PRIMES_BRUTES",
+        "ceded_premium": "MT_PRIMES_CEDEES", "earned_premium": "MT_PRIMES_ACQUISES",
+        "incurred_claims": "MT_SINISTRES_ENCOURUS", "paid_claims": "MT_SINISTRES_PAYES",
+        "ibnr": "RESERVES_IBNR", "rbns": "RESERVES_RBNS", "acq_expense": "FRAIS_ACQUISITION",
+        "adm_expense": "FRAIS_ADMIN", "investment_income": "PRODUITS_FINANCIERS",
+        "claims_count": "NB_SINISTRES", "exposure": "EXPOSITION", "scr": "SCR", "own_funds": "FONDS_PROPRES",
+    }
+    assert all(0.6 <= c <= 1.0 for c in confidence.values())
+
+
+def test_extra_characters_lower_the_score():
+    scores = engine.column_match_scores(["SCR_Flag_Zqwxy", "Ep_Kwyz_Qqq", "IBNR_Qwkzy_Jjj"],
+                                        engine.COLUMN_SCHEMA)
+    assert scores.loc["scr", "SCR_Flag_Zqwxy"] < engine.MAPPING_MIN_SCORE
+    assert scores.loc["earned_premium", "Ep_Kwyz_Qqq"] < engine.MAPPING_MIN_SCORE
+    assert scores.loc["ibnr", "IBNR_Qwkzy_Jjj"] < engine.MAPPING_MIN_SCORE
+    mapping, _ = engine.match_columns(["SCR_Flag_Zqwxy", "Ep_Kwyz_Qqq"], engine.COLUMN_SCHEMA)
+    assert mapping["scr"] is None and mapping["earned_premium"] is None
+
+
+def test_exact_alias_beats_partial_match():
+    scores = engine.column_match_scores(["Date d'effet", "Periode", "Date Comptable"], engine.COLUMN_SCHEMA)
+    date = scores.loc["date"]
+    assert date["Periode"] == 1.0
+    assert date["Date d'effet"] < date["Date Comptable"] < 1.0
+
+
+def test_reserving_fields_stay_out_of_the_analytics_schema():
+    assert "accident_period" not in engine.COLUMN_SCHEMA
+    mapping, _ = engine.match_columns(["Origin", "DatePaiement", "Montant"], engine.COLUMN_SCHEMA)
+    assert "Origin" not in mapping.values()
+    mapping, _ = engine.match_columns(WAREHOUSE_HEADER, engine.RESERVING_SCHEMA)
+    assert mapping["accident_period"] == "ANNEE_SURVENANCE"
+    assert mapping["paid_claims"] == "MT_SINISTRES_PAYES"
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import reassurance_engine as engine
+
+
+@pytest.fixture(scope="module")
+def cube():
+    d = engine.make_demo_data(periods=12, n_cedants=6, n_lobs=4, n_regions=2)
+    return engine.build_kpi_cube(engine.compute_kpis(d))
+
+
+def _reference(cube, collective="lob"):
+    """Estimateurs de Bühlmann-Straub groupe par groupe (boucles Python)."""
+    per = cube.groupby(["cedant", "lob", "date"], observed=True)[["incurred_claims", "earned_premium"]].sum()
+    per = per[per["earned_premium"] > 0]
+    out = {}
+    for coll, sub in per.groupby(level=collective, observed=True):
+        groups = {}
+        for key, g in sub.groupby(level=["cedant", "lob"], observed=True):
+            w = g["earned_premium"].to_numpy()
+            x = g["incurred_claims"].to_numpy() / w
+            groups[key] = (w, x)
+        num = sum(((w * (x - (w * x).sum() / w.sum()) ** 2).sum()) for w, x in groups.values())
+        sigma2 = num / sum(len(w) - 1 for w, _ in groups.values())
+        W = {k: w.sum() for k, (w, _) in groups.items()}
+        xbar = {k: (w * x).sum() / w.sum() for k, (w, x) in groups.items()}
+        wt = sum(W.values())
+        xw = sum(W[k] * xbar[k] for k in groups) / wt
+        a = (sum(W[k] * (xbar[k] - xw) ** 2 for k in groups) - (len(groups) - 1) * sigma2) \
+            / (wt - sum(v * v for v in W.values()) / wt)
+        a = max(a, 0.0)
+        z = {k: W[k] / (W[k] + sigma2 / a) if a > 0 else 0.0 for k in groups}
+        mu = sum(z[k] * xbar[k] for k in groups) / sum(z.values()) if sum(z.values()) > 0 else xw
+        for k in groups:
+            out[k] = (z[k], z[k] * xbar[k] + (1 - z[k]) * mu)
+    return out
+
+
+def test_buhlmann_straub_matches_loop_reference(cube):
+    res = engine.buhlmann_straub(engine.credibility_stats(cube), collective="lob")
+    ref = _reference(cube)
+    for key, (z, lr) in ref.items():
+        assert res.loc[key, "credibility"] == pytest.approx(z, rel=1e-9, abs=1e-12)
+        assert res.loc[key, "credibility_loss_ratio"] == pytest.approx(lr, rel=1e-9)
+
+
+def test_incremental_update_matches_full_computation(cube):
+    dates = np.sort(cube["date"].unique())
+    old, new = cube[cube["date"] < dates[-2]], cube[cube["date"] >= dates[-2]]
+    stats = engine.update_credibility_stats(engine.credibility_stats(old), new)
+    pd.testing.assert_frame_equal(stats.sort_index(), engine.credibility_stats(cube).sort_index(),
+                                  check_dtype=False)
+    with pytest.raises(ValueError):
+        engine.update_credibility_stats(stats, new)
+
+
+def test_refresh_falls_back_when_a_period_is_restated(cube):
+    last = cube["date"].max()
+    stats = engine.credibility_stats(cube)
+    restated = cube.assign(incurred_claims=np.where(cube["date"] == last, cube["incurred_claims"] * 1.1,
+                                                    cube["incurred_claims"]))
+    refreshed = engine.refresh_credibility_stats(stats, restated, [last])
+    pd.testing.assert_frame_equal(refreshed.sort_index(), engine.credibility_stats(restated).sort_index(),
+                                  check_dtype=False)
@@ -0,0 +1,14 @@
+import pytest
+
+import reassurance_engine as engine
+
+
+def test_demo_data_shape():
+    df = engine.make_demo_data(periods=4, n_cedants=3, n_lobs=2, n_regions=2)
+    assert len(df) == 4 * 3 * 2 * 2
+
+
+def test_demo_data_rejects_oversized_portfolio(monkeypatch):
+    monkeypatch.setattr(engine, "DEMO_MAX_ROWS", 100)
+    with pytest.raises(ValueError, match="maximum"):
+        engine.make_demo_data(periods=16, n_cedants=2, n_lobs=4, n_regions=2)
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.integrate import quad
+
+import reassurance_engine as engine
+
+
+def _survival(t, b, g):
+    """Survie du taux de destruction MBBEFD, cas général (Bernegger 1997)."""
+    return (1 - b) / ((g - 1) * b ** (1 - t) + 1 - g * b)
+
+
+@pytest.mark.parametrize("c", [1.5, 2.0, 3.0, 4.0, 5.0])
+def test_exposure_curve_matches_integrated_survival(c):
+    b, g = (float(v) for v in engine.mbbefd_parameters(c))
+    mean, _ = quad(_survival, 0.0, 1.0, args=(b, g))
+    x = np.linspace(0.0, 1.0, 21)
+    expected = [quad(_survival, 0.0, xi, args=(b, g))[0] / mean for xi in x]
+    np.testing.assert_allclose(engine.exposure_curve(x, b, g), expected, atol=1e-8)
+
+
+def test_exposure_curve_special_cases():
+    x = np.linspace(0.0, 1.0, 11)
+    np.testing.assert_allclose(engine.exposure_curve(x, 0.0, 3.0), x)
+    np.testing.assert_allclose(engine.exposure_curve(x, 1.0, 5.0), np.log1p(4 * x) / np.log(5))
+    np.testing.assert_allclose(engine.exposure_curve(x, 0.5, 2.0), (1 - 0.5 ** x) / 0.5)
+    curve = engine.exposure_curve(x, *engine.mbbefd_parameters(3.0))
+    assert curve[0] == pytest.approx(0.0, abs=1e-12) and curve[-1] == pytest.approx(1.0)
+    assert (np.diff(curve) > 0).all()
+
+
+def test_exposure_rating_layers_sum_to_risk_premium():
+    profile = pd.DataFrame({"sum_insured": [1e6, 5e6], "premium": [1e4, 3e4]})
+    # Couches contiguës couvrant [0, 5M] : toute la prime de risque est répartie
+    res = engine.exposure_rating(profile, [0.0, 5e5, 2e6], [5e5, 1.5e6, 3e6], c=3.0, loss_ratio=0.6)
+    assert res["expected_loss"].sum() == pytest.approx(0.6 * 4e4)
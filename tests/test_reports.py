@@ -0,0 +1,32 @@
+import time
+
+import reassurance_engine as engine
+
+
+def _wait(job, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.done
+
+
+def test_evicted_report_is_forgotten_and_resubmitted(tmp_path, monkeypatch):
+    monkeypatch.setenv("REASSURANCE_CACHE_DIR", str(tmp_path / "uploads"))
+    sections = [("text", "Synthèse", "Ligne 1")]
+    job = engine.submit_report("k", sections, "html")
+    _wait(job)
+    assert job.ready and engine.report_job("k", "html") is job
+
+    job.path.unlink()  # éviction LRU du cache
+    assert not job.ready
+    assert engine.report_job("k", "html") is None
+
+    again = engine.submit_report("k", sections, "html")
+    assert again is not job
+    _wait(again)
+    assert again.ready
+
+
+def test_report_without_file_is_not_ready():
+    job = engine.ReportJob(engine.report_dir() / "absent.html")
+    assert job.done and not job.ready
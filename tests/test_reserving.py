@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import reassurance_engine as engine
+
+# Triangle de Taylor-Ashe (1983), incréments payés
+TAYLOR_ASHE = [
+    [357848, 766940, 610542, 482940, 527326, 574398, 146342, 139950, 227229, 67948],
+    [352118, 884021, 933894, 1183289, 445745, 320996, 527804, 266172, 425046],
+    [290507, 1001799, 926219, 1016654, 750816, 146923, 495992, 280405],
+    [310608, 1108250, 776189, 1562400, 272482, 352053, 206286],
+    [443160, 693190, 991983, 769488, 504851, 470639],
+    [396132, 937085, 847498, 805037, 705960],
+    [440832, 847631, 1131398, 1063269],
+    [359480, 1061648, 1443370],
+    [376686, 986608],
+    [344014],
+]
+
+
+@pytest.fixture(scope="module")
+def triangle():
+    C = np.full((10, 10), np.nan)
+    for i, row in enumerate(TAYLOR_ASHE):
+        C[i, :len(row)] = np.cumsum(row)
+    return C
+
+
+def test_mack_matches_published_values(triangle):
+    cl = engine.chain_ladder(triangle)
+    # Mack (1993) : IBNR total 18 680 856, erreur standard totale 2 447 095
+    assert cl["ibnr"].sum() == pytest.approx(18_680_856, abs=1)
+    assert cl["mack_total_se"] == pytest.approx(2_447_095, abs=1)
+    np.testing.assert_allclose(
+        cl["mack_se"][1:],
+        [75_535, 121_699, 133_549, 261_406, 411_010, 558_317, 875_328, 971_258, 1_363_155], atol=1)
+
+
+def test_odp_bootstrap_matches_england_verrall(triangle):
+    reserves = engine.odp_bootstrap(triangle, n_boot=20_000, parallel=False).sum(axis=1)
+    # England-Verrall : réserve moyenne proche du chain ladder, erreur de prédiction ~ 16 %
+    assert reserves.mean() == pytest.approx(18_680_856, rel=0.015)
+    assert reserves.std() / reserves.mean() == pytest.approx(0.16, abs=0.01)
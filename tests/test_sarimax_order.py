@@ -0,0 +1,39 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import reassurance_engine as engine
+
+
+def _series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2015-01-01", periods=n, freq="MS")
+    return pd.Series(100 + np.cumsum(rng.normal(0, 1, n)) + 5 * np.sin(np.arange(n) * np.pi / 6), index=idx)
+
+
+def test_short_series_skips_search(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("aucun ajustement attendu")
+
+    monkeypatch.setattr(engine, "sarimax_criteria", fail)
+    best = engine.auto_sarimax_order(_series(16), season_length=4, parallel=False)
+    assert best["fitted"] is False and best["candidates"].empty
+
+
+def test_sequential_timeout_discards_fit(monkeypatch):
+    slow = ((0, 0, 0), (0, 0, 0, 0))
+
+    def fake(ts, order, seasonal, maxiter=50):
+        if (order, seasonal) == slow:
+            time.sleep(0.2)
+            return -1e9, -1e9
+        return float(sum(order)), float(sum(order))
+
+    monkeypatch.setattr(engine, "sarimax_criteria", fake)
+    grid = [slow, ((1, 0, 0), (0, 0, 0, 0)), ((2, 0, 0), (0, 0, 0, 0))]
+    best = engine.auto_sarimax_order(_series(40, seed=1), season_length=0, grid=grid, timeout=0.05,
+                                     parallel=False)
+    assert best["order"] == (1, 0, 0)
+    status = best["candidates"].set_index(best["candidates"]["order"].astype(str))["status"]
+    assert status[str(slow[0])] == "timeout"
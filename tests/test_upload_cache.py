@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+import reassurance_engine as engine
+
+
+def test_cached_upload_columns_reuses_ingested_frame(tmp_path):
+    mapping = {"accident_period": "Survenance", "date": "DatePaiement", "paid_claims": "Montant", "lob": None}
+    frame = pd.DataFrame({"accident_period": [2020, 2021], "date": pd.to_datetime(["2021-03-01", "2022-01-01"]),
+                          "paid_claims": [10.0, 20.0]})
+    engine.store_cached_frame("k1", frame, cache_dir=tmp_path)
+    engine.store_cached_frame("k1-cube", frame, cache_dir=tmp_path)
+    engine.record_upload("k1", "digest", 100, mapping, cache_dir=tmp_path)
+
+    cols = engine.cached_upload_columns("digest", ["Survenance", "DatePaiement", "Montant"], cache_dir=tmp_path)
+    assert list(cols.columns) == ["Survenance", "DatePaiement", "Montant"]
+    assert cols["Montant"].tolist() == [10.0, 20.0]
+    assert engine.cached_upload_columns("digest", ["Autre"], cache_dir=tmp_path) is None
+    assert engine.cached_upload_columns("other", ["Montant"], cache_dir=tmp_path) is None
+
+
+def test_read_csv_tail_keeps_wide_header():
+    columns = [f"colonne_{i:05d}" for i in range(8_000)]  # en-tête > 64 Ko
+    header = ",".join(columns).encode() + b"\n"
+    first = ",".join("1" for _ in columns).encode() + b"\n"
+    added = ",".join("2" for _ in columns).encode() + b"\n"
+    data = bytearray(header + first + added)
+    tail = engine.read_csv_tail(memoryview(data), len(header) + len(first))
+    assert list(tail.columns) == columns
+    assert len(tail) == 1 and (tail.iloc[0] == 2).all()
+
+
+def test_read_csv_tail_rejects_header_without_newline():
+    with pytest.raises(ValueError, match="saut de ligne"):
+        engine.read_csv_tail(b"a,b,c", 0)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import reassurance_engine as engine
+
+PROGRAMME = dict(quota_share=0.2, surplus_retention=2e6, surplus_lines=4, risk_xl=([1e6, 3e6], [2e6, 7e6]),
+                 cat_xl=([2e7], [1e8]), retrocession=0.15)
+
+
+def _reference(losses, periods, sum_insured, is_cat, occurrence, n_periods, sl_priority, sl_limit):
+    """Cascade sinistre par sinistre (boucles Python)."""
+    after_xl = np.zeros(len(losses))
+    for i, (x, s, c) in enumerate(zip(losses, sum_insured, is_cat)):
+        v = x * 0.8
+        if s > 0:
+            v -= v * min(max(s - 2e6, 0.0), 8e6) / s
+        if not c:
+            v -= sum(min(max(v - p, 0.0), lim) for p, lim in [(1e6, 2e6), (3e6, 7e6)])
+        after_xl[i] = v
+    net = np.zeros(n_periods)
+    for i in range(len(losses)):
+        net[periods[i]] += after_xl[i]
+    events = {}
+    for i in np.flatnonzero(is_cat):
+        events.setdefault(occurrence[i], [periods[i], 0.0])[1] += after_xl[i]
+    for period, total in events.values():
+        net[period] -= min(max(total - 2e7, 0.0), 1e8)
+    net -= np.clip(net - sl_priority, 0.0, sl_limit)
+    return net * 0.85
+
+
+def test_waterfall_matches_loop_reference():
+    pf = engine.make_demo_loss_portfolio(300)
+    # Regroupe les pertes CAT deux à deux dans une même année pour tester le cumul par occurrence
+    occurrence = pf["occurrence"].copy()
+    cat_idx = np.flatnonzero(pf["is_cat"])
+    order = cat_idx[np.lexsort((cat_idx, pf["periods"][cat_idx]))]
+    same = pf["periods"][order[1:]] == pf["periods"][order[:-1]]
+    occurrence[order[1:][same]] = occurrence[order[:-1][same]]
+    gross = np.bincount(pf["periods"], weights=pf["losses"], minlength=300).mean()
+    res = engine.reinsurance_waterfall(pf["losses"], periods=pf["periods"], n_periods=300,
+                                       sum_insured=pf["sum_insured"], occurrence=occurrence,
+                                       is_cat=pf["is_cat"], stop_loss=(1.2 * gross, 0.5 * gross), **PROGRAMME)
+    ref = _reference(pf["losses"], pf["periods"], pf["sum_insured"], pf["is_cat"], occurrence, 300,
+                     1.2 * gross, 0.5 * gross)
+    np.testing.assert_allclose(res["net"], ref, rtol=1e-9)
+    annual = np.bincount(pf["periods"], weights=pf["losses"], minlength=300)
+    np.testing.assert_allclose(annual - res["ceded"].sum(axis=0), res["net"], rtol=1e-9)
+
+
+def test_per_risk_xl_ignores_cat_losses():
+    res = engine.reinsurance_waterfall([5e6, 5e6], periods=[0, 0], is_cat=[False, True],
+                                       risk_xl=(1e6, 1e7))
+    assert res["ceded"][3].sum() == pytest.approx(4e6)
+
+
+def test_occurrence_spanning_periods_is_rejected():
+    with pytest.raises(ValueError):
+        engine.reinsurance_waterfall([1e6, 2e6], periods=[0, 1], occurrence=[7, 7], cat_xl=(5e5, 1e7))
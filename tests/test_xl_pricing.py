@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+import reassurance_engine as engine
+
+
+def test_nan_reinstatements_are_unlimited():
+    losses, years = engine.simulate_individual_losses(2.0, 13.0, 1.0, 5_000)
+    # Colonne "Reconstitutions" mixte None / int : pandas la convertit en float avec NaN
+    reinst = pd.DataFrame({"r": [None, 1]})["r"].tolist()
+    res = engine.price_xl_layers(losses, years, 5_000, [5e5, 1e6], [5e5, 2e6], reinstatements=reinst,
+                                 rate_on_line=0.1)
+    assert np.isfinite(res[["expected_loss", "std_dev", "reinstatement_premium"]].to_numpy()).all()
+    unlimited = engine.price_xl_layers(losses, years, 5_000, [5e5], [5e5], reinstatements=[None])
+    assert res.loc[0, "expected_loss"] == unlimited.loc[0, "expected_loss"]